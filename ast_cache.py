@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+import zlib
+import lark
+from models import Chunk
+from parser import parse_ast, ParserMode
+
+def default_cache_dir() -> str:
+  base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+  return os.path.join(base, "typelua")
+
+cache_dir = default_cache_dir()
+max_cache_bytes = 64 * 2**20
+hits = 0
+misses = 0
+
+# Anything that changes the shape of the AST invalidates every entry.
+version_sources = ["grammar.lark", "parser.py", "models.py", "type_models.py"]
+checker_version: str | None = None
+
+def get_checker_version() -> str:
+  global checker_version
+  if checker_version is None:
+    digest = hashlib.sha256(lark.__version__.encode())
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name in version_sources:
+      with open(os.path.join(root, name), "rb") as f:
+        digest.update(f.read())
+    checker_version = digest.hexdigest()
+  return checker_version
+
+def cache_key(code: str, mode: ParserMode) -> str:
+  digest = hashlib.sha256(get_checker_version().encode())
+  digest.update(mode.encode())
+  digest.update(code.encode())
+  return digest.hexdigest()
+
+def entry_path(key: str) -> str:
+  return os.path.join(cache_dir, key[:2], key[2:] + ".ast")
+
+def load(key: str) -> Chunk | None:
+  try:
+    with open(entry_path(key), "rb") as f:
+      ast = pickle.loads(zlib.decompress(f.read()))
+    os.utime(entry_path(key))
+  except Exception:
+    # Unpickling a damaged or stale entry can fail in any number of ways;
+    # all of them are a miss.
+    return None
+  return ast if isinstance(ast, Chunk) else None
+
+def store(key: str, ast: Chunk) -> None:
+  try:
+    data = zlib.compress(pickle.dumps(ast, pickle.HIGHEST_PROTOCOL))
+  except RecursionError:
+    # Nesting too deep for pickle; such files are simply parsed every time.
+    return
+  path = entry_path(key)
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+      f.write(data)
+    os.replace(temp, path)
+  except OSError:
+    return
+  total = read_size() + len(data)
+  if total > max_cache_bytes:
+    evict()
+  else:
+    write_size(total)
+
+# The cache's total size is kept in a file next to the entries, so a store
+# only has to scan the cache once it has grown past `max_cache_bytes`. The
+# count is approximate (an entry written twice is counted twice, and
+# processes storing at once may lose each other's updates); every eviction
+# recounts it from the entries themselves.
+def size_path() -> str:
+  return os.path.join(cache_dir, "size")
+
+def read_size() -> int:
+  try:
+    with open(size_path()) as f:
+      return int(f.read())
+  except (OSError, ValueError):
+    return 0
+
+def write_size(total: int) -> None:
+  path = size_path()
+  temp = f"{path}.{os.getpid()}.tmp"
+  try:
+    with open(temp, "w") as f:
+      f.write(str(total))
+    os.replace(temp, path)
+  except OSError:
+    pass
+
+def entries() -> list[os.DirEntry[str]]:
+  found: list[os.DirEntry[str]] = []
+  try:
+    for bucket in os.scandir(cache_dir):
+      if bucket.is_dir():
+        found.extend(e for e in os.scandir(bucket.path) if e.name.endswith(".ast"))
+  except OSError:
+    pass
+  return found
+
+# Drops the least recently used entries until the cache fits in three
+# quarters of `max_cache_bytes`, so the next few stores don't scan it again;
+# a hit refreshes the entry's mtime. Another process may be evicting too, so
+# entries can vanish while they are looked at.
+def evict() -> None:
+  stats: list[tuple[float, int, str]] = []
+  for e in entries():
+    try:
+      stat = e.stat()
+    except OSError:
+      continue
+    stats.append((stat.st_mtime, stat.st_size, e.path))
+  total = sum(size for _, size, _ in stats)
+  for _, size, path in sorted(stats):
+    if total <= max_cache_bytes * 3 // 4:
+      break
+    try:
+      os.remove(path)
+    except OSError:
+      continue
+    total -= size
+  write_size(total)
+
+def parse_cached(code: str, mode: ParserMode = "lalr") -> Chunk:
+  global hits, misses
+  key = cache_key(code, mode)
+  ast = load(key)
+  if ast is not None:
+    hits += 1
+    return ast
+  misses += 1
+  ast = parse_ast(code, mode)
+  store(key, ast)
+  return ast
@@ -0,0 +1,39 @@
+import time
+
+import paths
+
+import type_models
+from parser import parse_ast, get_ast_parser
+from infer import infer, UnifyError
+from type_models import Context
+from type_render import Renderer
+
+# An array literal of `count` values, as generated data files contain, and
+# how each value is written.
+items = {
+  "numbers": lambda i: str(i),
+  "strings": lambda i: f"\"s{i}\"",
+  "records": lambda i: f"{{ id = {i}, name = \"n{i}\" }}",
+}
+
+def array_literal(count: int, item) -> str:
+  return "local data = {\n" + ",\n".join(item(i) for i in range(count)) + "\n}\nreturn data\n"
+
+def main() -> None:
+  get_ast_parser()
+  for count in (1000, 10000, 30000):
+    for name, item in items.items():
+      ast = parse_ast(array_literal(count, item))
+      for limit in (None, 64):
+        type_models.literal_limit = limit
+        start = time.perf_counter()
+        res = infer(ast, Context({}))
+        inferred = time.perf_counter() - start
+        assert not isinstance(res, UnifyError)
+        start = time.perf_counter()
+        Renderer().render(res[1])
+        rendered = time.perf_counter() - start
+        print(f"{count:6} {name:<8} limit {str(limit):>4}   infer {inferred * 1000:8.1f} ms   render {rendered * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import time
+
+import paths
+
+import ast_cache
+from parser import parse_ast, get_ast_parser
+from synthetic import module
+
+def best_of(fn, runs: int) -> float:
+  best = float("inf")
+  for _ in range(runs):
+    start = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def main() -> None:
+  get_ast_parser()
+  with tempfile.TemporaryDirectory() as cache_dir:
+    ast_cache.cache_dir = cache_dir
+    for n in [100, 1000, 5000]:
+      code = module(n)
+      ast_cache.parse_cached(code)
+      parse = best_of(lambda: parse_ast(code), 3)
+      hit = best_of(lambda: ast_cache.parse_cached(code), 3)
+      size = os.path.getsize(ast_cache.entry_path(ast_cache.cache_key(code, "lalr")))
+      print(f"{n:6} functions   parse {parse * 1000:8.1f} ms   cache hit {hit * 1000:8.1f} ms   ({parse / hit:.1f}x)   entry {size / 1024:7.1f} KiB   source {len(code) / 1024:7.1f} KiB")
+  print(f"hits {ast_cache.hits}, misses {ast_cache.misses}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,55 @@
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from typing import Any
+
+import paths
+
+from models import BaseNode, SourceMap
+from parser import parse_ast, get_ast_parser
+from synthetic import module
+
+# Plain, unslotted mirrors of the node classes, holding lists, private
+# copies of every string and a (file, line, column) object per node, the
+# way nodes were laid out before they were made compact.
+legacy_classes: dict[type, Any] = {}
+
+def legacy_class(cls: type) -> Any:
+  if cls not in legacy_classes:
+    legacy_classes[cls] = make_dataclass(cls.__name__, [(f.name, Any) for f in fields(cls)])
+  return legacy_classes[cls]
+
+def to_legacy(value: Any, source: SourceMap) -> Any:
+  if isinstance(value, BaseNode):
+    loc = source.location(value.location)
+    legacy_loc = legacy_class(type(loc))(loc.file, loc.line, loc.column)
+    rest = (to_legacy(getattr(value, f.name), source) for f in fields(value) if f.name != "location")
+    return legacy_class(type(value))(legacy_loc, *rest)
+  if isinstance(value, tuple) and any(isinstance(v, BaseNode) for v in value):
+    return [to_legacy(v, source) for v in value]
+  if isinstance(value, tuple) and all(isinstance(v, str) for v in value):
+    return [to_legacy(v, source) for v in value]
+  if isinstance(value, tuple):
+    return tuple(to_legacy(v, source) for v in value)
+  if isinstance(value, str):
+    return "".join(list(value))
+  return value
+
+def retained(build: Any) -> tuple[Any, int]:
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  value = build()
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return value, after - before
+
+def main() -> None:
+  get_ast_parser()
+  for n in [100, 1000, 5000]:
+    code = module(n)
+    compact, compact_size = retained(lambda: parse_ast(code))
+    source = SourceMap("bench.lua", code)
+    _, legacy_size = retained(lambda: to_legacy(compact, source))
+    print(f"{n:6} functions   legacy {legacy_size / 2**20:7.1f} MiB   compact {compact_size / 2**20:7.1f} MiB   ({legacy_size / compact_size:.2f}x)")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,27 @@
+import time
+
+import paths
+
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context
+
+# `count` if statements, each testing `width` variables joined with `and`.
+def conditions(width: int, count: int) -> str:
+  lines = [f"local v{i} = {i}" for i in range(width)]
+  cond = " and ".join(f"v{i} == {i}" for i in range(width))
+  lines += [f"if {cond} then\n  v0 = {i}\nend" for i in range(count)]
+  lines.append("return v0")
+  return "\n".join(lines) + "\n"
+
+def main() -> None:
+  get_ast_parser()
+  for width in (10, 40, 160):
+    ast = parse_ast(conditions(width, 50))
+    start = time.perf_counter()
+    infer(ast, Context({}))
+    elapsed = time.perf_counter() - start
+    print(f"{width:4} comparisons per condition   infer {elapsed * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+  main()
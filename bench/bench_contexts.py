@@ -0,0 +1,28 @@
+import time
+
+import paths
+
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context
+
+# A module with `count` top-level locals followed by `count` small functions,
+# each opening a few scopes (the function, its body and both branches).
+def large_module(count: int) -> str:
+  lines = [f"local v{i} = {i}" for i in range(count)]
+  for i in range(count):
+    lines.append(f"local function f{i}(b)\n  if b then\n    return v{i}\n  else\n    return v{count - 1 - i}\n  end\nend")
+  lines.append("return f0")
+  return "\n".join(lines) + "\n"
+
+def main() -> None:
+  get_ast_parser()
+  for count in (1000, 2000, 4000, 8000):
+    ast = parse_ast(large_module(count))
+    start = time.perf_counter()
+    infer(ast, Context({}))
+    elapsed = time.perf_counter() - start
+    print(f"{count:5} locals and functions   infer {elapsed * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+  main()
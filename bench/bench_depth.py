@@ -0,0 +1,31 @@
+import sys
+import time
+
+import paths
+
+from parser import parse_ast, get_ast_parser
+from infer import infer, UnifyError
+from type_models import Context
+
+shapes = {
+  "concat chain": lambda n: "local s = \"a\"" + " .. \"a\"" * n + "\nreturn #s\n",
+  "nested ifs": lambda n: "local x = 1\n" + "if x > 0 then\n" * n + "x = 2\n" + "end\n" * n + "return x\n",
+  "nested tables": lambda n: "local t = " + "{ 1, " * n + "\"leaf\"" + " }" * n + "\nreturn t[1]\n",
+}
+
+def main() -> None:
+  get_ast_parser()
+  print(f"recursion limit {sys.getrecursionlimit()}")
+  for label, make in shapes.items():
+    for n in [250, 1000, 4000, 16000]:
+      code = make(n)
+      start = time.perf_counter()
+      ast = parse_ast(code)
+      parsed = time.perf_counter()
+      res = infer(ast, Context({}))
+      checked = time.perf_counter()
+      assert not isinstance(res, UnifyError), res.message
+      print(f"{label:<14} depth {n:6}   parse {(parsed - start) * 1000:8.1f} ms   infer {(checked - parsed) * 1000:8.1f} ms   ({(checked - start) / n * 1e6:6.1f} us/level)")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,37 @@
+import time
+
+import paths
+
+import type_helpers
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context
+from synthetic import checked_module
+
+# One function whose body makes `count` calls, each binding fresh variables
+# that accumulate in the body's substitution.
+def long_function(count: int) -> str:
+  lines = ["local function id(v)", "  return v", "end", "local function f(p)", "  local x = p"]
+  lines += [f"  x = id({i})" for i in range(count)]
+  lines += ["  return x", "end", "return f"]
+  return "\n".join(lines) + "\n"
+
+def measure(label: str, code: str) -> None:
+  ast = parse_ast(code)
+  times = []
+  for engine in ("dict", "union-find"):
+    type_helpers.engine = engine
+    start = time.perf_counter()
+    infer(ast, Context({}))
+    times.append((time.perf_counter() - start) * 1000)
+  print(f"{label:<22} dict {times[0]:9.1f} ms   union-find {times[1]:9.1f} ms")
+
+def main() -> None:
+  get_ast_parser()
+  for count in (500, 1000, 2000, 4000):
+    measure(f"long_function({count})", long_function(count))
+  for count in (100, 300):
+    measure(f"checked_module({count})", checked_module(count))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,38 @@
+import time
+
+import paths
+
+import type_helpers
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context
+from synthetic import checked_module
+from test_parser_modes import collect_programs
+
+def wide_table(n: int) -> str:
+  fields = ", ".join(f"f{i} = {i}" for i in range(n))
+  lines = [f"local t = {{ {fields} }}"]
+  lines += [f"local v{i} = t.f{i}" for i in range(n)]
+  lines.append("return t")
+  return "\n".join(lines) + "\n"
+
+def measure(label: str, programs: list[str]) -> None:
+  asts = [parse_ast(code) for code in programs]
+  for counts in (type_helpers.skipped_rebuilds, type_helpers.rebuilds):
+    for name in counts:
+      counts[name] = 0
+  start = time.perf_counter()
+  for ast in asts:
+    infer(ast, Context({}))
+  elapsed = time.perf_counter() - start
+  counts = "   ".join(f"{name} {type_helpers.skipped_rebuilds[name]}/{type_helpers.skipped_rebuilds[name] + type_helpers.rebuilds[name]} skipped" for name in type_helpers.rebuilds)
+  print(f"{label:<22} infer {elapsed * 1000:9.1f} ms   {counts}")
+
+def main() -> None:
+  get_ast_parser()
+  measure("test programs", collect_programs())
+  measure("checked_module(300)", [checked_module(300)])
+  measure("wide table (300)", [wide_table(300)])
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,37 @@
+import time
+
+import paths
+
+import type_models
+from parser import parse_ast, get_ast_parser
+from infer import infer, UnifyError
+from type_models import Context
+from type_render import Renderer
+
+# A lookup table of `count` string constants under one dynamic key, plus an
+# array of the same constants.
+def constant_tables(count: int) -> str:
+  lines = ["local key = tostring(0)", "local names = {"]
+  lines += [f"  [key] = \"c{i}\"," for i in range(count)]
+  lines += ["}", "local list = {"]
+  lines += [f"  \"c{i}\"," for i in range(count)]
+  lines += ["}", "return names, list"]
+  return "\n".join(lines) + "\n"
+
+def main() -> None:
+  get_ast_parser()
+  for count in (500, 2000, 5000):
+    ast = parse_ast(constant_tables(count))
+    for limit in (None, 64):
+      type_models.literal_limit = limit
+      start = time.perf_counter()
+      res = infer(ast, Context({}))
+      inferred = time.perf_counter() - start
+      assert not isinstance(res, UnifyError)
+      start = time.perf_counter()
+      Renderer().render(res[1])
+      rendered = time.perf_counter() - start
+      print(f"{count:5} constants   limit {str(limit):>4}   infer {inferred * 1000:9.1f} ms   render {rendered * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+  main()
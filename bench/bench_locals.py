@@ -0,0 +1,26 @@
+import time
+
+import paths
+
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context
+
+# `count` sequential locals, each holding a function so that its type has
+# variables to generalize.
+def sequential_locals(count: int) -> str:
+  lines = [f"local f{i} = function(a, b)\n  return a, b, {i}\nend" for i in range(count)]
+  lines.append("return f0")
+  return "\n".join(lines) + "\n"
+
+def main() -> None:
+  get_ast_parser()
+  for count in (1000, 2000, 4000, 8000):
+    ast = parse_ast(sequential_locals(count))
+    start = time.perf_counter()
+    infer(ast, Context({}))
+    elapsed = time.perf_counter() - start
+    print(f"{count:5} locals   infer {elapsed * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,65 @@
+import time
+
+import paths
+
+import type_helpers
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context, TableType, TypeConstructor, StringType, NumberType, NilType, union_of
+from type_helpers import subtract
+from type_render import Renderer
+from bench_conditions import conditions
+
+# A union of `width` string literals, narrowed by `count` comparisons.
+def states(count: int, width: int) -> str:
+  lines = ["local function pick(c)", "  local s = \"s0\""]
+  lines += [f"  if c == {i} then\n    s = \"s{i}\"\n  end" for i in range(1, width)]
+  lines += ["  return s", "end", "local state = pick(1)", "local count = 0"]
+  lines += [f"if state == \"s{i % width}\" then\n  count = count + {i}\nelse\n  count = count - 1\nend" for i in range(count)]
+  lines.append("return state, count")
+  return "\n".join(lines) + "\n"
+
+def measure(label: str, code: str) -> None:
+  ast = parse_ast(code)
+  results = []
+  for enabled in (False, True):
+    type_helpers.memo_enabled = enabled
+    times = []
+    for _ in range(5):
+      type_helpers.unify_memo.clear()
+      type_helpers.intersect_memo.clear()
+      type_helpers.memo_stats.update(hits=0, misses=0)
+      start = time.perf_counter()
+      res = infer(ast, Context({}))
+      assert isinstance(res, tuple)
+      Renderer().render(res[1])
+      times.append((time.perf_counter() - start) * 1000)
+    results.append(min(times))
+  stats = type_helpers.memo_stats
+  print(f"{label:<16} off {results[0]:8.1f} ms   on {results[1]:8.1f} ms   {stats['hits']} hits, {stats['misses']} misses")
+
+# Narrows and renders a union of `count` record types, which compares the
+# records with each other and with the probe again on every pass.
+def tagged_union(count: int, passes: int) -> None:
+  def field(name: str) -> TypeConstructor:
+    return TypeConstructor("string", [], name)
+  union = union_of(*(TableType([(field("kind"), field(f"k{i}")), (field("size"), NumberType)]) for i in range(count)), NilType)
+  probe = TableType([(field("kind"), StringType), (field("size"), NumberType)])
+  for enabled in (False, True):
+    type_helpers.memo_enabled = enabled
+    start = time.perf_counter()
+    for _ in range(passes):
+      subtract(union, probe)
+      subtract(union, NilType)
+      Renderer().render(union)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"tagged_union({count}) x{passes} {'on ' if enabled else 'off'} {elapsed:8.1f} ms")
+
+def main() -> None:
+  get_ast_parser()
+  measure("states(400, 30)", states(400, 30))
+  measure("conditions(40)", conditions(40, 50))
+  tagged_union(60, 200)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,37 @@
+import time
+
+import paths
+
+import type_helpers
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context
+
+# `count` records of a few different shapes compared with each other and
+# with a union of literals. Most of these comparisons fail to unify, and
+# the reasons are thrown away.
+def comparisons(count: int) -> str:
+  lines = ["local mode = \"a\"", "if mode == \"b\" then\n  mode = \"c\"\nend"]
+  for i in range(count):
+    extra = ", ".join(f"f{j} = {{ x = {j}, y = \"{j}\" }}" for j in range(i % 5 * 6))
+    lines.append(f"local r{i} = {{ id = {i}, name = \"r{i}\", tags = {{ \"a\", \"b\" }}{', ' + extra if extra else ''} }}")
+    if i:
+      lines.append(f"local same{i} = r{i} == r{i - 1}")
+    lines.append(f"local is{i} = mode == r{i}")
+  lines.append("return mode")
+  return "\n".join(lines) + "\n"
+
+def main() -> None:
+  get_ast_parser()
+  type_helpers.memo_enabled = False
+  for count in (250, 500, 1000):
+    ast = parse_ast(comparisons(count))
+    times = []
+    for _ in range(3):
+      start = time.perf_counter()
+      infer(ast, Context({}))
+      times.append((time.perf_counter() - start) * 1000)
+    print(f"comparisons({count:4})   infer {min(times):9.1f} ms")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,36 @@
+import time
+import tracemalloc
+
+import paths
+
+from parser import get_parser, get_ast_parser, parse_ast, ToAST
+from synthetic import module
+
+def tree_then_transform(code: str) -> object:
+  return ToAST().transform(get_parser("lalr").parse(code))
+
+def inline(code: str) -> object:
+  return parse_ast(code)
+
+def measure(fn, code: str) -> tuple[float, int]:
+  start = time.perf_counter()
+  fn(code)
+  elapsed = time.perf_counter() - start
+  tracemalloc.start()
+  fn(code)
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return elapsed, peak
+
+def main() -> None:
+  get_parser("lalr")
+  get_ast_parser()
+  for n in [100, 1000, 5000]:
+    code = module(n)
+    assert tree_then_transform(code) == inline(code)
+    tree_t, tree_m = measure(tree_then_transform, code)
+    inline_t, inline_m = measure(inline, code)
+    print(f"{len(code) / 1024:8.0f} KiB   tree+ToAST {tree_t:6.2f} s {tree_m / 2**20:7.1f} MiB   inline {inline_t:6.2f} s {inline_m / 2**20:7.1f} MiB")
+
+if __name__ == "__main__":
+  main()
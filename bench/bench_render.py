@@ -0,0 +1,45 @@
+import io
+import time
+import tracemalloc
+
+import paths
+
+from type_models import TypeConstructor, TableType, NumberType, union_of
+from type_render import Renderer
+
+def lit(value: str) -> TypeConstructor:
+  return TypeConstructor("string", [], value)
+
+# Every level refers to the previous one twice, so the rendered text doubles
+# per level while the number of distinct types grows by one.
+def shared(depth: int) -> TableType:
+  table = TableType([(lit("x"), NumberType)])
+  for _ in range(depth):
+    table = TableType([(lit("a"), table), (lit("b"), table)])
+  return table
+
+def wide(n: int) -> TableType:
+  return TableType([(lit(f"f{i}"), union_of(lit(f"v{i}"), lit(f"w{i}"), NumberType)) for i in range(n)])
+
+def measure(label: str, run) -> None:
+  start = time.perf_counter()
+  run()
+  elapsed = time.perf_counter() - start
+  tracemalloc.start()
+  run()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  print(f"{label:<40} {elapsed * 1000:9.1f} ms   peak {peak / 2**20:8.2f} MiB")
+
+def main() -> None:
+  for depth in (12, 16, 18):
+    type = shared(depth)
+    measure(f"shared({depth}) render", lambda: Renderer().render(type))
+    measure(f"shared({depth}) write", lambda: Renderer().write(type, io.StringIO()))
+    measure(f"shared({depth}) write, max_length 10000", lambda: Renderer(max_length=10000).write(type, io.StringIO()))
+  type = wide(5000)
+  measure("wide(5000) render", lambda: Renderer().render(type))
+  measure("wide(5000) write, max_width 50", lambda: Renderer(max_width=50).write(type, io.StringIO()))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from paths import root
+
+def time_run(argv: list[str], runs: int) -> float:
+  best = float("inf")
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(argv, cwd=root, check=True, capture_output=True)
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def main() -> None:
+  from parser import grammar_cache_path
+  runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  with tempfile.NamedTemporaryFile("w", suffix=".lua", delete=False) as f:
+    f.write("local x = 1\nreturn x\n")
+  commands = {
+    "build parser": [sys.executable, "-c", "import parser; parser.get_ast_parser()"],
+    "main.py tiny.lua": [sys.executable, "main.py", f.name],
+  }
+  try:
+    for label, argv in commands.items():
+      cold = float("inf")
+      for _ in range(runs):
+        if os.path.exists(grammar_cache_path):
+          os.remove(grammar_cache_path)
+        cold = min(cold, time_run(argv, 1))
+      warm = time_run(argv, runs)
+      print(f"{label:<18} cold {cold * 1000:8.1f} ms   warm {warm * 1000:8.1f} ms   ({cold / warm:.1f}x)")
+  finally:
+    os.remove(f.name)
+
+if __name__ == "__main__":
+  main()
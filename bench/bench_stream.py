@@ -0,0 +1,52 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+import paths
+
+from parser import parse_ast, get_ast_parser
+from stream import parse_stream
+
+def data_module(n: int) -> str:
+  return "".join(f"local r{i} = {{ id = {i}, name = \"record {i}\", tags = {{ \"a\", \"b\" }}, score = {i % 97} * 2 }}\n" for i in range(n))
+
+# The same records as the fields of a table the module returns.
+def returned_module(n: int) -> str:
+  return "return {\n" + "".join(f"  {{ id = {i}, name = \"record {i}\", tags = {{ \"a\", \"b\" }}, score = {i % 97} * 2 }},\n" for i in range(n)) + "}\n"
+
+def full(path: str) -> int:
+  with open(path) as f:
+    return len(parse_ast(f.read()).stmts)
+
+def streamed(path: str) -> int:
+  with open(path) as f:
+    chunk = parse_stream(f, path)
+    count = sum(1 for _ in chunk.stmts)
+    return count + (len(chunk.last.exprs) if chunk.last else 0)
+
+def peak(fn, path: str) -> tuple[float, int]:
+  tracemalloc.start()
+  start = time.perf_counter()
+  fn(path)
+  elapsed = time.perf_counter() - start
+  _, peak_size = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return elapsed, peak_size
+
+# Parsing only: inference keeps one binding per record either way.
+def main() -> None:
+  get_ast_parser()
+  for module, n in [(m, n) for n in [2000, 20000, 60000] for m in (data_module, returned_module)]:
+    with tempfile.NamedTemporaryFile("w", suffix=".lua", delete=False) as f:
+      f.write(module(n))
+    try:
+      size = os.path.getsize(f.name)
+      full_time, full_peak = peak(full, f.name)
+      stream_time, stream_peak = peak(streamed, f.name)
+      print(f"{module.__name__:<16} {size / 2**20:6.1f} MiB   full {full_time:6.2f} s {full_peak / 2**20:8.1f} MiB peak   stream {stream_time:6.2f} s {stream_peak / 2**20:6.1f} MiB peak")
+    finally:
+      os.remove(f.name)
+
+if __name__ == "__main__":
+  main()
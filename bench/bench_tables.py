@@ -0,0 +1,28 @@
+import time
+
+import paths
+
+from type_models import TypeConstructor, TableType, StringType, NumberType
+from type_helpers import Mismatch, unify, smart_union, intersect, new_type_var
+
+def timed(run) -> float:
+  start = time.perf_counter()
+  run()
+  return (time.perf_counter() - start) * 1000
+
+def lookups(keys: list[TypeConstructor], table: TableType) -> None:
+  for key in keys:
+    assert not isinstance(unify(TableType([(key, new_type_var())]), table), Mismatch)
+
+def main() -> None:
+  for n in (100, 300, 1000):
+    keys = [TypeConstructor("string", [], f"f{i}") for i in range(n)]
+    table = TableType([(k, NumberType) for k in keys] + [(NumberType, StringType)])
+    other = TableType([(k, StringType) for k in reversed(keys)])
+    access = timed(lambda: lookups(keys, table))
+    merge = timed(lambda: smart_union(table, other))
+    meet = timed(lambda: intersect(table, other))
+    print(f"{n:5} fields   {n} accesses {access:9.1f} ms   smart_union {merge:9.1f} ms   intersect {meet:9.1f} ms")
+
+if __name__ == "__main__":
+  main()
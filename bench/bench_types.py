@@ -0,0 +1,63 @@
+import time
+import tracemalloc
+from typing import Any
+
+import paths
+
+from parser import parse_ast, get_ast_parser
+from infer import infer
+from type_models import Context, TypeVariable, TypeConstructor, TableType, UnionType, ForallType
+from synthetic import checked_module
+from test_parser_modes import collect_programs
+
+type_classes = (TypeVariable, TypeConstructor, TableType, UnionType, ForallType)
+
+# Counts the distinct type objects that come out of constructor calls, so
+# interned lookups that hand back an existing object are not counted.
+def count_allocations(run: Any) -> tuple[int, int]:
+  seen: dict[int, Any] = {}
+  calls = 0
+  originals = {cls: cls.__dict__.get("__init__") for cls in type_classes}
+  def wrap(original: Any) -> Any:
+    def init(self: Any, *args: Any, **kwargs: Any) -> None:
+      nonlocal calls
+      calls += 1
+      seen[id(self)] = self
+      if original is not None:
+        original(self, *args, **kwargs)
+    return init
+  for cls, original in originals.items():
+    cls.__init__ = wrap(original)  # type: ignore[misc]
+  try:
+    run()
+  finally:
+    for cls, original in originals.items():
+      if original is None:
+        del cls.__init__  # type: ignore[misc]
+      else:
+        cls.__init__ = original  # type: ignore[misc]
+  return calls, len(seen)
+
+def check_all(asts: list[Any]) -> None:
+  for ast in asts:
+    infer(ast, Context({}))
+
+def measure(label: str, programs: list[str]) -> None:
+  asts = [parse_ast(code) for code in programs]
+  start = time.perf_counter()
+  check_all(asts)
+  elapsed = time.perf_counter() - start
+  tracemalloc.start()
+  check_all(asts)
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  calls, objects = count_allocations(lambda: check_all(asts))
+  print(f"{label:<22} infer {elapsed * 1000:9.1f} ms   peak {peak / 2**20:7.2f} MiB   type constructions {calls:9}   new type objects {objects:9}")
+
+def main() -> None:
+  get_ast_parser()
+  measure("test programs", collect_programs())
+  measure("checked_module(300)", [checked_module(300)])
+
+if __name__ == "__main__":
+  main()
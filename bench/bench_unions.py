@@ -0,0 +1,25 @@
+import time
+
+import paths
+
+from type_models import TypeConstructor, StringType, NumberType, NilType, union_of
+from type_helpers import unify, subtract, intersect
+
+def timed(run) -> float:
+  start = time.perf_counter()
+  run()
+  return (time.perf_counter() - start) * 1000
+
+def main() -> None:
+  for n in (10, 100, 1000, 5000):
+    literals = [TypeConstructor("string", [], f"key{i}") for i in range(n)]
+    build = timed(lambda: union_of(*literals, NumberType, NilType))
+    union = union_of(*literals, NumberType, NilType)
+    render = timed(lambda: repr(union))
+    narrow = timed(lambda: subtract(union, StringType))
+    lookup = timed(lambda: intersect(NumberType, union))
+    check = timed(lambda: unify(literals[-1], union))
+    print(f"{n:5} literals   build {build:8.2f} ms   render {render:8.2f} ms   subtract {narrow:8.2f} ms   intersect {lookup:8.2f} ms   unify {check:8.2f} ms")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,111 @@
+import time
+
+import paths
+
+from parser import parse_ast, get_ast_parser
+from infer import infer, global_ctx, UnifyError
+from constraints import infer_constraints
+from type_models import Bindings, Context
+import type_render
+from type_render import Renderer
+from test_parser_modes import collect_programs
+from synthetic import checked_module
+from bench_engines import long_function
+
+# Runs the eager engine (`infer`) and the constraint engine on every program
+# in the test suite, plus a few generated modules, and prints how long each
+# took and every program on which their results differ.
+
+engines = {"eager": infer, "constraints": infer_constraints}
+
+# Conditions and annotations on parameters, whose types are still unknown
+# where they are checked.
+parameter_programs = [
+  """
+    local function f(x)
+      if x == nil then
+        return 1
+      end
+      return x
+    end
+    return f(5)
+  """,
+  """
+    local function f(a, b)
+      if a then
+        return a
+      else
+        return b
+      end
+    end
+    return f
+  """,
+  """
+    local function f(x)
+      if type(x) == "number" then
+        return x + 1
+      end
+      return 0
+    end
+    return f
+  """,
+  """
+    local function f(x)
+      --@type number
+      local y = x
+      return x + 1
+    end
+    return f
+  """,
+]
+repeats = 5
+
+# Error messages name type variables through the shared renderer, which
+# letters them in the order it first sees them, so each outcome gets a
+# fresh one.
+def outcome(res: object) -> str:
+  type_render.reset_renderer()
+  if isinstance(res, UnifyError):
+    return f"error at {res.location}: {res.message}"
+  assert isinstance(res, tuple)
+  return Renderer().render(res[1])
+
+# Global assignments are written into the stdlib context, so each run starts
+# from a copy of it as it was before the first one.
+def run(engine: str, code: str, stdlib: dict) -> tuple[str, float]:
+  ast = parse_ast(code)
+  best = float("inf")
+  for _ in range(repeats):
+    global_ctx.mapping = Bindings(dict(stdlib))
+    start = time.perf_counter()
+    res = engines[engine](ast, Context({}))
+    best = min(best, time.perf_counter() - start)
+  return outcome(res), best
+
+def main() -> None:
+  get_ast_parser()
+  stdlib = dict(global_ctx.mapping.own)
+  programs = [(f"test program {i}", code) for i, code in enumerate(collect_programs())]
+  programs += [(f"parameter program {i}", code) for i, code in enumerate(parameter_programs)]
+  programs += [(f"checked_module({count})", checked_module(count)) for count in (50, 200)]
+  programs += [(f"long_function({count})", long_function(count)) for count in (500, 2000)]
+  totals = dict.fromkeys(engines, 0.0)
+  differences = 0
+  for label, code in programs:
+    results = {engine: run(engine, code, stdlib) for engine in engines}
+    for engine, (_, elapsed) in results.items():
+      totals[engine] += elapsed
+    if results["eager"][0] != results["constraints"][0]:
+      differences += 1
+      print(f"{label} differs:")
+      print("  " + "\n  ".join(code.strip().splitlines()))
+      for engine, (text, _) in results.items():
+        print(f"  {engine:>11}: {text}")
+    elif label.startswith(("checked_module", "long_function")):
+      print(f"{label:<22} eager {results['eager'][1] * 1000:8.1f} ms   constraints {results['constraints'][1] * 1000:8.1f} ms")
+  global_ctx.mapping = Bindings(stdlib)
+  print(f"{len(programs)} programs, {differences} differ")
+  print(f"total   eager {totals['eager'] * 1000:8.1f} ms   constraints {totals['constraints'] * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The benchmarks run as scripts (`python bench/bench_parse.py`) and import
+# the checker's modules, and a few the test programs, straight from the
+# repository. Importing this module first puts both on the path.
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "test"))
+sys.path.insert(0, root)
@@ -0,0 +1,31 @@
+def module(n: int) -> str:
+  parts: list[str] = []
+  for i in range(n):
+    parts.append(f"""local function f{i}(a, b)
+  local x = a + b * {i}
+  if x > 10 then
+    return x
+  end
+  return x - 1
+end
+local t{i} = {{ name = "item{i}", value = f{i}(1, 2), tags = {{ "a", "b" }} }}
+t{i}.value = f{i}(t{i}.value, {i})
+""")
+  parts.append("return t0\n")
+  return "".join(parts)
+
+def checked_module(n: int) -> str:
+  parts: list[str] = []
+  for i in range(n):
+    parts.append(f"""local function f{i}(a, b)
+  if a > b then
+    return a - b
+  end
+  return a + b
+end
+local v{i} = f{i}(1, 2)
+local t{i} = {{ name = "x{i}", value = v{i}, tags = {{ "a", "b" }} }}
+t{i}.value = v{i} * 2
+""")
+  parts.append("return t0\n")
+  return "".join(parts)
@@ -0,0 +1,176 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from models import *
+from type_models import *
+from type_helpers import *
+from infer import ConditionScope, Rules, UnifyError, UnifyResult, infer_steps
+
+# Inference in two phases, with the typing rules of `infer_steps`. Walking
+# the tree, each rule is appended to one flat list instead of being run, and
+# the walk goes on with a fresh variable for the type it would have returned.
+# The Solver works through that list in program order with one substitution
+# for the whole program, only where a type is about to be generalized (a
+# local bound to a function, say) or its shape is needed to go on, and at
+# the end of the chunk.
+
+# A rule of `infer_steps` and its arguments; `out` stands for the type it
+# returns, if it returns one.
+@dataclass
+class Constraint:
+  rule: Callable[..., Any]
+  args: tuple[Any, ...]
+  out: Optional[TypeVariable]
+
+# Rules whose types are all known already give the same result whenever
+# they run; those are run as soon as they are reached.
+def all_ground(args: tuple[Any, ...]) -> bool:
+  for arg in args:
+    if isinstance(arg, Interned):
+      if not arg.ground:
+        return False
+    elif isinstance(arg, list):
+      if not all(a.ground for a in arg if isinstance(a, Interned)):
+        return False
+  return True
+
+# The first `solved` constraints have been applied to `subst`. `outer` holds
+# the substitutions from before the conditions being solved.
+class Solver:
+  constraints: list[Constraint]
+  solved: int
+  subst: Substitution
+  outer: list[Substitution]
+  def __init__(self) -> None:
+    self.constraints = []
+    self.solved = 0
+    self.subst = Substitution({})
+    self.outer = []
+
+  # Most types handed to the solver are fresh and mention no solved
+  # variable, which is cheaper to find out than rebuilding them.
+  def resolve(self, type: MonoType) -> MonoType:
+    stack: list[PolyType] = [type]
+    while stack:
+      part = stack.pop()
+      if part.ground:
+        continue
+      if isinstance(part, TypeVariable):
+        if self.subst.find(part) is not part:
+          return self.subst.apply_mono(type)
+      else:
+        stack.extend(type_children(part))
+    return type
+
+  # `type` with everything emitted so far solved.
+  def current(self, type: MonoType) -> 'MonoType | UnifyError':
+    if type.ground:
+      return type
+    error = self.solve()
+    if error is not None:
+      return error
+    return self.resolve(type)
+
+  def bind(self, s: Substitution) -> None:
+    if not s.is_empty():
+      self.subst = s.apply_subst(self.subst)
+
+  def solve(self) -> Optional[UnifyError]:
+    while self.solved < len(self.constraints):
+      constraint = self.constraints[self.solved]
+      self.solved += 1
+      if (error := self.step(constraint)) is not None:
+        return error
+    return None
+
+  def step(self, constraint: Constraint) -> Optional[UnifyError]:
+    args = [self.resolve_arg(arg) for arg in constraint.args]
+    res = constraint.rule(*args)
+    if res is None:
+      return None
+    if isinstance(res, UnifyError):
+      return res
+    if not isinstance(res, tuple):
+      self.bind(res)
+      return None
+    s, type = res
+    self.bind(s)
+    out = constraint.out
+    assert out is not None
+    if out.level is not None:
+      lower_levels(type, out.level)
+    self.bind(Substitution({out.name: type}))
+    return None
+
+  def resolve_arg(self, arg: Any) -> Any:
+    if isinstance(arg, Interned):
+      return self.resolve(arg)
+    if isinstance(arg, list):
+      return [self.resolve(a) if isinstance(a, Interned) else a for a in arg]
+    return arg
+
+  # What the condition of an `if` implies is solved on its own, and the
+  # substitution from before it is put back.
+  def enter_scope(self) -> None:
+    self.outer.append(self.subst)
+
+  def exit_scope(self, scope: ConditionScope) -> None:
+    scope.subst, self.subst = self.subst, self.outer.pop()
+
+class DeferredRules(Rules):
+  solver: Solver
+  def __init__(self, solver: Solver) -> None:
+    self.solver = solver
+
+  def rule(self, fn: Callable[..., UnifyResult], *args: Any) -> UnifyResult:
+    # A rule run early may only bind variables of its own, which its type
+    # no longer mentions.
+    if all_ground(args) and not isinstance(res := fn(*args), UnifyError):
+      return Substitution({}), res[1]
+    out = new_type_var()
+    self.solver.constraints.append(Constraint(fn, args, out))
+    return Substitution({}), out
+
+  def check(self, fn: Callable[..., 'Substitution | UnifyError'], *args: Any) -> 'Substitution | UnifyError':
+    if not all_ground(args) or isinstance(fn(*args), UnifyError):
+      self.solver.constraints.append(Constraint(fn, args, None))
+    return Substitution({})
+
+  # As with ML's value restriction, only functions and variables are
+  # generalized, so the only values that need solving before they are bound
+  # are functions, whose parameters are constrained by their bodies. The
+  # rest are bound as they are, to be solved later.
+  def generalize(self, value: Optional[Expr], type: MonoType, ctx: Context) -> 'PolyType | UnifyError':
+    if not isinstance(value, (FuncExpr, Var)):
+      return type
+    type = self.solver.resolve(type)
+    for name in free_vars_of_type(type):
+      if (level := TypeVariable(name).level) is None or level > ctx.level:
+        resolved = self.solver.current(type)
+        if isinstance(resolved, UnifyError): return resolved
+        return generalize(resolved, ctx)
+    return type
+
+  def current(self, type: MonoType) -> 'MonoType | UnifyError':
+    return self.solver.current(type)
+
+  def open_scope(self) -> ConditionScope:
+    self.solver.constraints.append(Constraint(self.solver.enter_scope, (), None))
+    return ConditionScope(Substitution({}))
+
+  def close_scope(self, scope: ConditionScope, s: Substitution) -> None:
+    self.solver.constraints.append(Constraint(self.solver.exit_scope, (scope,), None))
+
+def infer_constraints(node: BaseNode, ctx: Context) -> UnifyResult:
+  solver = Solver()
+  rules = DeferredRules(solver)
+  res = trampoline(infer_steps(node, ctx, rules), lambda node, ctx: infer_steps(node, ctx, rules))
+  # Constraints emitted before a failing node come first in the program.
+  error = solver.solve()
+  if error is not None:
+    return error
+  if isinstance(res, UnifyError):
+    return res
+  node_s, type = res
+  s = solver.subst
+  s.is_returning = node_s.is_returning
+  return s, solver.resolve(type)
@@ -0,0 +1,184 @@
+from dataclasses import dataclass, fields
+from functools import cache
+from typing import Any, Iterable, Optional, TypeVar
+from lark import Token
+from lark.exceptions import UnexpectedInput
+from models import *
+from parser import get_ast_parser, parse_ast
+
+@dataclass
+class TextEdit:
+  start: int
+  end: int
+  text: str
+
+BLOCK_OPEN = {"(", "[", "{", "function", "if"}
+BLOCK_CLOSE = {")", "]", "}", "end"}
+BINARY_OPS = {"+", "-", "..", "*", "/", "%", "^", "==", "~=", "<", ">", "<=", ">=", "and", "or"}
+PRIMARY_END_TYPES = {"NAME", "RPAR", "RSQB"}
+VALUE_END_TYPES = {"NUMBER", "STRING", "BOOLEAN", "NIL", "ELLIPSIS", "RBRACE"}
+ANNOTATION_TYPES = {"TYPE_ANNOTATION", "_REVEAL_ANNOTATION"}
+
+# What may follow the last token of a complete top-level statement and still
+# belong to it. Anything else at block depth 0 starts the next statement,
+# which mirrors how the LALR grammar splits `stmt*`.
+PRIMARY_CONTINUATIONS = BINARY_OPS | {"(", "[", ".", ",", "="}
+VALUE_CONTINUATIONS = BINARY_OPS | {","}
+END_CONTINUATIONS = {","}
+
+def continuations_after(token: Token, depth: int) -> set[str] | None:
+  if token.type in PRIMARY_END_TYPES:
+    return PRIMARY_CONTINUATIONS
+  if token.type in VALUE_END_TYPES:
+    return VALUE_CONTINUATIONS
+  if token.value == "end" and depth == 0:
+    return END_CONTINUATIONS
+  return None
+
+# Splits a token stream into top-level statements as it is fed, so a file
+# read in blocks is scanned once. `start` is where the statement being read
+# began; `step` returns the span of the one before it once a token shows it
+# is complete.
+class StatementScanner:
+  depth: int
+  start: int | None
+  end: int
+  allowed: set[str] | None
+  in_type_annotation: bool
+  def __init__(self) -> None:
+    self.depth = 0
+    self.start = None
+    self.end = 0
+    self.allowed = None
+    self.in_type_annotation = False
+
+  # `offset` is where the text the token was lexed from starts.
+  def step(self, token: Token, offset: int = 0) -> tuple[int, int] | None:
+    assert token.start_pos is not None and token.end_pos is not None
+    completed = None
+    if self.depth == 0:
+      boundary = self.start is None \
+        or token.type in ANNOTATION_TYPES \
+        or (self.allowed is not None and token.value not in self.allowed and not (self.in_type_annotation and token.value == "local"))
+      if boundary:
+        if self.start is not None:
+          completed = (self.start, self.end)
+        self.start = offset + token.start_pos
+      if token.value == "local":
+        self.in_type_annotation = False
+      elif token.type == "TYPE_ANNOTATION":
+        self.in_type_annotation = True
+    if token.value in BLOCK_OPEN:
+      self.depth += 1
+    elif token.value in BLOCK_CLOSE:
+      self.depth -= 1
+    self.end = offset + token.end_pos
+    self.allowed = continuations_after(token, self.depth)
+    return completed
+
+  def finish(self) -> tuple[int, int] | None:
+    return (self.start, self.end) if self.start is not None else None
+
+def scan_statements(tokens: Iterable[Token]) -> list[tuple[int, int]]:
+  scanner = StatementScanner()
+  spans: list[tuple[int, int]] = []
+  for token in tokens:
+    if (span := scanner.step(token)) is not None:
+      spans.append(span)
+  if (span := scanner.finish()) is not None:
+    spans.append(span)
+  return spans
+
+def statement_spans(code: str) -> list[tuple[int, int]] | None:
+  try:
+    return scan_statements(get_ast_parser().lex(code))
+  except UnexpectedInput:
+    return None
+
+N = TypeVar("N", bound=BaseNode)
+
+# The fields of each node class after `location`, in constructor order.
+@cache
+def child_fields(cls: type) -> tuple[str, ...]:
+  return tuple(f.name for f in fields(cls))[1:]
+
+# Returns a copy of `node` moved `shift` characters along. Nodes are shared
+# between a chunk and the ones reparsed from it, so none is changed in place;
+# the copy is built bottom-up, and a lazy body is only shifted once it loads.
+def shift_locations(node: N, shift: int) -> N:
+  stack: list[tuple[Any, int]] = [(node, -1)]
+  results: list[Any] = []
+  while stack:
+    value, count = stack.pop()
+    if count >= 0:
+      if count:
+        args = results[len(results) - count:]
+        del results[len(results) - count:]
+      else:
+        args = []
+      if isinstance(value, BaseNode):
+        results.append(type(value)(value.location + shift, *args))
+      else:
+        results.append(type(value)(args))
+    elif isinstance(value, LazyChunk):
+      results.append(shifted_body(value, shift))
+    elif isinstance(value, (BaseNode, list, tuple)):
+      below = [getattr(value, name) for name in child_fields(type(value))] if isinstance(value, BaseNode) else list(value)
+      stack.append((value, len(below)))
+      stack.extend((c, -1) for c in reversed(below))
+    else:
+      results.append(value)
+  return results[0]
+
+def shifted_body(body: LazyChunk, shift: int) -> LazyChunk:
+  return LazyChunk(lambda: shift_locations(body.force(), shift), body.check_body)
+
+def reparse(chunk: Chunk, old_code: str, edit: TextEdit) -> Chunk:
+  new_code = old_code[:edit.start] + edit.text + old_code[edit.end:]
+  delta = len(edit.text) - (edit.end - edit.start)
+  stmts: list[Stmt | ReturnStmt] = list(chunk.stmts)
+  if chunk.last:
+    stmts.append(chunk.last)
+  spans = statement_spans(old_code)
+  if not spans or len(spans) != len(stmts):
+    return parse_ast(new_code)
+
+  first = next((i for i, (_, e) in enumerate(spans) if e >= edit.start), len(spans))
+  last = max((i for i, (s, _) in enumerate(spans) if s <= edit.end), default=-1)
+  first, last = max(0, min(first, last) - 1), min(len(spans) - 1, max(first, last) + 1)
+  region_start = spans[first][0]
+  region_end = spans[last][1] + delta
+  if first == 0:
+    region_start = 0
+  if last == len(spans) - 1:
+    region_end = len(new_code)
+  if region_end < edit.start + len(edit.text):
+    return parse_ast(new_code)
+
+  try:
+    region = parse_ast(new_code[region_start:region_end])
+  except UnexpectedInput:
+    return parse_ast(new_code)
+  reparsed: list[Stmt | ReturnStmt] = list(region.stmts)
+  if region.last:
+    reparsed.append(region.last)
+  after = stmts[last + 1:]
+  if after:
+    # The statement following the region must still start where it used to,
+    # otherwise the edit changed how the rest of the file splits.
+    next_start, next_end = spans[last + 1][0] + delta, spans[last + 1][1] + delta
+    joined = statement_spans(new_code[region_start:next_end])
+    if region.last or not joined or len(joined) != len(reparsed) + 1 or joined[-1][0] != next_start - region_start:
+      return parse_ast(new_code)
+
+  if region_start:
+    reparsed = [shift_locations(stmt, region_start) for stmt in reparsed]
+  if delta:
+    after = [shift_locations(stmt, delta) for stmt in after]
+
+  stmts = stmts[:first] + reparsed + after
+  ret: Optional[ReturnStmt] = None
+  if stmts and isinstance(stmts[-1], ReturnStmt):
+    ret = stmts.pop()
+  loc = stmts[0].location if stmts else ret.location if ret else 0
+  return Chunk(loc, tuple(stmts), ret)  # type: ignore[arg-type]
@@ -1,68 +1,133 @@
 from dataclasses import dataclass
 from models import *
 from type_models import *
-from typing import Optional, TypeAlias
+from typing import Any, Callable, Optional, TypeAlias
 from type_helpers import *
 from stdlib import ctx
 
 global_ctx: Context = ctx
 
+def render_location(source: Optional[SourceMap], offset: int) -> str:
+  if source is None:
+    return str(offset)
+  return repr(source.location(offset))
+
 @dataclass
 class UnifyError:
-  location: Location
-  message: str
+  location: int
+  message: str | Mismatch
 
 UnifyResult: TypeAlias = UnifyError | tuple[Substitution, MonoType]
+InferSteps: TypeAlias = Steps[UnifyResult]
 
-def set_path(prefix: Expr, value: MonoType, ctx: Context) -> UnifyError | None:
-  def get_base(expr: Expr) -> tuple['MonoType | UnifyError', list[MonoType]]:
-    if isinstance(expr, Var):
-      res = ctx.mapping[expr.name]
-      if isinstance(res, ForallType):
-        res_t = res.body
-      else:
-        res_t = res
-      assert not isinstance(res_t, ForallType)
-      return res_t, []
-    elif isinstance(expr, IndexExpr):
-      base, path = get_base(expr.obj)
-      if isinstance(base, UnifyError): return base, []
-      ind = infer(expr.index, ctx)
-      if isinstance(ind, UnifyError): return ind, []
-      ind_s, ind_t = ind
-      return base, path + [ind_t]
-    assert False
+# What an `if` condition implies about its operands only applies to the type
+# of the statement, not to where the operands came from.
+@dataclass
+class ConditionScope:
+  subst: Substitution
+
+# How `infer_steps` applies its typing rules. A rule is one of the functions
+# ending in `_rule` below: it takes the types it works on and returns what
+# the walk composes into the node's result, a substitution (`check`) or a
+# substitution and a type (`rule`). Here each rule runs as soon as the walk
+# reaches it; the constraint engine (constraints.py) records them instead and
+# solves them in batches, so both engines share one set of rules.
+class Rules:
+  def rule(self, fn: Callable[..., UnifyResult], *args: Any) -> UnifyResult:
+    return fn(*args)
+
+  def check(self, fn: Callable[..., 'Substitution | UnifyError'], *args: Any) -> 'Substitution | UnifyError':
+    return fn(*args)
+
+  # What a variable is bound to when it is given `value` of type `type`.
+  def generalize(self, value: Optional[Expr], type: MonoType, ctx: Context) -> 'PolyType | UnifyError':
+    return generalize(type, ctx)
+
+  # `type` where the walk itself branches on its shape.
+  def current(self, type: MonoType) -> 'MonoType | UnifyError':
+    return type
+
+  def open_scope(self) -> ConditionScope:
+    return ConditionScope(Substitution({}))
+
+  def close_scope(self, scope: ConditionScope, s: Substitution) -> None:
+    scope.subst = s
+
+eager = Rules()
+
+# Types are immutable, so narrowing or assigning through a path rebuilds the
+# tables along it and rebinds the variable in every scope that shares the old
+# type, up to the scope that declared it.
+def rebind(name: str, old: MonoType, new: MonoType, ctx: Context) -> None:
+  def replace(bound: PolyType) -> 'Optional[PolyType]':
+    if bound is old:
+      return new
+    if isinstance(bound, ForallType) and bound.body is old:
+      return ForallType(bound.vars, new)
+    return None
+  scope: Context | None = ctx
+  while scope is not None:
+    if name in scope.mapping and (res := replace(scope.mapping[name])) is not None:
+      scope.mapping[name] = res
+    if name in scope.locals:
+      return
+    scope = scope.parent
+  if name in global_ctx.mapping and (res := replace(global_ctx.mapping[name])) is not None:
+    global_ctx.mapping[name] = res
+
+def set_path(prefix: Expr, value: MonoType, ctx: Context, rules: 'Rules') -> Steps[UnifyError | None]:
+  def get_base(expr: Expr) -> Steps[tuple[str, 'MonoType | UnifyError', list[MonoType]]]:
+    indices: list[Expr] = []
+    while isinstance(expr, IndexExpr):
+      indices.append(expr.index)
+      expr = expr.obj
+    assert isinstance(expr, Var)
+    res = ctx.mapping[expr.name]
+    if isinstance(res, ForallType):
+      res_t = res.body
+    else:
+      res_t = res
+    assert not isinstance(res_t, ForallType)
+    path: list[MonoType] = []
+    for index in reversed(indices):
+      ind = yield index, ctx
+      if isinstance(ind, UnifyError): return expr.name, ind, []
+      ind_t = rules.current(ind[1])
+      if isinstance(ind_t, UnifyError): return expr.name, ind_t, []
+      path.append(ind_t)
+    return expr.name, res_t, path
   if isinstance(prefix, IndexExpr):
-    base, paths = get_base(prefix)
+    name, base, paths = yield from get_base(prefix)
     if isinstance(base, UnifyError): return base
-    cur_path = base
+    cur_path = rules.current(base)
+    if isinstance(cur_path, UnifyError): return cur_path
+    chain: list[tuple[TableType, int]] = []
     for path in paths[:-1]:
       assert isinstance(cur_path, TableType)
-      for k, v in cur_path.fields:
-        if extends(path, k):
-          cur_path = v
-          break
+      i = cur_path.index.find(path)
+      if i is not None:
+        chain.append((cur_path, i))
+        cur_path = cur_path.fields[i][1]
     if not isinstance(cur_path, TableType):
       return None
-    new: list[tuple[MonoType, MonoType]] = []
-    found = False
-    for tup in cur_path.fields:
-      k, v = tup
-      if extends(paths[-1], k):
-        subs = unify(value, broaden(v))
-        if isinstance(subs, str): return UnifyError(prefix.location, subs)
-        new.append((k, subs.apply_mono(broaden(value))))
-        found = True
-        continue
-      new.append((k, v))
-    if not found:
-      cur_path.fields.append((paths[-1], value))  
-    else:
-      cur_path.fields = new
+    new = list(cur_path.fields)
+    matches = cur_path.index.matches(paths[-1])
+    for i in matches:
+      k, v = new[i]
+      subs = unify(value, broaden(v))
+      if isinstance(subs, Mismatch): return UnifyError(prefix.location, subs)
+      new[i] = (k, subs.apply_mono(broaden(value)))
+    if not matches:
+      new.append((paths[-1], value))
+    updated: MonoType = TableType(new)
+    for table, i in reversed(chain):
+      k, _ = table.fields[i]
+      updated = TableType(table.fields[:i] + ((k, updated),) + table.fields[i + 1:])
+    rebind(name, base, updated, ctx)
   return None
 
 
-def infer_type_check_predicate(node: IfStmt, ctx: Context) -> Optional[UnifyError]:
+def infer_type_check_predicate(node: IfStmt, ctx: Context) -> Steps[Optional[UnifyError]]:
   cond = node.cond
   if isinstance(cond, BinaryExpr):
     left, right = cond.left, cond.right
@@ -75,7 +140,7 @@ def infer_type_check_predicate(node: IfStmt, ctx: Context) -> Optional[UnifyErro
           assert isinstance(arg, Var)
           if isinstance(right, String):
             contents = right.value
-            res = infer(arg, ctx)
+            res = yield arg, ctx
             if isinstance(res, UnifyError): return res
             _, arg_t = res
             type: MonoType | None = None
@@ -90,32 +155,227 @@ def infer_type_check_predicate(node: IfStmt, ctx: Context) -> Optional[UnifyErro
             elif contents == "table":
               type = TableType([])
             elif contents == "function":
-              type = TypeConstructor("function", [new_type_var(), new_type_var(), new_type_var()], None, [])
+              type = TypeConstructor("function", [new_type_var(), new_type_var(), new_type_var()], None)
             else:
               assert False, f"Not implemented: {contents}"
             res1 = intersect(arg_t, type)
-            if res1 is None: return UnifyError(node.location, f"Attempting to narrow down type `{arg_t}` to `{type}` will result in a `never` type")
+            if res1 is None: return UnifyError(node.location, Mismatch("Attempting to narrow down type `{}` to `{}` will result in a `never` type", arg_t, type))
             ctx.mapping[arg.name] = res1
             return None
       if isinstance(left, Var):
-        res = infer(right, ctx)
+        res = yield right, ctx
         if isinstance(res, UnifyError): return res
         expr_s, expr_t = res
         expr_t = broaden(expr_t)
-        res = infer(left, ctx)
+        res = yield left, ctx
         if isinstance(res, UnifyError): return res
         var_s, var_t = res
         var_t = broaden(var_t)
         res2 = intersect(var_t, expr_t)
-        if res2 is None: return UnifyError(node.location, f"Attempting to compare two distinct types: `{var_t}` and `{expr_t}`")
+        if res2 is None: return UnifyError(node.location, Mismatch("Attempting to compare two distinct types: `{}` and `{}`", var_t, expr_t))
         ctx.mapping[left.name] = res2
         return None
   return None
 
+def merge_returns(ret: TypeConstructor, stmt_t: TypeConstructor) -> TypeConstructor:
+  args = list(ret.args)
+  for i, arg1 in enumerate(stmt_t.args):
+    if i >= len(args):
+      args.append(union_of(arg1, NilType))
+    else:
+      args[i] = smart_union(args[i], arg1)
+  return TypeConstructor(ret.name, args, ret.value)
+
+def literal_type(node: BaseNode) -> 'MonoType | None':
+  if isinstance(node, Nil):
+    return TypeConstructor("nil", [], None)
+  elif isinstance(node, Number):
+    return TypeConstructor("number", [], node.value)
+  elif isinstance(node, String):
+    return TypeConstructor("string", [], node.value)
+  elif isinstance(node, Boolean):
+    return TypeConstructor("boolean", [], node.value)
+  return None
+
+def field_rule(value_t: MonoType, field_t: MonoType) -> UnifyResult:
+  res = unify(value_t, field_t)
+  if isinstance(res, Mismatch):
+    return Substitution({}), smart_union(value_t, field_t)
+  return Substitution({}), res.apply_mono(broaden(field_t))
+
+def index_rule(s: Substitution, obj_t: MonoType, index_t: MonoType, location: int) -> UnifyResult:
+  beta = new_type_var()
+  replace_s = unify(TableType([(index_t, beta)]), obj_t)
+  if isinstance(replace_s, Mismatch): return UnifyError(location, replace_s)
+  s = replace_s.apply_subst(s)
+  return s, s.apply_mono(beta)
+
+def unary_rule(s: Substitution, op: str, value_t: MonoType, location: int) -> 'Substitution | UnifyError':
+  value_t = flatten_tuple(value_t)
+  if op == "-":
+    expected = NumberType
+  elif op == "#":
+    expected = union_of(TableType([]), StringType)
+  else:
+    expected = BooleanType
+  op_s = unify(value_t, expected)
+  if isinstance(op_s, Mismatch): return UnifyError(location, op_s)
+  return op_s.apply_subst(s)
+
+def operands_rule(s: Substitution, left_t: MonoType, right_t: MonoType, operand: MonoType, left_location: int, right_location: int) -> 'Substitution | UnifyError':
+  left_s = unify(flatten_tuple(left_t), operand)
+  if isinstance(left_s, Mismatch): return UnifyError(left_location, left_s)
+  right_s = unify(flatten_tuple(right_t), operand)
+  if isinstance(right_s, Mismatch): return UnifyError(right_location, right_s)
+  return left_s.apply_subst(right_s.apply_subst(s))
+
+def equality_rule(left_s: Substitution, right_s: Substitution, left_t: MonoType, right_t: MonoType) -> Substitution:
+  s = Substitution({})
+  eq_s = unify(flatten_tuple(left_t), flatten_tuple(right_t))
+  if not isinstance(eq_s, Mismatch):
+    s = eq_s.apply_subst(s)
+  return left_s.apply_subst(right_s.apply_subst(s))
+
+def return_annotation_rule(body_t: MonoType, ret_type: MonoType, location: int) -> UnifyResult:
+  ret_anno_s = unify(body_t, ret_type)
+  if isinstance(ret_anno_s, Mismatch): return UnifyError(location, ret_anno_s)
+  return Substitution({}), ret_anno_s.apply_mono(ret_type)
+
+def call_rule(args_s: Substitution, node_func_s: Substitution, arg_types: list[MonoType], node_func_t: MonoType, location: int) -> UnifyResult:
+  params1: list[MonoType] = []
+  for arg_t in arg_types:
+    if isinstance(arg_t, TypeConstructor) and arg_t.name == "tuple":
+      params1.extend([broaden(a) for a in arg_t.args])
+    else:
+      params1.append(broaden(arg_t))
+  beta = new_type_var()
+  node_func_t = flatten_tuple(node_func_t)
+  varargs: MonoType | None = None
+  # TODO find a better way to do this
+  if isinstance(node_func_t, TypeVariable):
+    func_type = TypeConstructor("function", [TypeConstructor("tuple", [broaden(p) for p in params1], None), beta, NilType], None)
+    subs = unify(func_type, node_func_t)
+    if isinstance(subs, Mismatch): return UnifyError(location, subs)
+    return subs.apply_subst(node_func_s.apply_subst(args_s)), subs.apply_subst(node_func_s).apply_mono(beta)
+  assert isinstance(node_func_t, TypeConstructor)
+  if node_func_t.value == True:
+    assert isinstance(node_func_t.args[0], TypeConstructor)
+    for param1 in params1[len(node_func_t.args[0].args):]:
+      if varargs is None:
+        varargs = broaden(param1)
+      subs = unify(param1, varargs)
+      if isinstance(subs, Mismatch): return UnifyError(location, subs)
+      varargs = broaden(subs.apply_mono(varargs))
+    params1 = params1[:len(node_func_t.args[0].args)]
+  func_type = TypeConstructor("function", [TypeConstructor("tuple", params1, None), beta, NilType], None)
+  func_s = unify(func_type, node_func_t)
+  if isinstance(func_s, Mismatch): return UnifyError(location, func_s)
+  replace_s = unify(node_func_t.args[0], TypeConstructor("tuple", params1, None))
+  if isinstance(replace_s, Mismatch): return UnifyError(location, replace_s)
+  if varargs is not None and node_func_t.args[2] != NilType:
+    assert isinstance(node_func_t.args[2], TypeVariable)
+    replace_s = Substitution({node_func_t.args[2].name: varargs}).apply_subst(replace_s)
+  final_subs = replace_s.apply_subst(func_s.apply_subst(node_func_s.apply_subst(args_s)))
+  return final_subs, final_subs.apply_mono(beta)
+
+# The value for the `i`th name of a declaration or assignment; all but the
+# first of the values returned by a call are passed on.
+def value_rule(types: list[MonoType], i: int) -> UnifyResult:
+  values: list[MonoType] = []
+  for type in types:
+    if isinstance(type, TypeConstructor) and type.name == "tuple":
+      values.extend(type.args)
+    else:
+      values.append(type)
+  return Substitution({}), values[i]
+
+def assign_rule(value_t: MonoType, existing: MonoType, location: int) -> UnifyResult:
+  subs = unify(value_t, broaden(existing))
+  if isinstance(subs, Mismatch): return UnifyError(location, subs)
+  return Substitution({}), subs.apply_mono(value_t)
+
+def annotation_rule(value_t: MonoType, anno: MonoType, name: str, location: int) -> 'Substitution | UnifyError':
+  if not extends(value_t, anno):
+    return UnifyError(location, Mismatch("Type mismatch between annotation `{0}` and `{1}`, expected `{0}`, got `{2}`", anno, name, value_t))
+  return Substitution({})
+
+def returns_rule(values: list[MonoType], varargs: list[bool]) -> UnifyResult:
+  exprs: list[MonoType] = []
+  for expr_t, is_vararg in zip(values, varargs):
+    # TODO: find a better way to do this
+    args: list[MonoType] = []
+    while isinstance(expr_t, TypeConstructor) and expr_t.name == "tuple":
+      args = expr_t.args
+      expr_t = expr_t.args[0]
+    if args:
+      exprs.extend(args)
+    elif is_vararg:
+      assert isinstance(expr_t, TableType)
+      exprs.extend([t[1] for t in expr_t.fields])
+    else:
+      exprs.append(expr_t)
+  return Substitution({}), TypeConstructor("tuple", exprs, None)
+
+def condition_rule(cond_t: MonoType, location: int) -> 'Substitution | UnifyError':
+  bool_cond_s = unify(cond_t, BooleanType)
+  if isinstance(bool_cond_s, Mismatch): return UnifyError(location, bool_cond_s)
+  return Substitution({})
+
+def narrow_rule(prefix_t: MonoType, fact_t: MonoType, location: int) -> UnifyResult:
+  fact_t = flatten_tuple(fact_t)
+  val = intersect(prefix_t, fact_t)
+  if val is None:
+    return UnifyError(location, Mismatch("Attempting to narrow type `{}` into `{}`` results in a `never` type", prefix_t, fact_t))
+  return Substitution({}), val
+
+def exclude_rule(prefix_t: MonoType, fact_t: MonoType) -> UnifyResult:
+  return Substitution({}), subtract(prefix_t, flatten_tuple(fact_t))
+
+def join_rule(else_t: MonoType, body_t: MonoType) -> UnifyResult:
+  subs = unify(else_t, broaden(body_t))
+  if isinstance(subs, Mismatch): subs = Substitution({})
+  return Substitution({}), subs.apply_mono(smart_union(else_t, body_t))
+
+def scoped_rule(scope: ConditionScope, body_t: MonoType) -> UnifyResult:
+  return Substitution({}), scope.subst.apply_mono(body_t)
+
+# The rules below merge what the statements of a chunk return.
+def branch_rule(stmt_t: MonoType, ret: MonoType, location: int) -> 'Substitution | UnifyError':
+  ret_s = unify(stmt_t, broaden(ret))
+  if isinstance(ret_s, Mismatch):
+    return UnifyError(location, ret_s)
+  return Substitution({})
+
+def merge_branch_rule(ret: MonoType, stmt_t: MonoType) -> UnifyResult:
+  ret_s = unify(stmt_t, broaden(ret))
+  if isinstance(ret_s, Mismatch):
+    ret_s = Substitution({})
+  assert isinstance(ret, TypeConstructor)
+  assert isinstance(stmt_t, TypeConstructor)
+  return Substitution({}), ret_s.apply_mono(merge_returns(ret, stmt_t))
+
+def merge_last_rule(ret: MonoType, stmt_t: MonoType) -> UnifyResult:
+  ret_s = unify(stmt_t, broaden(ret))
+  if isinstance(ret_s, Mismatch):
+    ret_s = Substitution({})
+  ret = ret_s.apply_mono(broaden(ret))
+  assert isinstance(stmt_t, TypeConstructor) and stmt_t.name == "tuple"
+  assert isinstance(ret, TypeConstructor)
+  return Substitution({}), merge_returns(ret, stmt_t)
+
+def optional_returns_rule(ret: MonoType) -> UnifyResult:
+  assert isinstance(ret, TypeConstructor)
+  return Substitution({}), TypeConstructor("tuple", [union_of(arg, NilType) for arg in ret.args], None)
+
 def infer(node: BaseNode, ctx: Context) -> UnifyResult:
+  return trampoline(infer_steps(node, ctx), infer_steps)
+
+def infer_steps(node: BaseNode, ctx: Context, rules: Rules = eager) -> InferSteps:
   global global_ctx
   if isinstance(node, Var):
     if node.name in ctx.mapping:
+      if ctx.facts is not None and (facts := ctx.mapping.facts_of(node.name)):
+        ctx.facts[id(node)] = facts
       val = instantiate(ctx.mapping[node.name])
       return Substitution({}), val
     if node.name in global_ctx.mapping:
@@ -124,122 +384,126 @@ def infer(node: BaseNode, ctx: Context) -> UnifyResult:
     if node.name in ctx.recursive_fns:
       return UnifyError(node.location, f"Unbound function name: `{node.name}`, did you mean to call it recursively? If so, try adding a return-type annotation")
     return UnifyError(node.location, f"Unbound identifier: `{node.name}`")
-  elif isinstance(node, Nil):
-    return Substitution({}), TypeConstructor("nil", [], None, [])
-  elif isinstance(node, Number):
-    return Substitution({}), TypeConstructor("number", [], node.value, [])
-  elif isinstance(node, String):
-    return Substitution({}), TypeConstructor("string", [], node.value, [])
-  elif isinstance(node, Boolean):
-    return Substitution({}), TypeConstructor("boolean", [], node.value, [])
+  elif (literal := literal_type(node)) is not None:
+    return Substitution({}), literal
   elif isinstance(node, Table):
     s = Substitution({})
     types: list[tuple[MonoType, MonoType]] = []
+    # While the keys are the positions 1, 2, ... of an array they cannot
+    # collide, so only the values are collected (literals typed in place)
+    # and keyed in one go at the end. `element` is the value type while
+    # every value has the same one. The first field that breaks the pattern
+    # moves the fields so far into `types` and `index`.
+    values: list[MonoType] | None = []
+    element: MonoType | None = None
+    index = FieldIndex()
     for k, v in node.fields:
+      if values is not None and isinstance(k, Number) and k.value == len(values) + 1 and not isinstance(v, Vararg):
+        if (v_type := literal_type(v)) is None:
+          v_res = yield v, ctx
+          if isinstance(v_res, UnifyError): return v_res
+          v_subst, v_type = v_res
+          s = v_subst.apply_subst(s)
+        if not values:
+          element = v_type
+        elif v_type is not element:
+          element = None
+        values.append(v_type)
+        continue
+      if values is not None:
+        types = list(zip(position_keys(len(values)), values))
+        index = FieldIndex(k for k, _ in types)
+        values = None
       if isinstance(v, Vararg):
         if not isinstance(k, Number): assert False
-        res = infer(v, ctx)
+        res = yield v, ctx
         if isinstance(res, UnifyError): return res
         va_s, va = res
         assert isinstance(va, TableType)
         s = va_s.apply_subst(s)
+        index.add(NumberType)
         types.append((NumberType, [t[1] for t in va.fields][0]))
         continue
-      k_res = infer(k, ctx)
+      k_res = yield k, ctx
       if isinstance(k_res, UnifyError): return k_res
       k_subst, k_type = k_res
-      v_res = infer(v, ctx)
+      v_res = yield v, ctx
       if isinstance(v_res, UnifyError): return v_res
       v_subst, v_type = v_res
       s = k_subst.apply_subst(s)
       s = v_subst.apply_subst(s)
-      for i, (kt, vt) in enumerate(types):
-        if extends(k_type, kt):
-          res = unify(v_type, vt)
-          if isinstance(res, str):
-            types[i] = (kt, smart_union(v_type, vt))
-            break
-          types[i] = (kt, res.apply_mono(broaden(vt)))
-          break
-      else:
+      # Fields are looked up by key, so the key has to be known here.
+      k_type = rules.current(k_type)
+      if isinstance(k_type, UnifyError): return k_type
+      i = index.find(k_type)
+      if i is None:
+        index.add(k_type)
         types.append((k_type, v_type))
+        continue
+      kt, vt = types[i]
+      field = rules.rule(field_rule, v_type, vt)
+      if isinstance(field, UnifyError): return field
+      types[i] = (kt, field[1])
+    if values is not None:
+      if element is not None:
+        values = [widen(element, wide_kinds([element]))] * len(values)
+      elif kinds := wide_kinds(values):
+        values = [widen(v, kinds) for v in values]
+      return s, TableType.array(zip(position_keys(len(values)), values))
+    if kinds := wide_kinds(v for _, v in types):
+      types = [(k, widen(v, kinds)) for k, v in types]
     return s, TableType(types)
   elif isinstance(node, IndexExpr):
-    res = infer(node.obj, ctx)
+    res = yield node.obj, ctx
     if isinstance(res, UnifyError): return res
     obj_s, obj_t = res
-    res = infer(node.index, ctx)
+    res = yield node.index, ctx
     if isinstance(res, UnifyError): return res
     index_s, index_t = res
-    beta = new_type_var()
-    replace_s = unify(TableType([(index_t, beta)]), obj_t)
-    if isinstance(replace_s, str): return UnifyError(node.location, replace_s)
-    return replace_s.apply_subst(index_s.apply_subst(obj_s)), replace_s.apply_subst(index_s.apply_subst(obj_s)).apply_mono(beta)
+    return rules.rule(index_rule, index_s.apply_subst(obj_s), obj_t, index_t, node.location)
   elif isinstance(node, Vararg):
     if not ctx.mapping.get("..."):
       return UnifyError(node.location, f"Cannot use vararg (...) outside of a vararg-function")
     val = instantiate(ctx.mapping["..."])
     return Substitution({"...": val}), val
   elif isinstance(node, UnaryExpr):
-    res = infer(node.value, ctx)
+    res = yield node.value, ctx
     if isinstance(res, UnifyError): return res
     value_s, value_t = res
-    value_t = flatten_tuple(value_t)
-    if node.op == "-":
-      num_s = unify(value_t, NumberType)
-      if isinstance(num_s, str): return UnifyError(node.location, num_s)
-      return num_s.apply_subst(value_s), NumberType
-    elif node.op == "#":
-      # TODO: add union types DONE
-      tbl_s = unify(value_t, UnionType(TableType([]), StringType))
-      if isinstance(tbl_s, str):
-        return UnifyError(node.location, tbl_s)
-      return tbl_s.apply_subst(value_s), NumberType
-    elif node.op == "not":
-      bool_s = unify(value_t, BooleanType)
-      if isinstance(bool_s, str): return UnifyError(node.location, bool_s)
-      return bool_s.apply_subst(value_s), BooleanType
-    assert False
+    # TODO: add union types DONE
+    assert node.op in ["-", "#", "not"]
+    op_s = rules.check(unary_rule, value_s, node.op, value_t, node.location)
+    if isinstance(op_s, UnifyError): return op_s
+    return op_s, BooleanType if node.op == "not" else NumberType
   elif isinstance(node, BinaryExpr):
-    res = infer(node.left, ctx)
+    res = yield node.left, ctx
     if isinstance(res, UnifyError): return res
     left_s, left_t = res
-    left_t = flatten_tuple(left_t)
-    res = infer(node.right, ctx)
+    res = yield node.right, ctx
     if isinstance(res, UnifyError): return res
     right_s, right_t = res
-    right_t = flatten_tuple(right_t)
-    if node.op in ["+", "-", "*", "/", "%", "^"]:
-      num_left_s = unify(left_t, NumberType)
-      if isinstance(num_left_s, str): return UnifyError(node.left.location, num_left_s)
-      num_right_s = unify(right_t, NumberType)
-      if isinstance(num_right_s, str): return UnifyError(node.right.location, num_right_s)
-      return num_left_s.apply_subst(num_right_s.apply_subst(left_s.apply_subst(right_s))), NumberType
-    elif node.op in ["<", ">", "<=", ">="]:
-      num_left_s = unify(left_t, NumberType)
-      if isinstance(num_left_s, str): return UnifyError(node.left.location, num_left_s)
-      num_right_s = unify(right_t, NumberType)
-      if isinstance(num_right_s, str): return UnifyError(node.right.location, num_right_s)
-      return num_left_s.apply_subst(num_right_s.apply_subst(left_s.apply_subst(right_s))), BooleanType
-    elif node.op == "..":
-      str_left_s = unify(left_t, StringType)
-      if isinstance(str_left_s, str): return UnifyError(node.left.location, str_left_s)
-      str_right_s = unify(right_t, StringType)
-      if isinstance(str_right_s, str): return UnifyError(node.right.location, str_right_s)
-      return str_left_s.apply_subst(str_right_s.apply_subst(left_s.apply_subst(right_s))), StringType
+    if node.op in ["+", "-", "*", "/", "%", "^", "<", ">", "<=", ">=", "..", "and", "or"]:
+      if node.op == "..":
+        operand, result = StringType, StringType
+      elif node.op in ["and", "or"]:
+        operand, result = BooleanType, BooleanType
+      elif node.op in ["<", ">", "<=", ">="]:
+        operand, result = NumberType, BooleanType
+      else:
+        operand, result = NumberType, NumberType
+      op_s = rules.check(operands_rule, left_s.apply_subst(right_s), left_t, right_t, operand, node.left.location, node.right.location)
+      if isinstance(op_s, UnifyError): return op_s
+      if node.op in ["and", "or"] and ctx.facts is not None:
+        ctx.facts[id(node)] = ctx.facts.pop(id(node.left), ()) + ctx.facts.pop(id(node.right), ())
+      return op_s, result
     elif node.op in ["==", "~="]:
-      s = Substitution({})
-      eq1_s = unify(left_t, right_t)
-      if not isinstance(eq1_s, str):
-        s = eq1_s.apply_subst(s)
-      eq2_s = unify(left_t, right_t)
-      if not isinstance(eq2_s, str):
-        s = eq2_s.apply_subst(s)
-      checks: list[tuple[Expr, MonoType]] = []
+      eq_s = rules.check(equality_rule, left_s, right_s, left_t, right_t)
+      assert not isinstance(eq_s, UnifyError)
+      facts: list[Fact] = []
       if isinstance(node.left, (Var, IndexExpr)):
-        checks.append((node.left, right_t))
+        facts.append((node.left, right_t))
       if isinstance(node.right, (Var, IndexExpr)):
-        checks.append((node.right, left_t))
+        facts.append((node.right, left_t))
       if isinstance(node.left, FuncCall) \
           and isinstance(node.left.func, Var) \
           and node.left.func.name == "type" \
@@ -248,312 +512,264 @@ def infer(node: BaseNode, ctx: Context) -> UnifyResult:
           and isinstance(node.left.args[0], (Var, IndexExpr)) \
           and isinstance(node.right, String):
         if node.right.value == "number":
-          checks.append((node.left.args[0], NumberType))
+          facts.append((node.left.args[0], NumberType))
         if node.right.value == "string":
-          checks.append((node.left.args[0], StringType))
+          facts.append((node.left.args[0], StringType))
         if node.right.value == "boolean":
-          checks.append((node.left.args[0], BooleanType))
+          facts.append((node.left.args[0], BooleanType))
         if node.right.value == "nil":
-          checks.append((node.left.args[0], NilType))
+          facts.append((node.left.args[0], NilType))
         if node.right.value == "table":
-          checks.append((node.left.args[0], TableType([])))
+          facts.append((node.left.args[0], TableType([])))
         if node.right.value == "function":
-          checks.append((node.left.args[0], TypeConstructor("function", [new_type_var(), new_type_var(), new_type_var()], None, [])))
-      return left_s.apply_subst(right_s.apply_subst(s)), TypeConstructor("boolean", [], None, checks)
-    elif node.op in ["and", "or"]:
-      bool_left_s = unify(left_t, BooleanType)
-      if isinstance(bool_left_s, str): return UnifyError(node.left.location, bool_left_s)
-      bool_right_s = unify(right_t, BooleanType)
-      if isinstance(bool_right_s, str): return UnifyError(node.right.location, bool_right_s)
-      left_t = bool_left_s.apply_mono(left_t)
-      right_t = bool_right_s.apply_mono(right_t)
-      assert isinstance(left_t, TypeConstructor)
-      assert isinstance(right_t, TypeConstructor)
-      return bool_left_s.apply_subst(bool_right_s.apply_subst(left_s.apply_subst(right_s))), TypeConstructor("boolean", [], None, left_t.checks + right_t.checks)
+          facts.append((node.left.args[0], TypeConstructor("function", [new_type_var(), new_type_var(), new_type_var()], None)))
+      if ctx.facts is not None:
+        ctx.facts[id(node)] = tuple(facts)
+      return eq_s, BooleanType
     assert False
   elif isinstance(node, FuncExpr):
     param_types: list[MonoType] = []
     base_ctx = ctx
-    ctx = Context(ctx.mapping.copy())
-    ctx.recursive_fns = base_ctx.recursive_fns
+    ctx = base_ctx.child()
     for param in node.params:
       new_var = new_type_var()
       ctx.mapping[param] = new_var
+      ctx.locals.add(param)
       param_types.append(new_var)
-    is_vararg = False
+    # A function type's value marks it as vararg; plain functions have none,
+    # like every other non-literal type.
+    is_vararg: Optional[bool] = None
     var: MonoType = NilType
     if node.is_vararg:
       is_vararg = True
       var = new_type_var()
       ctx.mapping["..."] = TableType([(NumberType, var)])
-    param_tuple = TypeConstructor("tuple", param_types, None, [])
+    param_tuple = TypeConstructor("tuple", param_types, None)
+    if node.annotation.ret_type is not None and isinstance(node.body, LazyChunk) and not node.body.check_body and not node.body.is_loaded:
+      return Substitution({}), TypeConstructor("function", [param_tuple, node.annotation.ret_type, var], is_vararg)
     if node.annotation.ret_type is not None and node.name is not None:
-      ctx.mapping[node.name] = TypeConstructor("function", [param_tuple, node.annotation.ret_type, NilType], None, [])
-    res = infer(node.body, ctx)
+      ctx.mapping[node.name] = TypeConstructor("function", [param_tuple, node.annotation.ret_type, NilType], None)
+    res = yield node.body, ctx
     if isinstance(res, UnifyError): return res
     body_s, body_t = res
     params = body_s.apply_mono(param_tuple)
     if node.annotation.ret_type is not None:
-      ret_anno_s = unify(body_t, node.annotation.ret_type)
-      if isinstance(ret_anno_s, str): return UnifyError(node.location, ret_anno_s)
-      body_t = ret_anno_s.apply_mono(node.annotation.ret_type)
-    return body_s, TypeConstructor("function", [params, body_t, var], is_vararg, [])
+      res = rules.rule(return_annotation_rule, body_t, node.annotation.ret_type, node.location)
+      if isinstance(res, UnifyError): return res
+      body_t = res[1]
+    return body_s, TypeConstructor("function", [params, body_t, var], is_vararg)
   elif isinstance(node, FuncCall):
-    params1: list[MonoType] = []
+    arg_types: list[MonoType] = []
     args_s = Substitution({})
     for arg in node.args:
-      res = infer(arg, ctx)
+      res = yield arg, ctx
       if isinstance(res, UnifyError): return res
       arg_s, arg_t = res
       args_s = arg_s.apply_subst(args_s)
-      if isinstance(arg_t, TypeConstructor) and arg_t.name == "tuple":
-        params1.extend([broaden(a) for a in arg_t.args])
-      else:
-        params1.append(broaden(arg_t))
-    beta = new_type_var()
-    res = infer(node.func, ctx)
+      arg_types.append(arg_t)
+    res = yield node.func, ctx
     if isinstance(res, UnifyError): return res
     node_func_s, node_func_t = res
-    node_func_t = flatten_tuple(node_func_t)
-    varargs: MonoType | None = None
-    # TODO find a better way to do this
-    if isinstance(node_func_t, TypeVariable):
-      func_type = TypeConstructor("function", [TypeConstructor("tuple", [broaden(p) for p in params1], None, []), beta, NilType], None, [])
-      subs = unify(func_type, node_func_t)
-      if isinstance(subs, str): return UnifyError(node.location, subs)
-      return subs.apply_subst(node_func_s.apply_subst(args_s)), subs.apply_subst(node_func_s).apply_mono(beta)
-    assert isinstance(node_func_t, TypeConstructor)
-    if node_func_t.value == True:
-      assert isinstance(node_func_t.args[0], TypeConstructor)
-      for param1 in params1[len(node_func_t.args[0].args):]:
-        if varargs is None:
-          varargs = broaden(param1)
-        subs = unify(param1, varargs)
-        if isinstance(subs, str): return UnifyError(node.location, subs)
-        varargs = broaden(subs.apply_mono(varargs))
-      params1 = params1[:len(node_func_t.args[0].args)]
-    func_type = TypeConstructor("function", [TypeConstructor("tuple", params1, None, []), beta, NilType], None, [])
-    func_s = unify(func_type, node_func_t)
-    if isinstance(func_s, str): return UnifyError(node.location, func_s)
-    assert isinstance(node_func_t, TypeConstructor)
-    replace_s = unify(node_func_t.args[0], TypeConstructor("tuple", params1, None, [])) 
-    if isinstance(replace_s, str): return UnifyError(node.location, replace_s)
-    if varargs is not None and node_func_t.args[2] != NilType:
-      assert isinstance(node_func_t.args[2], TypeVariable)
-      replace_s = Substitution({node_func_t.args[2].name: varargs}).apply_subst(replace_s)
-    if isinstance(replace_s, str): return UnifyError(node.location, replace_s)
-    final_subs = replace_s.apply_subst(func_s.apply_subst(node_func_s.apply_subst(args_s)))
-    return final_subs, final_subs.apply_mono(beta)
+    return rules.rule(call_rule, args_s, node_func_s, arg_types, node_func_t, node.location)
   elif isinstance(node, VarDecl):
-    exprs: list[MonoType] = []
+    types: list[MonoType] = []
     s = Substitution({})
     for name in node.names:
       if isinstance(name, Var):
-        ctx.recursive_fns.append(name.name)
+        ctx.recursive_fns.add(name.name)
+    ctx.facts = {}
     for expr in node.exprs:
-      res = infer(expr, ctx)
+      res = yield expr, ctx
       if isinstance(res, UnifyError): return res
       expr_s, expr_t = res
-      if isinstance(expr_t, TypeConstructor) and expr_t.name == "tuple":
-        exprs.extend(expr_t.args)
-      else:
-        exprs.append(expr_t)
+      types.append(expr_t)
       s = expr_s.apply_subst(s)
+    value_facts, ctx.facts = ctx.facts, None
+    spread = any(isinstance(t, TypeVariable) or (isinstance(t, TypeConstructor) and t.name == "tuple") for t in types)
     for i, name in enumerate(node.names):
+      if spread:
+        res = rules.rule(value_rule, types, i)
+        if isinstance(res, UnifyError): return res
+        value_t = res[1]
+      else:
+        value_t = types[i]
       if node.annotation:
         anno = node.annotation.types
         assert isinstance(anno, TypeConstructor) and anno.name == "tuple"
-        if not extends(exprs[i], anno.args[i]):
-          return UnifyError(node.location, f"Type mismatch between annotation `{anno.args[i]}` and `{name}`, expected `{anno.args[i]}`, got `{exprs[i]}`")
+        err = rules.check(annotation_rule, value_t, anno.args[i], name, node.location)
+        if isinstance(err, UnifyError): return err
         ctx.mapping[name] = generalize(anno, ctx)
       else:
-        ctx.mapping[name] = generalize(exprs[i], ctx)
+        bound = rules.generalize(node.exprs[i] if i < len(node.exprs) else None, value_t, ctx)
+        if isinstance(bound, UnifyError): return bound
+        ctx.mapping[name] = bound
+      if i < len(node.exprs) and (expr_facts := value_facts.get(id(node.exprs[i]))):
+        ctx.mapping.facts[name] = expr_facts
+      ctx.locals.add(name)
     return s, NilType
   elif isinstance(node, VarAssign):
-    exprs = []
+    types = []
     s = Substitution({})
     for name in node.names:
       if isinstance(name, Var):
-        ctx.recursive_fns.append(name.name)
+        ctx.recursive_fns.add(name.name)
     for expr in node.exprs:
-      res = infer(expr, ctx)
+      res = yield expr, ctx
       if isinstance(res, UnifyError): return res
       expr_s, expr_t = res
-      if isinstance(expr_t, TypeConstructor) and expr_t.name == "tuple":
-        exprs.extend(expr_t.args)
-      else:
-        exprs.append(expr_t)
+      types.append(expr_t)
       s = expr_s.apply_subst(s)
+    spread = any(isinstance(t, TypeVariable) or (isinstance(t, TypeConstructor) and t.name == "tuple") for t in types)
     for i, prefix in enumerate(node.names):
+      if spread:
+        res = rules.rule(value_rule, types, i)
+        if isinstance(res, UnifyError): return res
+        value_t = res[1]
+      else:
+        value_t = types[i]
+      value = node.exprs[i] if i < len(node.exprs) else None
       if not isinstance(prefix, Var):
-        err = set_path(prefix, exprs[i], ctx)
+        path_t = rules.current(value_t)
+        if isinstance(path_t, UnifyError): return path_t
+        err = yield from set_path(prefix, path_t, ctx, rules)
         if err:
           return err
         continue
       if ctx.mapping.get(prefix.name):
-        existing = instantiate(ctx.mapping[prefix.name])
-        subs = unify(exprs[i], broaden(existing))
-        if isinstance(subs, str): return UnifyError(node.location, subs)
-        ctx.mapping[prefix.name] = generalize(subs.apply_mono(exprs[i]), ctx)
+        # The value is checked against the variable, which is not
+        # constrained by it.
+        res = rules.rule(assign_rule, value_t, instantiate(ctx.mapping[prefix.name]), node.location)
+        if isinstance(res, UnifyError): return res
+        bound = rules.generalize(value, res[1], ctx)
+        if isinstance(bound, UnifyError): return bound
+        ctx.mapping[prefix.name] = bound
       else:
-        ctx.mapping[prefix.name] = generalize(exprs[i], ctx)
-        global_ctx.mapping[prefix.name] = generalize(exprs[i], ctx)
+        bound = rules.generalize(value, value_t, ctx)
+        if isinstance(bound, UnifyError): return bound
+        ctx.mapping[prefix.name] = bound
+        global_ctx.mapping[prefix.name] = bound
     return s, NilType
   elif isinstance(node, ReturnStmt):
-    exprs = []
+    values: list[MonoType] = []
     s = Substitution({})
     for expr in node.exprs:
-      res = infer(expr, ctx)
+      res = yield expr, ctx
       if isinstance(res, UnifyError): return res
       expr_s, expr_t = res
-      # TODO: find a better way to do this
-      args = []
-      while isinstance(expr_t, TypeConstructor) and expr_t.name == "tuple":
-        args = expr_t.args
-        expr_t = expr_t.args[0]
-      if args:
-        exprs.extend(args)
-      else:
-        if isinstance(expr, Vararg):
-          assert isinstance(expr_t, TableType)
-          exprs.extend([t[1] for t in expr_t.fields])
-        else:
-          exprs.append(expr_t)
+      values.append(expr_t)
       s = expr_s.apply_subst(s)
+    res = rules.rule(returns_rule, values, [isinstance(expr, Vararg) for expr in node.exprs])
+    assert not isinstance(res, UnifyError)
     s.is_returning = True
-    return s, TypeConstructor("tuple", exprs, None, [])
+    return s, res[1]
   elif isinstance(node, IfStmt):
-    cond_ctx = Context(ctx.mapping.copy())
-    cond_ctx.recursive_fns = ctx.recursive_fns
-    res = infer(node.cond, cond_ctx)
+    cond_ctx = ctx.child()
+    cond_ctx.facts = {}
+    scope = rules.open_scope()
+    res = yield node.cond, cond_ctx
     if isinstance(res, UnifyError): return res
     cond_s, cond_t = res
-    bool_cond_s = unify(cond_t, BooleanType)
+    facts = cond_ctx.facts.get(id(node.cond), ())
+    err = rules.check(condition_rule, cond_t, node.location)
+    if isinstance(err, UnifyError): return err
+    rules.close_scope(scope, cond_s)
     base_ctx = ctx
-    ctx = Context(ctx.mapping.copy())
-    ctx.recursive_fns = base_ctx.recursive_fns
-    if isinstance(bool_cond_s, str): return UnifyError(node.location, bool_cond_s)
-    if isinstance(cond_t, TypeConstructor):
-      for prefix1, expr1 in cond_t.checks:
-        res = infer(prefix1, ctx)
-        if isinstance(res, UnifyError): return res
-        prefix_s, prefix_t = res
-        val1 = intersect(prefix_t, expr1)
-        if val1 is None:
-          return UnifyError(node.location, f"Attempting to narrow type `{prefix_t}` into `{expr1}`` results in a `never` type")
-        if isinstance(prefix1, Var):
-          ctx.mapping[prefix1.name] = val1
-        else:
-          err = set_path(prefix1, val1, ctx)
-          if err: return err
-    res = infer(node.body, ctx)
+    ctx = base_ctx.child()
+    for prefix1, expr1 in facts:
+      res = yield prefix1, ctx
+      if isinstance(res, UnifyError): return res
+      res = rules.rule(narrow_rule, res[1], expr1, node.location)
+      if isinstance(res, UnifyError): return res
+      if isinstance(prefix1, Var):
+        ctx.mapping[prefix1.name] = res[1]
+      else:
+        val1 = rules.current(res[1])
+        if isinstance(val1, UnifyError): return val1
+        err = yield from set_path(prefix1, val1, ctx, rules)
+        if err: return err
+    res = yield node.body, ctx
     if isinstance(res, UnifyError): return res
     body_s, body_t = res
     is_ret = body_s.is_returning
     if node.else_stmt:
       base_ctx = ctx
-      ctx = Context(base_ctx.mapping.copy())
-      ctx.recursive_fns = base_ctx.recursive_fns
-      if isinstance(cond_t, TypeConstructor):
-        for prefix1, expr1 in cond_t.checks:
-          res = infer(prefix1, ctx)
-          if isinstance(res, UnifyError): return res
-          prefix_s, prefix_t = res
-          val1 = subtract(prefix_t, expr1)
-          if isinstance(prefix1, Var):
-            ctx.mapping[prefix1.name] = val1
-          else:
-            err = set_path(prefix1, val1, ctx)
-            if err: return err
-      res = infer(node.else_stmt, ctx)
+      ctx = base_ctx.child()
+      for prefix1, expr1 in facts:
+        res = yield prefix1, ctx
+        if isinstance(res, UnifyError): return res
+        res = rules.rule(exclude_rule, res[1], expr1)
+        if isinstance(res, UnifyError): return res
+        if isinstance(prefix1, Var):
+          ctx.mapping[prefix1.name] = res[1]
+        else:
+          val1 = rules.current(res[1])
+          if isinstance(val1, UnifyError): return val1
+          err = yield from set_path(prefix1, val1, ctx, rules)
+          if err: return err
+      res = yield node.else_stmt, ctx
       if isinstance(res, UnifyError): return res
       else_s, else_t = res
       if is_ret and not else_s.is_returning:
         is_ret = False
       body_s = else_s.apply_subst(body_s)
-      subs = unify(else_t, broaden(body_t))
-      if isinstance(subs, str): subs = Substitution({})
-      body_t = subs.apply_mono(smart_union(else_t, body_t))
+      res = rules.rule(join_rule, else_t, body_t)
+      if isinstance(res, UnifyError): return res
+      body_t = res[1]
     else:
       is_ret = False
     s = body_s
     s.is_returning = is_ret
-    return s, cond_s.apply_mono(body_t)
+    res = rules.rule(scoped_rule, scope, body_t)
+    if isinstance(res, UnifyError): return res
+    return s, res[1]
   elif isinstance(node, RevealAnnotation):
-    res = infer(node.expr, ctx)
+    res = yield node.expr, ctx
     if isinstance(res, UnifyError): return res
-    expr_s, expr_t = res
-    print(f"{node.location} (@reveal): {expr_t}")
+    expr_t = rules.current(res[1])
+    if isinstance(expr_t, UnifyError): return expr_t
+    print(f"{render_location(ctx.source, node.location)} (@reveal): {expr_t}")
     return Substitution({}), NilType
   elif isinstance(node, Chunk):
     base_ctx = ctx
-    ctx = Context(ctx.mapping.copy())
-    ctx.recursive_fns = base_ctx.recursive_fns
+    ctx = base_ctx.child()
     ret: MonoType | None = None
     s = Substitution({})
     has_returned = False
     for stmt in node.stmts:
-      res = infer(stmt, ctx)
+      res = yield stmt, ctx
       if isinstance(res, UnifyError): return res
       stmt_s, stmt_t = res
-      if isinstance(stmt_t, TypeConstructor) and stmt_t.name == "tuple" and not isinstance(stmt, FuncCall):
+      # Of the statements only `if` has a type, the tuple its branches return.
+      if isinstance(stmt, IfStmt):
+        if ret is None:
+          ret = stmt_t
         if not stmt_s.is_returning:
-          if ret is None:
-            ret = stmt_t
-          #else:
-          ret_s = unify(stmt_t, broaden(ret))
-          if isinstance(ret_s, str):
-            return UnifyError(node.location, ret_s)
-          # s = ret_s.apply_subst(s)
-        if stmt_s.is_returning:
+          err = rules.check(branch_rule, stmt_t, ret, node.location)
+          if isinstance(err, UnifyError): return err
+        else:
           has_returned = True
-          if ret is None:
-            ret = stmt_t
-          #else:
-          ret_s = unify(stmt_t, broaden(ret))
-          if isinstance(ret_s, str):
-            ret_s = Substitution({})
-            # return UnifyError(node.location, ret_s)
-          # s = ret_s.apply_subst(s)
-          assert isinstance(ret, TypeConstructor)
-          assert isinstance(stmt_t, TypeConstructor)
-          for i, arg1 in enumerate(stmt_t.args):
-            if i >= len(ret.args):
-              ret.args.append(UnionType(arg1, NilType))
-            else:
-              ret.args[i] = smart_union(ret.args[i], arg1)
-          ret = ret_s.apply_mono(ret)
+          res = rules.rule(merge_branch_rule, ret, stmt_t)
+          if isinstance(res, UnifyError): return res
+          ret = res[1]
       s = stmt_s.apply_subst(s)
     if node.last:
-      res = infer(node.last, ctx)
+      res = yield node.last, ctx
       if isinstance(res, UnifyError): return res
       stmt_s, stmt_t = res
-      if not ret:
+      if ret is None:
         ret = stmt_t
       else:
-        ret_s = unify(stmt_t, broaden(ret))
-        if isinstance(ret_s, str):
-          ret_s = Substitution({})
-          # return UnifyError(node.location, ret_s)
-        ret = ret_s.apply_mono(broaden(ret))
-        assert isinstance(stmt_t, TypeConstructor) and stmt_t.name == "tuple"
-        assert isinstance(ret, TypeConstructor)
-        for i, arg1 in enumerate(stmt_t.args):
-          if i >= len(ret.args):
-            ret.args.append(UnionType(arg1, NilType))
-          else:
-            ret.args[i] = smart_union(ret.args[i], arg1)
-        # s = ret_s.apply_subst(s)
+        res = rules.rule(merge_last_rule, ret, stmt_t)
+        if isinstance(res, UnifyError): return res
+        ret = res[1]
       s = stmt_s.apply_subst(s)
-    elif ret and not has_returned:
-      new_ret = TypeConstructor("tuple", [], None, [])
-      for arg in ret.args:
-        new_ret.args.append(UnionType(arg, NilType))
-      ret = new_ret
+    elif ret is not None and not has_returned:
+      res = rules.rule(optional_returns_rule, ret)
+      if isinstance(res, UnifyError): return res
+      ret = res[1]
     s.is_returning = True
     if ret is None:
       s.is_returning = False
-      ret = TypeConstructor("tuple", [], None, [])
+      ret = TypeConstructor("tuple", [], None)
     return s, ret
   assert False, f"Not implemented: {node}"
-
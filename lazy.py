@@ -0,0 +1,92 @@
+import re
+from contextvars import ContextVar
+from typing import Any, Iterator
+from lark import Lark, Token
+from models import *
+from parser import ToAST, Params, open_lalr, place_empty
+from incremental import shift_locations
+
+def function_bodies(tokens: list[Token]) -> list[tuple[int, int]]:
+  spans: list[tuple[int, int]] = []
+  i = 0
+  while i < len(tokens):
+    if tokens[i].value != "function":
+      i += 1
+      continue
+    while i < len(tokens) and tokens[i].value != ")":
+      i += 1
+    i += 1
+    while i < len(tokens) and tokens[i].type == "RETURN_ANNOTATION":
+      i += 2
+      while i + 1 < len(tokens) and tokens[i].value in ("|", ","):
+        i += 2
+    if i > len(tokens):
+      break
+    body_start = tokens[i - 1].end_pos
+    depth = 1
+    while i < len(tokens):
+      if tokens[i].value in ("function", "if"):
+        depth += 1
+      elif tokens[i].value == "end":
+        depth -= 1
+        if depth == 0:
+          break
+      i += 1
+    if i == len(tokens):
+      break
+    assert body_start is not None and tokens[i].start_pos is not None
+    spans.append((body_start, tokens[i].start_pos))
+    i += 1
+  return spans
+
+# The bodies of one parse_lazy call, in order, put in place of the blanked
+# ones as each function reduces.
+class LazyToAST(ToAST):
+  bodies: Iterator[Chunk]
+  def __init__(self, code: str, spans: list[tuple[int, int]], check_bodies: bool) -> None:
+    super().__init__()
+    self.bodies = iter([body_loader(code, start, end, check_bodies) for start, end in spans])
+  def function(self, keyword: Token, params: Params | None, annotation: FuncAnnotation, body: Chunk, name: str | None) -> FuncExpr:
+    return super().function(keyword, params, annotation, next(self.bodies, body), name)
+
+# Building the LALR parser takes a while, so there is only one, around a
+# builder that hands functions to the LazyToAST of the call running in the
+# current context; calls that overlap each have their own.
+builder: ContextVar[LazyToAST] = ContextVar("builder")
+
+class CurrentLazyToAST(ToAST):
+  def function(self, *args: Any) -> FuncExpr:
+    return builder.get().function(*args)
+
+lazy_parser: Lark | None = None
+
+def blank(text: str) -> str:
+  return re.sub(r"[^\n]", " ", text)
+
+def body_loader(code: str, start: int, end: int, check_bodies: bool) -> LazyChunk:
+  def load() -> Chunk:
+    return shift_locations(parse_lazy(code[start:end], check_bodies), start)
+  return LazyChunk(load, check_bodies)
+
+# Parses only the outermost statements of `code`: every function body is
+# blanked out of the text handed to the parser (keeping offsets and line
+# numbers intact) and replaced by a LazyChunk that parses it on first access.
+def parse_lazy(code: str, check_bodies: bool = True) -> Chunk:
+  global lazy_parser
+  if lazy_parser is None:
+    lazy_parser = open_lalr(CurrentLazyToAST())
+  spans = function_bodies(list(lazy_parser.lex(code)))
+  parts: list[str] = []
+  prev = 0
+  for start, end in spans:
+    parts.append(code[prev:start])
+    parts.append(blank(code[start:end]))
+    prev = end
+  parts.append(code[prev:])
+  token = builder.set(LazyToAST(code, spans, check_bodies))
+  try:
+    ast = lazy_parser.parse("".join(parts))
+  finally:
+    builder.reset(token)
+  assert isinstance(ast, Chunk)
+  return place_empty(ast, 0)
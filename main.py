@@ -1,42 +1,103 @@
-from lark import Tree
-from typing import Any
-from parser import parser, ToAST
+from parser import parse_ast, ParserMode
+from lazy import parse_lazy
+from stream import parse_stream
+import ast_cache
+import type_render
+import type_models
+import type_helpers
 from models import *
 from type_models import *
 from infer import *
+from constraints import infer_constraints
 
 import sys
 
 file_path = None
 args = sys.argv[1:]
 is_debug = False
+parser_mode: ParserMode = "lalr"
+signatures_only = False
+use_cache = True
+show_cache_stats = False
+streaming = False
+render_limits: dict[str, int] = {}
+inference = infer
 
 while args:
   if args[0] == "--debug":
     is_debug = True
     _, *args = args
+  elif args[0] == "--earley":
+    parser_mode = "earley"
+    _, *args = args
+  elif args[0] == "--signatures":
+    signatures_only = True
+    _, *args = args
+  elif args[0] == "--no-cache":
+    use_cache = False
+    _, *args = args
+  elif args[0] == "--cache-dir":
+    _, ast_cache.cache_dir, *args = args
+  elif args[0] == "--cache-stats":
+    show_cache_stats = True
+    _, *args = args
+  elif args[0] == "--stream":
+    streaming = True
+    _, *args = args
+  elif args[0] in ("--max-depth", "--max-width", "--max-length"):
+    render_limits[args[0][2:].replace("-", "_")] = int(args[1])
+    _, _, *args = args
+  elif args[0] == "--engine":
+    assert args[1] in ("dict", "union-find"), f"Unknown engine: {args[1]}"
+    type_helpers.engine = args[1]
+    _, _, *args = args
+  elif args[0] == "--no-memo":
+    type_helpers.memo_enabled = False
+    _, *args = args
+  elif args[0] == "--constraints":
+    inference = infer_constraints
+    _, *args = args
+  elif args[0] == "--literal-limit":
+    type_models.literal_limit = int(args[1])
+    _, _, *args = args
   else:
     file_path = args[0]
     _, *args = args
 
 assert file_path is not None
-fp = file_path
-
-with open(file_path) as f:
-  input = f.read()
+type_render.reset_renderer(**render_limits)
 
 def run(code: str) -> None:
-  tree: Tree[Any] = parser.parse(code)
-  ast = ToAST(fp).transform(tree)
-  res = infer(ast, Context({}))
+  assert file_path is not None
+  source = SourceMap(file_path, code)
+  if signatures_only:
+    ast = parse_lazy(code, check_bodies=False)
+  elif use_cache:
+    ast = ast_cache.parse_cached(code, parser_mode)
+  else:
+    ast = parse_ast(code, parser_mode)
+  if show_cache_stats:
+    print(f"ast cache: {ast_cache.hits} hits, {ast_cache.misses} misses", file=sys.stderr)
+  check(ast, source)
+
+def check(ast: Chunk, source: SourceMap) -> None:
+  res = inference(ast, Context({}, source=source))
+  if show_cache_stats:
+    print(f"unify memo: {type_helpers.memo_stats['hits']} hits, {type_helpers.memo_stats['misses']} misses", file=sys.stderr)
   if isinstance(res, UnifyError):
-    print(f"{res.location}: {res.message}")
+    print(f"{render_location(source, res.location)}: {res.message}")
     exit(1)
   if is_debug:
     _, typ = res
-    print(typ)
+    type_render.renderer.write(typ, sys.stdout)
+    print()
   else:
     print(f"No issues found in {file_path}")
 
 if __name__ == "__main__":
-  run(input)
\ No newline at end of file
+  with open(file_path) as f:
+    if streaming:
+      chunk = parse_stream(f, file_path)
+      check(chunk, chunk.source)
+    else:
+      run(f.read())
\ No newline at end of file
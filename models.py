@@ -1,10 +1,11 @@
-from dataclasses import dataclass
-from typing import TypeAlias, Union, Optional, TypeGuard, Any, TYPE_CHECKING
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import TypeAlias, Union, Optional, TypeGuard, Any, Callable, Iterator, TYPE_CHECKING
 
 if TYPE_CHECKING:
   from type_models import MonoType
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Location:
   file: str
   line: int
@@ -12,9 +13,33 @@ class Location:
   def __repr__(self) -> str:
     return f"{self.file}:{self.line}:{self.column}"
 
-@dataclass
+# Nodes only carry the offset of their first character; lines and columns are
+# worked out here when a diagnostic is actually rendered. `text` may be a
+# window of the file starting at offset `start`, line `line`, column `column`.
+@dataclass(slots=True)
+class SourceMap:
+  file: str
+  text: str
+  start: int = 0
+  line: int = 1
+  column: int = 1
+  line_starts: list[int] = field(default_factory=list)
+  def location(self, offset: int) -> Location:
+    if not self.line_starts:
+      self.line_starts = [0] + [i + 1 for i, c in enumerate(self.text) if c == "\n"]
+    offset = max(offset - self.start, 0)
+    line = bisect_right(self.line_starts, offset)
+    if line == 1:
+      return Location(self.file, self.line, self.column + offset)
+    return Location(self.file, self.line + line - 1, offset - self.line_starts[line - 1] + 1)
+  # Moves the window on to `text`, further along the same file.
+  def move(self, text: str, start: int, line: int, column: int, line_starts: Optional[list[int]] = None) -> None:
+    self.text, self.start, self.line, self.column = text, start, line, column
+    self.line_starts = line_starts or []
+
+@dataclass(frozen=True, slots=True)
 class BaseNode:
-  location: Location
+  location: int
 
 Expr: TypeAlias = Union[
   'Var',
@@ -41,102 +66,159 @@ Stmt: TypeAlias = Union[
   'FuncCall',
 ]
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Var(BaseNode):
   name: str
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Number(BaseNode):
   value: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Boolean(BaseNode):
   value: bool
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class String(BaseNode):
   value: str
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Nil(BaseNode): pass
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Vararg(BaseNode): pass
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class UnaryExpr(BaseNode):
   op: str
   value: Expr
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class BinaryExpr(BaseNode):
   left: Expr
   op: str
   right: Expr
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Table(BaseNode):
-  fields: list[tuple[Expr, Expr]]
+  fields: tuple[tuple[Expr, Expr], ...]
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FuncCall(BaseNode):
   func: Expr
-  args: list[Expr]
+  args: tuple[Expr, ...]
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class IndexExpr(BaseNode):
   obj: Expr
   index: Expr
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VarDecl(BaseNode):
-  names: list[str]
-  exprs: list[Expr]
+  names: tuple[str, ...]
+  exprs: tuple[Expr, ...]
   annotation: 'Optional[VarAnnotation]'
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VarAnnotation(BaseNode):
   types: 'MonoType'
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class RevealAnnotation(BaseNode):
   expr: Expr
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VarAssign(BaseNode):
-  names: list[Expr]
-  exprs: list[Expr]
+  names: tuple[Expr, ...]
+  exprs: tuple[Expr, ...]
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FuncExpr(BaseNode):
-  params: list[str]
+  params: tuple[str, ...]
   is_vararg: bool
   body: 'Chunk'
   name: Optional[str]
   annotation: 'FuncAnnotation'
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FuncAnnotation(BaseNode):
   ret_type: Optional['MonoType']
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ReturnStmt(BaseNode):
-  exprs: list[Expr]
+  exprs: tuple[Expr, ...]
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ElseifStmt(BaseNode):
   cond: Expr
   body: 'Chunk'
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class IfStmt(BaseNode):
   cond: Expr
   body: 'Chunk'
-  elseif_stmts: list[ElseifStmt]
+  elseif_stmts: tuple[ElseifStmt, ...]
   else_stmt: Optional['Chunk']
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Chunk(BaseNode):
-  stmts: list[Stmt]
+  stmts: tuple[Stmt, ...]
   last: Optional[ReturnStmt]
 
+
+
+class StreamChunk(Chunk):
+  # The top level of a file read in batches. Iterating `stmts` parses the
+  # file as it goes and lets go of every statement once the consumer moves
+  # past it; `last` is only known after the statements are exhausted, so
+  # unlike the nodes it holds it is filled in as it is read. `source` maps
+  # the batch being read.
+  __setattr__ = object.__setattr__
+  def __init__(self, batches: Iterator[Chunk], source: SourceMap) -> None:
+    self.batches = batches
+    self.source = source
+    self.location = 0
+    self.last = None
+  @property  # type: ignore[override]
+  def stmts(self) -> Iterator[Stmt]:
+    for batch in self.batches:
+      self.location = batch.location
+      self.last = batch.last
+      pending = list(reversed(batch.stmts))
+      del batch
+      while pending:
+        yield pending.pop()
+  def __repr__(self) -> str:
+    return "StreamChunk(<streaming>)"
+
+class LazyChunk(Chunk):
+  # A function body that was only scanned for its extent. It parses itself
+  # the first time any of its fields is read; `check_body` tells `infer`
+  # whether an annotated function may be typed from its signature alone.
+  __setattr__ = object.__setattr__
+  def __init__(self, load: Callable[[], Chunk], check_body: bool = True) -> None:
+    self.load = load
+    self.check_body = check_body
+    self.chunk: Optional[Chunk] = None
+  @property
+  def is_loaded(self) -> bool:
+    return self.chunk is not None
+  def force(self) -> Chunk:
+    if self.chunk is None:
+      self.chunk = self.load()
+    return self.chunk
+  @property  # type: ignore[override]
+  def location(self) -> int:
+    return self.force().location
+  @property  # type: ignore[override]
+  def stmts(self) -> tuple[Stmt, ...]:
+    return self.force().stmts
+  @property  # type: ignore[override]
+  def last(self) -> Optional[ReturnStmt]:
+    return self.force().last
+  def __eq__(self, other: object) -> bool:
+    return self.force() == other
+  def __repr__(self) -> str:
+    if self.chunk is None:
+      return "LazyChunk(<not parsed>)"
+    return repr(self.chunk)
@@ -1,57 +1,95 @@
-from lark import Lark, Transformer, Token, Tree
-from typing import Any, cast
+from dataclasses import replace
+from lark import Lark, Transformer, Transformer_NonRecursive, Token, Tree
+from typing import Any, Literal, Optional, TypeAlias, cast
 from models import *
 from type_models import *
 
 import sys
+import os
 
-parser = Lark.open("grammar.lark")
+ParserMode: TypeAlias = Literal["lalr", "earley"]
 
-def get_loc(file_path: str, node: Token | Tree[Any]) -> Location:
+parsers: dict[str, Lark] = {}
+
+# Lark keys the cache on a hash of the grammar text, the parser options and
+# its own version, so editing grammar.lark rebuilds it on the next run.
+grammar_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammar.lark.cache")
+
+def open_lalr(transformer: Optional[Transformer[Any, Any]] = None) -> Lark:
+  return Lark.open("grammar.lark", rel_to=__file__, parser="lalr", lexer="contextual", cache=grammar_cache_path, transformer=transformer)
+
+def get_parser(mode: ParserMode = "lalr") -> Lark:
+  if mode not in parsers:
+    if mode == "lalr":
+      parsers[mode] = open_lalr()
+    else:
+      parsers[mode] = Lark.open("grammar.lark", rel_to=__file__, parser="earley")
+  return parsers[mode]
+
+def get_loc(node: Token | Tree[Any]) -> int:
   if isinstance(node, Token):
-    assert node.line is not None
-    assert node.column is not None
-    return Location(file_path, node.line, node.column)
+    assert node.start_pos is not None
+    return node.start_pos
   if isinstance(node, Tree):
     if node.meta.empty:
-      return get_loc(file_path, node.children[0])
-    return Location(file_path, node.meta.line, node.meta.column)
+      return get_loc(node.children[0])
+    return node.meta.start_pos
   assert False, f"get_loc: Argument must be either a Token or a Tree, got {node}"
 
-class ToAST(Transformer[Tree[Any], BaseNode]):
-  def __init__(self, file_path: str):
-    self.file_path = file_path
+Params: TypeAlias = tuple[tuple[str, ...], bool, int | None]
+
+def intern(token: Token) -> str:
+  return sys.intern(str(token.value))
+
+# An empty chunk has no token of its own; the enclosing rule gives it the
+# position of the keyword that opens it.
+def place_empty(chunk: Chunk, loc: int) -> Chunk:
+  if not isinstance(chunk, LazyChunk) and chunk.location < 0:
+    return replace(chunk, location=loc)
+  return chunk
+
+# Builds the AST from the parse tree's rules. It keeps no state of its own:
+# one instance is shared by every parse through the LALR parser below, so a
+# parse may start while another one is running (from another thread, or from
+# code the first one calls) and neither sees the other's nodes. Subclasses
+# must keep that property; anything a single parse needs goes elsewhere.
+class ToAST(Transformer_NonRecursive[Tree[Any], BaseNode]):
+  def params(self, args: list[Token | BaseNode | None]) -> Params:
+    param_strs: list[str] = []
+    is_vararg: bool = False
+    loc: int | None = None
+    for param in args:
+      if isinstance(param, Token) and param.type == "NAME":
+        if loc is None:
+          loc = get_loc(param)
+        param_strs.append(intern(param))
+      elif param is not None:
+        is_vararg = True
+    return tuple(param_strs), is_vararg, loc
   def chunk(self, args: list[Stmt | ReturnStmt]) -> BaseNode:
     stmts: list[Stmt] = []
     ret: ReturnStmt | None = None
-    loc: Location | None = None
+    loc: int | None = None
     for arg in args:
       if isinstance(arg, ReturnStmt):
         ret = arg
       elif arg:
         stmts.append(arg)
-        loc = loc or arg.location
-    return Chunk(loc or Location(self.file_path, 0, 0), stmts, ret)
-  def func_expr(self, args: tuple[Tree[Any] | None, FuncAnnotation, Chunk]) -> BaseNode:
-    params, annotation, body = args
-    param_strs: list[str] = []
-    is_vararg: bool = False
-    loc: Location | None = None
-    if not params: pass
-    elif len(params.children) == 2:
-      is_vararg = params.children[1] is not None
-      ps = params.children[0]
-      for param in ps.children:
-        assert isinstance(param, Token)
-        if not loc:
-          loc = get_loc(self.file_path, param)
-        assert isinstance(param.value, str)
-        param_strs.append(param.value)
-    else:
-      is_vararg = params.children[0] is not None
-    if not loc:
-      loc = Location(self.file_path, 0, 0)
-    return FuncExpr(loc, param_strs, is_vararg, body, None, annotation)
+        if loc is None:
+          loc = arg.location
+    if loc is None:
+      loc = ret.location if ret else -1
+    return Chunk(loc, tuple(stmts), ret)
+  def function(self, keyword: Token, params: Params | None, annotation: FuncAnnotation, body: Chunk, name: str | None) -> FuncExpr:
+    param_strs, is_vararg, loc = params or ((), False, None)
+    if loc is None:
+      loc = get_loc(keyword)
+    if annotation.location < 0:
+      annotation = replace(annotation, location=get_loc(keyword))
+    return FuncExpr(loc, param_strs, is_vararg, place_empty(body, get_loc(keyword)), name, annotation)
+  def func_expr(self, args: tuple[Token, Params | None, FuncAnnotation, Chunk]) -> BaseNode:
+    keyword, params, annotation, body = args
+    return self.function(keyword, params, annotation, body, None)
   
   def if_stmt(self, args: tuple[Expr, Chunk, Tree[Any], Tree[Any] | None]) -> BaseNode:
     cond, body, elseif_stmts, else_stmt = args
@@ -61,100 +99,73 @@ class ToAST(Transformer[Tree[Any], BaseNode]):
       elseif_cond, elseif_body = elseif.children
       assert is_expr(elseif_cond)
       assert isinstance(elseif_body, Chunk) 
-      elifs.append(ElseifStmt(elseif_cond.location, elseif_cond, elseif_body))
+      elifs.append(ElseifStmt(elseif_cond.location, elseif_cond, place_empty(elseif_body, elseif_cond.location)))
     else_chunk: Chunk | None = None
     if else_stmt:
-      chunk = else_stmt.children[0]
+      keyword, chunk = else_stmt.children
+      assert isinstance(keyword, Token)
       assert isinstance(chunk, Chunk)
-      else_chunk = chunk
-    return IfStmt(cond.location, cond, body, elifs, else_chunk)
-  def return_stmt(self, args: tuple[Tree[Any]]) -> BaseNode:
-    exprs = args[0]
+      else_chunk = place_empty(chunk, get_loc(keyword))
+    return IfStmt(cond.location, cond, place_empty(body, cond.location), tuple(elifs), else_chunk)
+  def return_stmt(self, args: tuple[Token, Tree[Any]]) -> BaseNode:
+    keyword, exprs = args
     expr_exprs: list[Expr] = []
-    loc: Location | None = None
+    loc: int | None = None
     exprs = exprs or Tree("exprs", [])
     for expr in exprs.children:
       assert is_expr(expr)
       expr_exprs.append(expr)
-      if not loc:
+      if loc is None:
         loc = expr.location
-    if not loc:
-      loc = Location(self.file_path, 0, 0)
-    return ReturnStmt(loc, expr_exprs)
-  def func_assign(self, args: tuple[Token, Tree[Any] | None, FuncAnnotation, Chunk]) -> BaseNode:
-    name, params, annotation, body = args
-    param_strs: list[str] = []
-    is_vararg: bool = False
-    loc: Location | None = None
-    if not params: pass
-    elif len(params.children) == 2:
-      is_vararg = params.children[1] is not None
-      ps = params.children[0]
-      for param in ps.children:
-        assert isinstance(param, Token)
-        if not loc:
-          loc = get_loc(self.file_path, param)
-        assert isinstance(param.value, str)
-        param_strs.append(param.value)
-    else:
-      is_vararg = params.children[0] is not None
-    if not loc:
-      loc = Location(self.file_path, 0, 0)
-    return VarAssign(get_loc(self.file_path, name), [Var(get_loc(self.file_path, name), name.value)], [FuncExpr(loc, param_strs, is_vararg, body, name.value, annotation)])
-  def func_decl(self, args: tuple[Token, Tree[Any] | None, FuncAnnotation, Chunk]) -> BaseNode:
-  
-    name, params, annotation, body = args
-    param_strs: list[str] = []
-    is_vararg: bool = False
-    loc: Location | None = None
-    if not params: pass
-    elif len(params.children) == 2:
-      is_vararg = params.children[1] is not None
-      ps = params.children[0]
-      for param in ps.children:
-        assert isinstance(param, Token)
-        if not loc:
-          loc = get_loc(self.file_path, param)
-        assert isinstance(param.value, str)
-        param_strs.append(param.value)
-    else:
-      is_vararg = params.children[0] is not None
-    if not loc:
-      loc = Location(self.file_path, 0, 0)
-    return VarDecl(get_loc(self.file_path, name), [name.value], [FuncExpr(loc, param_strs, is_vararg, body, name.value, annotation)], None)
+    if loc is None:
+      loc = get_loc(keyword)
+    return ReturnStmt(loc, tuple(expr_exprs))
+  def func_assign(self, args: tuple[Token, Token, Params | None, FuncAnnotation, Chunk]) -> BaseNode:
+    keyword, name, params, annotation, body = args
+    name_str = intern(name)
+    func = self.function(keyword, params, annotation, body, name_str)
+    return VarAssign(get_loc(name), (Var(get_loc(name), name_str),), (func,))
+  def func_decl(self, args: tuple[Token, Token, Params | None, FuncAnnotation, Chunk]) -> BaseNode:
+    keyword, name, params, annotation, body = args
+    name_str = intern(name)
+    func = self.function(keyword, params, annotation, body, name_str)
+    return VarDecl(get_loc(name), (name_str,), (func,), None)
   def var_assign(self, args: tuple[Tree[Any], Tree[Any]]) -> BaseNode:
     names, exprs = args
     name_strs: list[Expr] = []
     expr_exprs: list[Expr] = []
     for name in names.children:
-      if isinstance(name, str):
-        name = Var(Location(self.file_path, 0, 0), name)
+      if isinstance(name, Token):
+        name = Var(get_loc(name), intern(name))
       assert is_expr(name)
       name_strs.append(name)
     for expr in exprs.children:
       assert is_expr(expr)
       expr_exprs.append(expr)
-    return VarAssign(expr_exprs[0].location, name_strs, expr_exprs)
+    return VarAssign(expr_exprs[0].location, tuple(name_strs), tuple(expr_exprs))
   def var_decl(self, args: tuple[Optional[VarAnnotation], Tree[Any], Tree[Any]]) -> BaseNode:
     annotation, names, exprs = args
     name_strs: list[str] = []
     expr_exprs: list[Expr] = []
     for name in names.children:
       assert isinstance(name, Token)
-      assert isinstance(name.value, str)
-      name_strs.append(name.value)
+      name_strs.append(intern(name))
     for expr in exprs.children:
       assert is_expr(expr)
       expr_exprs.append(expr)
-    return VarDecl(expr_exprs[0].location, name_strs, expr_exprs, annotation)
+    return VarDecl(expr_exprs[0].location, tuple(name_strs), tuple(expr_exprs), annotation)
   def func_annotations(self, args: list[Tree[Any]]) -> FuncAnnotation:
     ret = None
+    loc = -1
     for arg in args:
       if arg.data == "return_type_annotation":
-        ret = cast(MonoType, arg.children[0])
-    return FuncAnnotation(Location(self.file_path, 0, 0), ret)
-  def var_type_annotation(self, args: tuple[MonoType]) -> VarAnnotation:
-    return VarAnnotation(Location(self.file_path, 0, 0), args[0])
+        keyword, typ = arg.children
+        assert isinstance(keyword, Token)
+        loc = get_loc(keyword)
+        ret = cast(MonoType, typ)
+    return FuncAnnotation(loc, ret)
+  def var_type_annotation(self, args: tuple[Token, MonoType]) -> VarAnnotation:
+    return VarAnnotation(get_loc(args[0]), args[1])
   def reveal_annotation(self, args: tuple[Expr]) -> RevealAnnotation:
     return RevealAnnotation(args[0].location, args[0])
   def index_expr(self, args: tuple[Expr, Expr]) -> BaseNode:
@@ -162,31 +173,35 @@ class ToAST(Transformer[Tree[Any], BaseNode]):
     return IndexExpr(obj.location, obj, index)
   def prop_expr(self, args: tuple[Expr, Token]) -> BaseNode:
     obj, prop = args
-    return IndexExpr(obj.location, obj, String(obj.location, str(prop.value)))
+    return IndexExpr(obj.location, obj, String(obj.location, intern(prop)))
   def func_call(self, args: tuple[Expr, Tree[Any]]) -> BaseNode:
     func, arguments = args
     expr_args: list[Expr] = []
     for arg in arguments.children:
       assert is_expr(arg)
       expr_args.append(arg)
-    return FuncCall(func.location, func, expr_args)
-  def table(self, args: list[Tree[Any]]) -> BaseNode:
+    return FuncCall(func.location, func, tuple(expr_args))
+  def table(self, args: list[Token | Tree[Any]]) -> BaseNode:
+    brace, *table_fields = args
+    assert isinstance(brace, Token)
     fields: list[tuple[Expr, Expr]] = []
     i: float = 1.0
-    location: Location | None = None
-    for field in args:
-      loc: Location | None = None
+    location: int | None = None
+    for field in table_fields:
+      assert isinstance(field, Tree)
+      loc: int | None = None
       if field.data == "table_field":
         expr = field.children[0]
         assert is_expr(expr)
         loc = expr.location
         fields.append((Number(expr.location, i), expr))
+        i += 1.0
       elif field.data == "obj_field":
         prop, expr = field.children
         assert isinstance(prop, Token)
         assert is_expr(expr)
-        fields.append((String(get_loc(self.file_path, prop), prop.value),  expr))
-        loc = get_loc(self.file_path, prop)
+        fields.append((String(get_loc(prop), intern(prop)), expr))
+        loc = get_loc(prop)
       elif field.data == "dict_field":
         key, expr = field.children
         assert is_expr(key)
@@ -194,12 +209,11 @@ class ToAST(Transformer[Tree[Any], BaseNode]):
         loc = key.location
         fields.append((key, expr))
       else: assert False, f"Unknown field type: {field.data}"
-      if not location:
+      if location is None:
         location = loc
-      i += 1.0
-    if not location:
-      location = Location(self.file_path, 0, 0)
-    return Table(location, fields)
+    if location is None:
+      location = get_loc(brace)
+    return Table(location, tuple(fields))
   def binary_expr(self, args: tuple[Expr, Token, Expr]) -> BaseNode:
     left, op, right = args
     return BinaryExpr(left.location, left, op.value, right)
@@ -211,16 +225,17 @@ class ToAST(Transformer[Tree[Any], BaseNode]):
   pow_expr = binary_expr
   def unary_expr(self, args: tuple[Token, Expr]) -> BaseNode:
     op, expr = args
-    return UnaryExpr(get_loc(self.file_path, op), op.value, expr)
+    return UnaryExpr(get_loc(op), op.value, expr)
   def var(self, args: tuple[Token]) -> BaseNode:
-    return Var(get_loc(self.file_path, args[0]), args[0].value)
+    return Var(get_loc(args[0]), intern(args[0]))
   def union_type(self, args: tuple[MonoType, MonoType]) -> MonoType:
     return UnionType(args[0], args[1])
   def type_var(self, args: tuple[Token]) -> TypeVariable:
     return TypeVariable(args[0].value)
   def tuple_type(self, args: list[MonoType]) -> MonoType:
-    return TypeConstructor("tuple", args, None, [])
-  def PRIMITIVE_TYPE(self, token: Token) -> MonoType:
+    return TypeConstructor("tuple", args, None)
+  def primitive_type(self, args: tuple[Token]) -> MonoType:
+    token = args[0]
     if token.value == "number":
       return NumberType
     elif token.value == "string":
@@ -230,15 +245,34 @@ class ToAST(Transformer[Tree[Any], BaseNode]):
     elif token.value == "nil":
       return NilType
     assert False
-  def ELLIPSIS(self, token: Token) -> BaseNode:
-    return Vararg(get_loc(self.file_path, token))
-  def NIL(self, token: Token) -> BaseNode:
-    return Nil(get_loc(self.file_path, token))
-  def BOOLEAN(self, token: Token) -> BaseNode:
-    return Boolean(get_loc(self.file_path, token), token.value == "true")
-  def STRING(self, token: Token) -> BaseNode:
-    return String(get_loc(self.file_path, token), token.value[1:-1])
-  def NUMBER(self, token: Token) -> BaseNode:
-    return Number(get_loc(self.file_path, token), float(token.value))
+  def vararg(self, args: tuple[Token]) -> BaseNode:
+    return Vararg(get_loc(args[0]))
+  def nil(self, args: tuple[Token]) -> BaseNode:
+    return Nil(get_loc(args[0]))
+  def boolean(self, args: tuple[Token]) -> BaseNode:
+    return Boolean(get_loc(args[0]), args[0].value == "true")
+  def string(self, args: tuple[Token]) -> BaseNode:
+    return String(get_loc(args[0]), sys.intern(args[0].value[1:-1]))
+  def number(self, args: tuple[Token]) -> BaseNode:
+    return Number(get_loc(args[0]), float(args[0].value))
+
+# Literals are reduced through rules rather than terminal callbacks, so a
+# ToAST instance can run inside the LALR parser: every rule callback fires as
+# its production reduces and no intermediate Tree is kept. Building the
+# parser takes a while, so it is built once, around this one instance; each
+# parse has a parser state of its own in Lark, and ToAST has none, which
+# keeps parsing reentrant.
+ast_builder = ToAST()
 
+def get_ast_parser() -> Lark:
+  if "lalr-ast" not in parsers:
+    parsers["lalr-ast"] = open_lalr(ast_builder)
+  return parsers["lalr-ast"]
 
+def parse_ast(code: str, mode: ParserMode = "lalr") -> Chunk:
+  if mode == "earley":
+    ast = ToAST().transform(get_parser(mode).parse(code))
+  else:
+    ast = get_ast_parser().parse(code)
+  assert isinstance(ast, Chunk)
+  return place_empty(ast, 0)
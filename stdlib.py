@@ -3,10 +3,10 @@ from models import *
 from type_models import *
 
 def fn(params: MonoType, returns: MonoType, var: MonoType) -> MonoType:
-  return TypeConstructor("function", [params, returns, var], None, [])
+  return TypeConstructor("function", [params, returns, var], None)
 
 def tup(*types: MonoType) -> MonoType:
-  return TypeConstructor("tuple", list(types), None, [])
+  return TypeConstructor("tuple", list(types), None)
 
 var = TypeVariable
 
@@ -15,7 +15,7 @@ type_a = new_type_var()
 print_a = new_type_var()
 
 ctx: Context = Context({
-  "tostring": ForallType(tostring_a.name, fn(tup(tostring_a), tup(StringType), NilType)),
-  "type": ForallType(type_a.name, fn(tup(type_a), tup(StringType), NilType)),
-  "print": ForallType(print_a.name, TypeConstructor("function", [tup(), tup(StringType), print_a], True, [])),
+  "tostring": ForallType([tostring_a.name], fn(tup(tostring_a), tup(StringType), NilType)),
+  "type": ForallType([type_a.name], fn(tup(type_a), tup(StringType), NilType)),
+  "print": ForallType([print_a.name], TypeConstructor("function", [tup(), tup(StringType), print_a], True)),
 })
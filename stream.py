@@ -0,0 +1,218 @@
+from dataclasses import replace
+from typing import Iterator, TextIO
+from lark import Token
+from lark.exceptions import UnexpectedInput
+from models import *
+from parser import get_ast_parser, parse_ast
+from incremental import StatementScanner, shift_locations
+
+block_size = 2**16
+
+# Where the text after `text` starts, given where `text` starts.
+def advance(line: int, column: int, text: str) -> tuple[int, int]:
+  newlines = text.count("\n")
+  if newlines:
+    return line + newlines, len(text) - text.rfind("\n")
+  return line, column + len(text)
+
+def line_starts(text: str, start: int) -> Iterator[int]:
+  i = text.find("\n")
+  while i >= 0:
+    yield start + i + 1
+    i = text.find("\n", i + 1)
+
+# The fields of a trailing `return { ... }` so far. Each field is parsed on
+# its own, as the only field of a table, once the `,` after it is read, and
+# only the parsed field is kept.
+class ReturnTable:
+  brace: int
+  fields: list[tuple[Expr, Expr]]
+  positions: int
+  field_start: int
+  # The first two tokens of the field being read, which tell a positional
+  # field from a `name = value` or `[key] = value` one.
+  head: list[Token]
+  end: int | None
+  def __init__(self, brace: Token, offset: int) -> None:
+    assert brace.start_pos is not None and brace.end_pos is not None
+    self.brace = offset + brace.start_pos
+    self.fields = []
+    self.positions = 0
+    self.field_start = offset + brace.end_pos
+    self.head = []
+    self.end = None
+
+  def add_field(self, text: str) -> None:
+    if text.strip():
+      prefix = "return {"
+      ret = parse_ast(prefix + text + "}").last
+      assert ret is not None and isinstance(ret.exprs[0], Table)
+      key, value = shift_locations(ret.exprs[0].fields[0], self.field_start - len(prefix))
+      positional = not self.head or not (self.head[0].value == "[" or (self.head[0].type == "NAME" and len(self.head) > 1 and self.head[1].value == "="))
+      if positional:
+        self.positions += 1
+        key = Number(key.location, float(self.positions))
+      self.fields.append((key, value))
+    self.head = []
+
+  def table(self) -> Table:
+    return Table(self.fields[0][0].location if self.fields else self.brace, tuple(self.fields))
+
+# Turns the text after the table's closing brace (`tail`, starting at
+# `start`) into the expressions of the return statement.
+def return_exprs(table: Table, tail: str, start: int) -> tuple[Expr, ...]:
+  if not tail.strip():
+    return (table,)
+  if tail.lstrip().startswith(","):
+    prefix = "return"
+    ret = parse_ast(prefix + tail.replace(",", " ", 1)).last
+    assert ret is not None
+    return (table,) + shift_locations(ret.exprs, start - len(prefix))
+  # The table is the left operand of a binary expression; it is parsed with
+  # an empty table in its place.
+  prefix = "return {}"
+  ret = parse_ast(prefix + tail).last
+  assert ret is not None
+  first = shift_locations(ret.exprs[0], start - len(prefix))
+  chain: list[BinaryExpr] = []
+  while isinstance(first, BinaryExpr):
+    chain.append(first)
+    first = first.left
+  assert isinstance(first, Table) and not first.fields
+  expr: Expr = table
+  for node in reversed(chain):
+    expr = replace(node, location=table.location, left=expr)
+  return (expr,) + shift_locations(ret.exprs[1:], start - len(prefix))
+
+# Reads a file a block at a time and parses it in batches of whole top-level
+# statements. Only whole lines are lexed, so no token is cut by a block
+# boundary, and each one is lexed once: the scanner keeps its state between
+# blocks. Everything before a top-level `return` is parsed as soon as the
+# `return` is read; the return itself ends the file, and a table it returns
+# is parsed a field at a time.
+class BatchReader:
+  source: SourceMap
+  scanner: StatementScanner
+  buffer: str
+  base: int
+  lexed: int
+  line: int
+  column: int
+  ret: int | None
+  dropped: int
+  ret_position: tuple[int, int]
+  ret_lines: list[int]
+  table: ReturnTable | None
+  expect_table: bool
+  def __init__(self, file_path: str) -> None:
+    # Maps the batch last read, which is the one being checked.
+    self.source = SourceMap(file_path, "")
+    self.scanner = StatementScanner()
+    # The text read from `base` on, which starts at `line`, `column`;
+    # `lexed` is where lexing resumes.
+    self.buffer = ""
+    self.base = 0
+    self.lexed = 0
+    self.line, self.column = 1, 1
+    self.ret = None
+    self.dropped = 0
+    self.ret_position = (1, 1)
+    self.ret_lines = [0]
+    self.table = None
+    self.expect_table = False
+
+  def read(self, f: TextIO) -> Iterator[Chunk]:
+    at_eof = False
+    while not at_eof:
+      block = f.read(block_size)
+      at_eof = not block
+      self.buffer += block
+      if at_eof:
+        cut = self.base + len(self.buffer)
+      else:
+        cut = self.base + self.buffer.rfind("\n", self.lexed - self.base) + 1
+      if cut > self.lexed:
+        yield from self.lex(cut, at_eof)
+      if self.table is not None:
+        self.trim()
+      if self.ret is None:
+        end = self.base + len(self.buffer) if at_eof else self.scanner.start
+        if end is not None and end > self.base:
+          yield self.batch(end)
+    if self.ret is not None:
+      yield self.last()
+
+  def lex(self, cut: int, at_eof: bool) -> Iterator[Chunk]:
+    offset = self.lexed
+    text = self.buffer[offset - self.base:cut - self.base]
+    try:
+      for token in get_ast_parser().lex(text):
+        self.scanner.step(token, offset)
+        assert token.start_pos is not None and token.end_pos is not None
+        if self.ret is None:
+          if token.value == "return" and self.scanner.start == offset + token.start_pos:
+            if self.scanner.start > self.base:
+              yield self.batch(self.scanner.start)
+            self.ret = self.dropped = self.scanner.start
+            self.ret_position = (self.line, self.column)
+            self.expect_table = True
+        elif self.expect_table:
+          self.expect_table = False
+          if token.value == "{":
+            self.table = ReturnTable(token, offset)
+        elif self.table is not None and self.table.end is None:
+          start = offset + token.start_pos
+          if self.scanner.depth == 1 and token.value == ",":
+            self.table.add_field(self.buffer[self.table.field_start - self.base:start - self.base])
+            self.table.field_start = offset + token.end_pos
+            self.drop(self.table.field_start)
+          elif self.scanner.depth == 0 and token.value == "}":
+            self.table.add_field(self.buffer[self.table.field_start - self.base:start - self.base])
+            self.table.end = offset + token.end_pos
+            self.drop(self.table.end)
+          elif len(self.table.head) < 2:
+            self.table.head.append(token)
+      self.lexed = cut
+    except UnexpectedInput as e:
+      # A string running past the cut; it is lexed again with more text.
+      # At the end of the file the parser reports the error.
+      self.lexed = cut if at_eof else offset + e.pos_in_stream
+
+  # Lets go of the text of the returned table up to `end`, remembering only
+  # where its lines start. The buffer itself is cut once per block.
+  def drop(self, end: int) -> None:
+    assert self.ret is not None
+    text = self.buffer[self.dropped - self.base:end - self.base]
+    self.ret_lines.extend(line_starts(text, self.dropped - self.ret))
+    self.line, self.column = advance(self.line, self.column, text)
+    self.dropped = end
+
+  def trim(self) -> None:
+    self.buffer = self.buffer[self.dropped - self.base:]
+    self.base = self.dropped
+
+  def batch(self, end: int) -> Chunk:
+    text, self.buffer = self.buffer[:end - self.base], self.buffer[end - self.base:]
+    offset = self.base
+    chunk = parse_ast(text)
+    chunk = replace(shift_locations(chunk, offset) if offset else chunk, location=offset)
+    self.source.move(text, offset, self.line, self.column)
+    self.line, self.column = advance(self.line, self.column, text)
+    self.base = end
+    return chunk
+
+  def last(self) -> Chunk:
+    assert self.ret is not None
+    if self.table is None or self.table.end is None:
+      return self.batch(self.base + len(self.buffer))
+    tail = self.buffer
+    self.drop(self.base + len(tail))
+    self.trim()
+    exprs = return_exprs(self.table.table(), tail, self.table.end)
+    line, column = self.ret_position
+    self.source.move("", self.ret, line, column, self.ret_lines)
+    return Chunk(self.ret, (), ReturnStmt(exprs[0].location, exprs))
+
+def parse_stream(f: TextIO, file_path: str) -> StreamChunk:
+  reader = BatchReader(file_path)
+  return StreamChunk(reader.read(f), reader.source)
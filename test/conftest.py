@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import the checker's modules straight from the repository, as
+# the benchmarks do through bench/paths.py.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
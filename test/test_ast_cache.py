@@ -0,0 +1,63 @@
+import os
+import ast_cache
+from parser import parse_ast
+
+code = """local function add(a, b)
+  return a + b
+end
+local t = { name = "x", value = add(1, 2) }
+return t
+"""
+
+def use_dir(path: str, monkeypatch) -> None:
+  monkeypatch.setattr(ast_cache, "cache_dir", path)
+  monkeypatch.setattr(ast_cache, "hits", 0)
+  monkeypatch.setattr(ast_cache, "misses", 0)
+
+def test_hit_returns_same_ast(tmp_path, monkeypatch) -> None:
+  use_dir(str(tmp_path), monkeypatch)
+  first = ast_cache.parse_cached(code)
+  second = ast_cache.parse_cached(code)
+  assert (ast_cache.hits, ast_cache.misses) == (1, 1)
+  assert first == second == parse_ast(code)
+
+def test_corrupt_entry_is_a_miss(tmp_path, monkeypatch) -> None:
+  use_dir(str(tmp_path), monkeypatch)
+  ast_cache.parse_cached(code)
+  with open(ast_cache.entry_path(ast_cache.cache_key(code, "lalr")), "wb") as f:
+    f.write(b"garbage")
+  assert ast_cache.parse_cached(code) == parse_ast(code)
+  assert (ast_cache.hits, ast_cache.misses) == (0, 2)
+
+def test_eviction_keeps_cache_bounded(tmp_path, monkeypatch) -> None:
+  use_dir(str(tmp_path), monkeypatch)
+  ast_cache.parse_cached(code)
+  size = sum(e.stat().st_size for e in ast_cache.entries())
+  monkeypatch.setattr(ast_cache, "max_cache_bytes", size * 3)
+  for i in range(10):
+    ast_cache.parse_cached(f"local v{i} = {i}\n" + code)
+  assert len(ast_cache.entries()) <= 3
+  assert os.path.exists(ast_cache.entry_path(ast_cache.cache_key("local v9 = 9\n" + code, "lalr")))
+
+def test_store_under_limit_does_not_scan(tmp_path, monkeypatch) -> None:
+  use_dir(str(tmp_path), monkeypatch)
+  scans = []
+  monkeypatch.setattr(ast_cache, "entries", lambda: scans.append(1) or [])
+  for i in range(10):
+    ast_cache.parse_cached(f"local v{i} = {i}\n" + code)
+  assert not scans
+  assert ast_cache.read_size() > 0
+
+def test_evict_skips_vanished_entries(tmp_path, monkeypatch) -> None:
+  use_dir(str(tmp_path), monkeypatch)
+  ast_cache.parse_cached(code)
+  found = ast_cache.entries()
+  os.remove(found[0].path)
+  monkeypatch.setattr(ast_cache, "entries", lambda: found)
+  monkeypatch.setattr(ast_cache, "max_cache_bytes", 0)
+  ast_cache.evict()
+  assert ast_cache.read_size() == 0
+
+def test_default_dir_follows_xdg(tmp_path, monkeypatch) -> None:
+  monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+  assert ast_cache.default_cache_dir() == os.path.join(str(tmp_path), "typelua")
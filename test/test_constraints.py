@@ -0,0 +1,62 @@
+from util import run_test
+from type_models import *
+from parser import parse_ast
+from infer import infer
+from constraints import infer_constraints
+from type_render import Renderer
+from test_parser_modes import collect_programs
+
+def test_engines_agree() -> None:
+  def render(engine, code: str) -> str:
+    res = engine(parse_ast(code), Context({}))
+    return repr(res) if not isinstance(res, tuple) else Renderer().render(res[1])
+  for code in collect_programs():
+    assert render(infer_constraints, code) == render(infer, code), code
+
+def test_constraints_flag() -> None:
+  code = """
+    local function apply(f, x)
+      return f(x)
+    end
+    local t = { n = 1 }
+    if type(t.n) == "number" then
+      t.n = t.n + 1
+    end
+    return apply(function(v) return v .. "!" end, "a"), t
+  """
+  assert run_test(code, "--constraints") == run_test(code)
+
+def test_annotations_are_checked_where_they_are() -> None:
+  code = """
+    local function f(x)
+      --@type number
+      local y = x
+      return x + 1
+    end
+    return f
+  """
+  assert "Type mismatch between annotation `number` and `y`" in run_test(code)
+  assert run_test(code, "--constraints") == run_test(code)
+
+def test_conditions_do_not_constrain_operands() -> None:
+  code = """
+    local function f(x)
+      if x == nil then
+        return 1
+      end
+      return x
+    end
+    return f(5)
+  """
+  assert run_test(code, "--constraints") == run_test(code) == "number"
+  code = """
+    local function f(a, b)
+      if a then
+        return a
+      else
+        return b
+      end
+    end
+    return f
+  """
+  assert run_test(code, "--constraints") == run_test(code) == "('a, 'b) -> 'b"
@@ -0,0 +1,37 @@
+from util import run_test
+from type_models import *
+
+def test_scopes_share_outer_bindings() -> None:
+  number = TypeConstructor("number", [], None)
+  string = TypeConstructor("string", [], None)
+  outer = Context({"x": number})
+  then, other = outer.child(), outer.child()
+  then.mapping["y"] = string
+  other.mapping["x"] = string
+  assert then.mapping["x"] is number and other.mapping["x"] is string
+  assert "y" in then.mapping and "y" not in other.mapping and "y" not in outer.mapping
+  outer.mapping["z"] = number
+  assert outer.child().mapping.get("z") is number
+
+def test_recursive_names_are_scoped() -> None:
+  outer = Context({})
+  inner = outer.child()
+  outer.recursive_fns.add("f")
+  inner.recursive_fns.add("g")
+  assert "f" in inner.recursive_fns and "g" in inner.recursive_fns
+  assert "g" not in outer.recursive_fns
+
+def test_branches_see_enclosing_locals() -> None:
+  assert run_test(
+    """
+      local x = 1
+      local function f(b)
+        if b then
+          local y = x
+          return y
+        else
+          return x
+        end
+      end
+      return f(true)
+    """) == "1"
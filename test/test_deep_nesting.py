@@ -0,0 +1,27 @@
+from util import run_test
+from parser import parse_ast
+
+depth = 1200
+
+def test_long_concatenation() -> None:
+  assert run_test("local s = \"a\"" + " .. \"a\"" * depth + "\nreturn #s\n") == "number"
+
+def test_nested_ifs() -> None:
+  assert run_test("local x = 1\n" + "if x > 0 then\n" * depth + "x = 2\n" + "end\n" * depth + "return x\n") == "1?"
+
+def test_nested_tables() -> None:
+  assert run_test("local t = " + "{ 1, " * depth + "\"leaf\"" + " }" * depth + "\nreturn t[1]\n") == "1"
+
+def test_merged_nested_tables() -> None:
+  table = lambda leaf: "{ " * depth + leaf + " }" * depth
+  code = "local x = 1\nif x > 0 then\nreturn " + table("1") + "\nelse\nreturn " + table("2") + "\nend\n"
+  assert run_test(code) == "number" + "[]" * depth
+
+def test_narrowed_nested_functions() -> None:
+  func = lambda leaf: "function() return " * depth + leaf + " end" * depth
+  code = "local f = " + func("1") + "\nlocal g = " + func("1") + "\nif f == g then\nreturn f\nend\nreturn g\n"
+  assert run_test(code).startswith("() -> " * depth)
+
+def test_earley_transform_is_not_recursive() -> None:
+  chunk = parse_ast("local s = \"a\"" + " .. \"a\"" * depth + "\n", "earley")
+  assert len(chunk.stmts) == 1
@@ -0,0 +1,29 @@
+from util import run_test
+from type_models import *
+from type_helpers import generalize, new_type_var
+
+def test_levels_decide_generalization() -> None:
+  bound, fresh = new_type_var(), new_type_var()
+  outer = Context({"x": bound})
+  inner = outer.child()
+  inner.mapping["y"] = TypeConstructor("tuple", [fresh], None)
+  assert (bound.level, fresh.level) == (0, 1)
+  pair = TypeConstructor("tuple", [bound, fresh], None)
+  assert generalize(pair, inner) is pair
+  assert generalize(pair, outer) is ForallType([fresh.name], pair)
+
+def test_captured_variables_stay_monomorphic() -> None:
+  assert run_test(
+    """
+      local function id(x)
+        return x
+      end
+      local function const(p)
+        local q = p
+        local function get(r)
+          return q
+        end
+        return get
+      end
+      return id(1), id("a"), const(true)
+    """) == "(number, string, 'a -> boolean)"
@@ -23,3 +23,30 @@ def test_type_refinement() -> None:
       end
       return 0
     """) == "number"
+
+def test_narrowing_through_and() -> None:
+  assert run_test(
+    """
+      local f = function()
+        if true then return 1 else return "a" end
+      end
+      local a = f()
+      local b = f()
+      if type(a) == "number" and type(b) == "string" then
+        return a, b
+      end
+      return 0, ""
+    """) == "(number, string)"
+
+def test_narrowing_through_local() -> None:
+  assert run_test(
+    """
+      local unknown = (function()
+        if true then return 1 else return "a" end
+      end)()
+      local isnumber = type(unknown) == "number"
+      if isnumber then
+        return unknown
+      end
+      return 0
+    """) == "number"
@@ -0,0 +1,40 @@
+from parser import parse_ast
+from incremental import reparse, TextEdit
+
+code = """local function add(a, b)
+  return a + b
+end
+local x = add(1, 2)
+local y = "hello"
+if x > 2 then
+  y = "world"
+end
+return x, y
+"""
+
+def apply(edit: TextEdit) -> None:
+  old = parse_ast(code)
+  new_code = code[:edit.start] + edit.text + code[edit.end:]
+  assert reparse(old, code, edit) == parse_ast(new_code)
+
+def test_edit_inside_function() -> None:
+  start = code.index("a + b")
+  apply(TextEdit(start, start + 5, "a * b\n  "))
+
+def test_insert_statement() -> None:
+  start = code.index("local y")
+  apply(TextEdit(start, start, "local z = {1, 2}\nz[1] = 3\n"))
+
+def test_delete_statement() -> None:
+  start = code.index("local y")
+  apply(TextEdit(start, code.index("if x"), ""))
+
+def test_edit_changing_statement_split() -> None:
+  start = code.index("add(1, 2)")
+  apply(TextEdit(start, start + len("add(1, 2)"), "add\n(1)(2)"))
+
+def test_old_chunk_is_unchanged() -> None:
+  old = parse_ast(code)
+  start = code.index("local y")
+  reparse(old, code, TextEdit(start, start, "local z = 1\n"))
+  assert old == parse_ast(code)
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+from util import run_test
+from parser import parse_ast
+from lazy import parse_lazy
+from test_parser_modes import collect_programs
+
+def test_lazy_matches_eager() -> None:
+  for code in collect_programs():
+    assert parse_lazy(code) == parse_ast(code), code
+
+def test_lazy_parses_run_at_once() -> None:
+  programs = collect_programs()
+  with ThreadPoolExecutor(8) as pool:
+    chunks = list(pool.map(parse_lazy, programs * 4))
+  assert chunks == [parse_ast(code) for code in programs] * 4
+
+def test_nested_bodies_parse_on_access() -> None:
+  code = """
+    local function outer(a)
+      local inner = function(b)
+        return b
+      end
+      return inner(a)
+    end
+    return outer(1)
+  """
+  chunk = parse_lazy(code)
+  body = chunk.stmts[0].exprs[0].body
+  assert not body.is_loaded
+  assert chunk == parse_ast(code)
+  assert body.is_loaded
+
+def test_signatures_skip_annotated_bodies() -> None:
+  code = """
+    local function f(x)
+      --@return number
+      return "oops"
+    end
+    return f
+  """
+  assert run_test(code).endswith("Types dont unify: Expected `number`, got `string`")
+  assert run_test(code, "--signatures") == "'a -> number"
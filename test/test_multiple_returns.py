@@ -19,4 +19,14 @@ def test_multiple_returns_polymorphism() -> None:
         return x
       end
       return id(1), id(true)
-    """) == "(number, boolean)"
\ No newline at end of file
+    """) == "(number, boolean)"
+
+def test_multiple_returns_several_type_variables() -> None:
+  assert run_test(
+    """
+      local swap = function(a, b)
+        return b, a
+      end
+      local x, y = swap(1, "s")
+      return swap(y, x)
+    """) == "(string, number)"
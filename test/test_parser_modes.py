@@ -0,0 +1,64 @@
+import ast
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+from util import run_test
+from parser import get_parser, parse_ast, place_empty, ToAST
+from models import SourceMap, VarDecl, FuncExpr
+from type_models import Context
+from infer import infer
+
+def collect_programs() -> list[str]:
+  programs: list[str] = []
+  for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "test_*.py"))):
+    with open(path) as f:
+      tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+      if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "run_test":
+        arg = node.args[0]
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+          programs.append(arg.value)
+  return programs
+
+def test_lalr_matches_earley() -> None:
+  programs = collect_programs()
+  assert programs
+  for code in programs:
+    lalr = ToAST().transform(get_parser("lalr").parse(code))
+    earley = ToAST().transform(get_parser("earley").parse(code))
+    assert lalr == earley, code
+
+def test_inline_matches_transform() -> None:
+  for code in collect_programs():
+    tree = ToAST().transform(get_parser("lalr").parse(code))
+    assert parse_ast(code) == place_empty(tree, 0), code
+
+def test_parses_run_at_once() -> None:
+  programs = collect_programs()
+  expected = [parse_ast(code) for code in programs]
+  with ThreadPoolExecutor(8) as pool:
+    assert list(pool.map(parse_ast, programs * 4)) == expected * 4
+
+def test_keyword_prefixed_names() -> None:
+  assert run_test(
+    """
+      local returned = 1
+      local endpoint = "a"
+      return returned, endpoint
+    """) == "(1, \"a\")"
+
+def test_offsets_render_as_lines() -> None:
+  code = "local x = 1\n\nlocal function f()\nend\nreturn f\n"
+  source = SourceMap("test.lua", code)
+  chunk = parse_ast(code)
+  decl = chunk.stmts[1]
+  assert isinstance(decl, VarDecl) and isinstance(decl.exprs[0], FuncExpr)
+  assert repr(source.location(decl.location)) == "test.lua:3:16"
+  assert repr(source.location(decl.exprs[0].body.location)) == "test.lua:3:7"
+  assert chunk.last is not None and repr(source.location(chunk.last.location)) == "test.lua:5:8"
+
+def test_locations_render_from_context(capsys) -> None:
+  code = "local x = 1\n--@reveal x\n"
+  for name in ["a.lua", "b.lua"]:
+    infer(parse_ast(code), Context({}, source=SourceMap(name, code)))
+    assert capsys.readouterr().out == f"{name}:2:11 (@reveal): 1\n"
@@ -0,0 +1,48 @@
+import io
+from util import run_test
+from type_models import *
+from type_render import Renderer
+
+def lit(value: str) -> TypeConstructor:
+  return TypeConstructor("string", [], value)
+
+def nested(depth: int) -> TableType:
+  table = TableType([(lit("x"), NumberType)])
+  for _ in range(depth):
+    table = TableType([(lit("a"), table), (lit("b"), table)])
+  return table
+
+def test_variables_are_named_per_renderer() -> None:
+  a, b = TypeVariable("r1"), TypeVariable("r2")
+  pair = TypeConstructor("tuple", [a, b], None)
+  first = Renderer()
+  assert first.render(b) == "'a"
+  assert first.render(pair) == "('b, 'a)"
+  assert Renderer().render(pair) == "('a, 'b)"
+
+def test_limits_elide() -> None:
+  table = TableType([(lit(f"f{i}"), NumberType) for i in range(10)])
+  assert Renderer(max_width=2).render(table) == "{f0: number, f1: number, ...}"
+  assert Renderer(max_depth=1).render(nested(3)) == "{a: {a: ..., b: ...}, b: {a: ..., b: ...}}"
+  assert Renderer(max_length=10).render(table) == "{f0: numbe..."
+
+def test_write_streams_shared_subtrees() -> None:
+  out = io.StringIO()
+  Renderer(max_length=1000).write(nested(200), out)
+  assert len(out.getvalue()) == 1003 and out.getvalue().endswith("...")
+  assert Renderer().render(nested(2)) == "{a: {a: {x: number}, b: {x: number}}, b: {a: {x: number}, b: {x: number}}}"
+
+def test_limit_flags() -> None:
+  assert run_test(
+    """
+      return { a = 1, b = { c = { e = 2 } }, d = 3 }
+    """, "--max-width", "2", "--max-depth", "1") == "{a: 1, b: {c: ...}, ...}"
+
+def test_mismatches_render_lazily() -> None:
+  import type_render
+  from type_helpers import Mismatch, unify, new_type_var
+  type_render.reset_renderer()
+  a, b = new_type_var(), new_type_var()
+  res = unify(TypeConstructor("tuple", [a], None), TableType([(StringType, b)]))
+  assert isinstance(res, Mismatch) and not type_render.renderer.names
+  assert str(res) == "Types dont unify: `'a` and `{[string]: 'b}`"
@@ -0,0 +1,49 @@
+import io
+import stream
+from util import run_test
+from models import SourceMap
+from parser import parse_ast
+from test_parser_modes import collect_programs
+
+def streamed(code: str) -> tuple[list, object, list[bool]]:
+  full = SourceMap("test.lua", code)
+  chunk = stream.parse_stream(io.StringIO(code), "test.lua")
+  stmts = []
+  rendered = []
+  for stmt in chunk.stmts:
+    stmts.append(stmt)
+    rendered.append(repr(chunk.source.location(stmt.location)) == repr(full.location(stmt.location)))
+  return stmts, chunk.last, rendered
+
+def test_stream_matches_full_parse(monkeypatch) -> None:
+  for code in collect_programs():
+    full = parse_ast(code)
+    for size in [1, 7, 64, 2**20]:
+      monkeypatch.setattr(stream, "block_size", size)
+      stmts, last, rendered = streamed(code)
+      assert tuple(stmts) == full.stmts and last == full.last, (size, code)
+      assert all(rendered), (size, code)
+
+def test_stream_flag() -> None:
+  code = """
+    local x = 1
+    local y = "a"
+    local z = y .. x
+  """
+  assert run_test(code, "--stream") == run_test(code) == "test/.temp.lua:4:20: Types dont unify: Expected `string`, got `number`"
+
+def test_stream_returned_table(monkeypatch) -> None:
+  programs = [
+    'local x = 1\nreturn {\n  a = 1,\n  [2] = "b",\n  3,\n  f(1, 2),\n  { 4, 5 },\n  c = function(v) return v end,\n}\n',
+    'local x = 1\nreturn { 1, 2 }, x, "s"\n',
+    'return { a = 1 } == x and y\n',
+    'local s = "multi\nline"\nreturn s\n',
+    'return {1,2,3,}',
+  ]
+  for code in programs:
+    full = parse_ast(code)
+    for size in [1, 3, 7, 64, 2**20]:
+      monkeypatch.setattr(stream, "block_size", size)
+      stmts, last, rendered = streamed(code)
+      assert tuple(stmts) == full.stmts and last == full.last, (size, code)
+      assert all(rendered), (size, code)
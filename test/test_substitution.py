@@ -0,0 +1,40 @@
+import type_helpers
+from util import run_test
+from type_models import *
+from type_helpers import Substitution, UnionFindSubstitution, new_type_var
+from parser import parse_ast
+from infer import infer
+from type_render import Renderer
+from test_parser_modes import collect_programs
+
+def test_union_find_composition() -> None:
+  a, b, c = new_type_var(), new_type_var(), new_type_var()
+  s = Substitution({a.name: b})
+  assert isinstance(s, UnionFindSubstitution)
+  s = Substitution({b.name: c}).apply_subst(s)
+  s = Substitution({c.name: TypeConstructor("tuple", [NumberType, StringType], None)}).apply_subst(s)
+  assert repr(s.apply_mono(a)) == repr(s.apply_mono(b))
+  assert s.find(a) is s.find(c)
+  assert s.apply_mono(TableType([(StringType, b)])) is TableType([(StringType, s.apply_mono(c))])
+
+def test_engines_agree() -> None:
+  def render(code: str) -> str:
+    res = infer(parse_ast(code), Context({}))
+    return repr(res) if not isinstance(res, tuple) else Renderer().render(res[1])
+  try:
+    for code in collect_programs():
+      type_helpers.engine = "dict"
+      expected = render(code)
+      type_helpers.engine = "union-find"
+      assert render(code) == expected, code
+  finally:
+    type_helpers.engine = "union-find"
+
+def test_engine_flag() -> None:
+  code = """
+    local function pair(a, b)
+      return a, b
+    end
+    return pair(1, "x")
+  """
+  assert run_test(code, "--engine", "dict") == run_test(code) == "(number, string)"
@@ -0,0 +1,23 @@
+from util import run_test
+from type_models import *
+
+def lit(value: str) -> TypeConstructor:
+  return TypeConstructor("string", [], value)
+
+def test_index_finds_first_extended_key() -> None:
+  table = TableType([(lit("a"), NumberType), (StringType, BooleanType), (lit("b"), NilType), (TypeConstructor("number", [], 1), StringType)])
+  assert table.index.find(lit("a")) == 0
+  assert table.index.find(lit("b")) == 1
+  assert table.index.matches(lit("b")) == [1, 2]
+  assert table.index.find(StringType) == 1
+  assert table.index.find(TypeConstructor("number", [], 1.0)) == 3
+  assert table.index.find(NumberType) is None
+
+def test_wide_table_access() -> None:
+  fields = ", ".join(f"f{i} = {i}" for i in range(300))
+  assert run_test(
+    f"""
+      local t = {{ {fields} }}
+      t.f150 = 2
+      return t.f299, t.f150
+    """) == "(299, number)"
@@ -37,4 +37,16 @@ def test_state_type() -> None:
     """
       local state = { [true] = "On", [false] = "Off" }
       return state, state[true], state[false]
-    """) == "({[true]: \"On\", [false]: \"Off\"}, \"On\", \"Off\")"
\ No newline at end of file
+    """) == "({[true]: \"On\", [false]: \"Off\"}, \"On\", \"Off\")"
+
+def test_array_literals_fall_back_on_other_keys() -> None:
+  assert run_test(
+    """
+      local t = {1, 2, x = 3, 4}
+      local u = {[1] = 1, [1] = "x", 2}
+      return t, t[3], u
+    """) == "({[1]: 1, [2]: 2, x: 3, [3]: 4}, 4, number | string[])"
+
+def test_large_array_literal() -> None:
+  values = ", ".join(str(i) for i in range(1, 2001))
+  assert run_test(f"local big = {{{values}}}\nreturn big, big[2000]") == "(number[], 2000)"
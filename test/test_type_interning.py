@@ -0,0 +1,47 @@
+import pickle
+from util import run_test
+from type_models import *
+
+def test_identical_types_are_shared() -> None:
+  a = TypeConstructor("function", [TypeConstructor("tuple", [NumberType], None), TableType([(StringType, NilType)]), NilType], None)
+  b = TypeConstructor("function", (TypeConstructor("tuple", (NumberType,), None), TableType(((StringType, NilType),)), NilType), None)
+  assert a is b and hash(a) == hash(b)
+  assert TypeConstructor("number", [], 1.0) is not TypeConstructor("number", [], 2.0)
+  assert pickle.loads(pickle.dumps(a)) is a
+
+def test_types_are_immutable() -> None:
+  try:
+    TableType([]).fields = ()
+  except AttributeError:
+    return
+  assert False
+
+def test_assignment_only_updates_its_variable() -> None:
+  assert run_test(
+    """
+      local a = {}
+      local b = {}
+      a.x = 1
+      return a, b
+    """) == "({x: 1}, [])"
+
+def test_ground_types_are_not_rebuilt() -> None:
+  from type_helpers import Substitution, broaden, instantiate, skipped_rebuilds
+  var = TypeVariable("g1")
+  table = TableType([(TypeConstructor("string", [], "x"), NumberType)])
+  assert table.ground and not table.literal_free
+  assert not TableType([(StringType, var)]).ground and TableType([(StringType, var)]).literal_free
+  skipped = dict(skipped_rebuilds)
+  assert Substitution({"g1": StringType}).apply_mono(table) is table
+  assert instantiate(ForallType(["g2"], table)) is table
+  assert broaden(union_of(NumberType, StringType)) is union_of(NumberType, StringType)
+  assert all(skipped_rebuilds[name] == skipped[name] + 1 for name in skipped)
+
+def test_plain_functions_are_literal_free() -> None:
+  from parser import parse_ast
+  from infer import infer
+  from constraints import infer_constraints
+  from type_helpers import broaden
+  for engine in (infer, infer_constraints):
+    res = engine(parse_ast("local f = function(a) return a end\nreturn f"), Context({}))
+    assert isinstance(res, tuple) and res[1].literal_free and broaden(res[1]) is res[1]
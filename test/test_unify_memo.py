@@ -0,0 +1,39 @@
+import type_helpers
+from util import run_test
+from type_models import *
+from type_helpers import Mismatch, unify, intersect, extends
+
+def record(kind: str) -> TableType:
+  return TableType([(TypeConstructor("string", [], "kind"), TypeConstructor("string", [], kind))])
+
+def test_ground_pairs_are_memoized() -> None:
+  type_helpers.unify_memo.clear()
+  type_helpers.memo_stats.update(hits=0, misses=0)
+  a, b = record("a"), record("b")
+  first, second = unify(a, a), unify(a, a)
+  assert not isinstance(first, Mismatch) and not isinstance(second, Mismatch) and first is not second
+  assert unify(a, b) == unify(a, b)
+  assert type_helpers.memo_stats == {"hits": 2, "misses": 2}
+  assert intersect(a, union_of(b, a)) is a
+  assert not extends(a, b)
+
+def test_memo_is_bounded() -> None:
+  size = type_helpers.memo_size
+  type_helpers.memo_size = 3
+  try:
+    for i in range(10):
+      unify(record(str(i)), record("x"))
+    assert len(type_helpers.unify_memo) == 3
+    assert (record("9"), record("x")) in type_helpers.unify_memo
+  finally:
+    type_helpers.memo_size = size
+
+def test_memo_flag() -> None:
+  code = """
+    local kind = "a"
+    if kind == "b" then
+      kind = "c"
+    end
+    return kind
+  """
+  assert run_test(code, "--no-memo") == run_test(code)
@@ -0,0 +1,41 @@
+from util import run_test
+from type_models import *
+from type_helpers import subtract, intersect
+
+def lit(value: str) -> TypeConstructor:
+  return TypeConstructor("string", [], value)
+
+def test_unions_are_flat_and_canonical() -> None:
+  one = TypeConstructor("number", [], 1)
+  a = union_of(union_of(lit("b"), lit("a")), union_of(one, lit("b")))
+  b = union_of(one, union_of(lit("a"), lit("b")))
+  assert a is b
+  assert isinstance(a, UnionType) and a.members == (one, lit("a"), lit("b"))
+  assert union_of(StringType, StringType) is StringType
+
+def test_composite_members_are_ordered_by_structure() -> None:
+  a = TableType([(lit("a"), NumberType)])
+  b = TableType([(lit("b"), StringType)])
+  f = TypeConstructor("function", [TypeConstructor("tuple", [], None), a, NilType], None)
+  assert union_of(a, b, f) is union_of(f, b, a)
+  assert repr(union_of(b, a)) == repr(union_of(a, b)) == "{a: number} | {b: string}"
+
+def test_union_rendering() -> None:
+  assert repr(union_of(lit("x"), StringType, TypeConstructor("number", [], 0))) == "string | 0"
+  assert repr(union_of(NilType, lit("a"), lit("b"))) == "(\"a\" | \"b\")?"
+  assert repr(union_of(TypeConstructor("number", [], 1), NilType)) == "1?"
+
+def test_union_narrowing() -> None:
+  union = union_of(*(lit(str(i)) for i in range(50)), NumberType, NilType)
+  assert subtract(union, StringType) is union_of(NumberType, NilType)
+  assert subtract(union, BooleanType) is union
+  assert intersect(NumberType, union) is NumberType
+
+def test_literal_widening() -> None:
+  assert run_test(
+    """
+      local key = tostring(0)
+      local names = { [key] = "a", [key] = "b", [key] = "c", [key] = 1 }
+      local list = { "a", "b", "c", true }
+      return names, list[1]
+    """, "--literal-limit", "2") == "({[string]: string | 1}, string)"
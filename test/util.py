@@ -1,6 +1,14 @@
+import atexit
+import shutil
 import subprocess
+import os
+import tempfile
 
-def run_test(code: str):
+# The checker's AST cache goes to a directory of its own for the test run.
+cache_home = tempfile.mkdtemp(prefix="typelua-test-")
+atexit.register(shutil.rmtree, cache_home, ignore_errors=True)
+
+def run_test(code: str, *flags: str):
   with open("test/.temp.lua", "w") as f:
     f.write(code)
-  return subprocess.run(["python", "main.py", "test/.temp.lua", "--debug"], capture_output=True).stdout.decode().strip()
+  return subprocess.run(["python", "main.py", "test/.temp.lua", "--debug", *flags], capture_output=True, env={**os.environ, "XDG_CACHE_HOME": cache_home}).stdout.decode().strip()
@@ -1,29 +1,121 @@
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional, TypeVar, TypeAlias
+from typing import Any, Callable, Generator, Optional, TypeVar, TypeAlias
 from type_models import *
 
 T = TypeVar("T")
-Result: TypeAlias = str | T
+
+# Why two types do not unify. Most failed unifications are probes whose
+# reason is thrown away, so the message is only formatted (rendering the
+# types in it) when it is turned into text.
+class Mismatch:
+  __slots__ = ("template", "args")
+  template: str
+  args: tuple[Any, ...]
+  def __init__(self, template: str, *args: Any) -> None:
+    self.template = template
+    self.args = args
+  def __str__(self) -> str:
+    return self.template.format(*self.args)
+  def __repr__(self) -> str:
+    return f"Mismatch({str(self)!r})"
+
+Result: TypeAlias = Mismatch | T
+
+# Deeply nested programs produce deeply nested types, so none of the
+# traversals below may use the Python call stack for depth.
+Steps: TypeAlias = Generator[tuple[Any, ...], Any, T]
+
+def trampoline(root: Steps[T], step: Callable[..., Steps[Any]]) -> T:
+  stack: list[Steps[Any]] = [root]
+  value: Any = None
+  while True:
+    try:
+      request = stack[-1].send(value)
+    except StopIteration as stop:
+      stack.pop()
+      if not stack:
+        return stop.value
+      value = stop.value
+      continue
+    stack.append(step(*request))
+    value = None
+
+def fold_type(
+  type: PolyType,
+  enter: 'Callable[[PolyType], PolyType]',
+  children: 'Callable[[PolyType], list[PolyType]]',
+  leave: 'Callable[[PolyType, list[Any]], Any]',
+) -> Any:
+  stack: list[tuple[PolyType, int]] = [(type, -1)]
+  results: list[Any] = []
+  while stack:
+    node, count = stack.pop()
+    if count >= 0:
+      if count:
+        args = results[len(results) - count:]
+        del results[len(results) - count:]
+      else:
+        args = []
+      results.append(leave(node, args))
+      continue
+    node = enter(node)
+    below = children(node)
+    stack.append((node, len(below)))
+    stack.extend((c, -1) for c in reversed(below))
+  return results[0]
+
+# Which class `Substitution(...)` builds; see UnionFindSubstitution.
+engine = "union-find"
 
 @dataclass
 class Substitution:
   mapping: dict[str, MonoType]
+  def __new__(cls, mapping: dict[str, MonoType], is_returning: bool = False) -> 'Substitution':
+    if cls is Substitution and engine == "union-find":
+      cls = UnionFindSubstitution
+    return super().__new__(cls)
   def __init__(self, mapping: dict[str, MonoType], is_returning: bool = False) -> None:
     self.mapping = mapping
     self.is_returning = is_returning
   is_returning: bool
+  def is_empty(self) -> bool:
+    return not self.mapping
+  def find(self, m: PolyType) -> PolyType:
+    while isinstance(m, TypeVariable) and m.name in self.mapping:
+      m = self.mapping[m.name]
+    return m
   def apply_mono(self, m: MonoType) -> MonoType:
+    m = self.find(m)
     if isinstance(m, TypeVariable):
-      if m.name in self.mapping:
-        return self.apply_mono(self.mapping[m.name])
       return m
-    elif isinstance(m, TypeConstructor):
-      return TypeConstructor(m.name, [self.apply_mono(a) for a in m.args], m.value, m.checks)
-    elif isinstance(m, TableType):
-      return TableType([(a, self.apply_mono(b)) for a, b in m.fields])
-    elif isinstance(m, UnionType):
-      return UnionType(self.apply_mono(m.left), self.apply_mono(m.right))
-    assert False, f"Unknown type: {m}"
+    if isinstance(m, TypeConstructor) and not m.args:
+      return m
+    if m.ground or self.is_empty():
+      skipped_rebuilds["apply_mono"] += 1
+      return m
+    rebuilds["apply_mono"] += 1
+    def children(m: PolyType) -> list[PolyType]:
+      if m.ground:
+        return []
+      if isinstance(m, TypeConstructor):
+        return m.args
+      elif isinstance(m, TableType):
+        return [b for _, b in m.fields]
+      elif isinstance(m, UnionType):
+        return m.members
+      return []
+    def leave(m: PolyType, args: list[MonoType]) -> MonoType:
+      if m.ground or isinstance(m, TypeVariable):
+        return m
+      elif isinstance(m, TypeConstructor):
+        return TypeConstructor(m.name, args, m.value)
+      elif isinstance(m, TableType):
+        return TableType([(a, b) for (a, _), b in zip(m.fields, args)])
+      elif isinstance(m, UnionType):
+        return union_of(*args)
+      assert False, f"Unknown type: {m}"
+    return fold_type(m, self.find, children, leave)
   def apply_poly(self, p: PolyType) -> PolyType:
     if isinstance(p, (TypeVariable, TypeConstructor)):
       res: MonoType = self.apply_mono(p)
@@ -31,7 +123,7 @@ class Substitution:
         return res
       assert False
     elif isinstance(p, ForallType):
-      return ForallType(p.var, self.apply_poly(p.body))
+      return ForallType(p.vars, self.apply_poly(p.body))
     assert False
   def apply_subst(self, s: 'Substitution') -> 'Substitution':
     new = self.mapping.copy()
@@ -51,6 +143,106 @@ class Substitution:
       new[n] = self.apply_mono(t)
     return Substitution(new, self.is_returning or s.is_returning)
 
+# Composing a dict Substitution rewrites every binding of the older one, so
+# a long run of compositions is quadratic in the number of variables. This
+# one keeps bindings as they were made: a variable points at its binding
+# and the chain is only followed when the substitution is applied, with the
+# path compressed into `found`. Bindings live in layers, oldest first, that
+# are never changed once built and are shared between substitutions; the
+# newest layer is merged into the one below while it is at least as large,
+# so a lookup touches O(log n) layers.
+class UnionFindSubstitution(Substitution):
+  layers: tuple[dict[str, MonoType], ...]
+  found: dict[str, PolyType]
+  def __init__(self, mapping: dict[str, MonoType], is_returning: bool = False) -> None:
+    self.layers = (mapping,) if mapping else ()
+    self.is_returning = is_returning
+    self.found = {}
+  @staticmethod
+  def stacked(layers: tuple[dict[str, MonoType], ...], is_returning: bool) -> 'UnionFindSubstitution':
+    while len(layers) > 1 and len(layers[-1]) >= len(layers[-2]):
+      layers = layers[:-2] + ({**layers[-2], **layers[-1]},)
+    s = UnionFindSubstitution({}, is_returning)
+    s.layers = layers
+    return s
+  @property
+  def mapping(self) -> dict[str, MonoType]:  # type: ignore[override]
+    return {n: t for layer in self.layers for n, t in layer.items()}
+  def is_empty(self) -> bool:
+    return not self.layers
+  # The bindings as one layer, copied only if there is more than one.
+  def flattened(self) -> dict[str, MonoType]:
+    if len(self.layers) == 1:
+      return self.layers[0]
+    return self.mapping
+  def lookup(self, name: str) -> 'MonoType | None':
+    for layer in reversed(self.layers):
+      if name in layer:
+        return layer[name]
+    return None
+  def find(self, m: PolyType) -> PolyType:
+    if not isinstance(m, TypeVariable) or not self.layers:
+      return m
+    path: list[str] = []
+    while isinstance(m, TypeVariable):
+      if m.name in self.found:
+        m = self.found[m.name]
+        break
+      bound = self.lookup(m.name)
+      if bound is None:
+        break
+      path.append(m.name)
+      m = bound
+    for name in path:
+      self.found[name] = m
+    return m
+  def apply_subst(self, s: 'Substitution') -> 'Substitution':
+    assert isinstance(s, UnionFindSubstitution)
+    is_returning = self.is_returning or s.is_returning
+    if not self.layers or not s.layers:
+      return UnionFindSubstitution.stacked(s.layers + self.layers, is_returning)
+    own = self.flattened()
+    # A variable bound on both sides keeps what both bindings agree on.
+    for n, t in own.items():
+      if (old := s.lookup(n)) is not None:
+        res = intersect(old, t)
+        assert res
+        if own is self.layers[-1]:
+          own = own.copy()
+        own[n] = res
+    return UnionFindSubstitution.stacked(s.layers + (own,), is_returning)
+  def apply_subst_unsafe(self, s: 'Substitution') -> 'Substitution':
+    assert isinstance(s, UnionFindSubstitution)
+    if not s.layers:
+      return UnionFindSubstitution.stacked(self.layers, self.is_returning or s.is_returning)
+    return UnionFindSubstitution.stacked(self.layers + (s.flattened(),), self.is_returning or s.is_returning)
+
+# How often apply_mono, instantiate and broaden returned their argument
+# because nothing in it could change, and how often they rebuilt it.
+skipped_rebuilds = {"apply_mono": 0, "instantiate": 0, "broaden": 0}
+rebuilds = {"apply_mono": 0, "instantiate": 0, "broaden": 0}
+
+# Unifying or intersecting two ground types cannot bind anything, so the
+# outcome only depends on the pair. The last `memo_size` outcomes are kept,
+# keyed by the (interned) types themselves; `memo_enabled` turns this off.
+memo_enabled = True
+memo_size = 4096
+memo_stats = {"hits": 0, "misses": 0}
+unify_memo: 'OrderedDict[tuple[MonoType, MonoType], Mismatch | None]' = OrderedDict()
+intersect_memo: 'OrderedDict[tuple[MonoType, MonoType], Optional[MonoType]]' = OrderedDict()
+
+def memoized(memo: 'OrderedDict[tuple[MonoType, MonoType], Any]', compute: 'Callable[[MonoType, MonoType], Any]', type1: MonoType, type2: MonoType) -> Any:
+  key = (type1, type2)
+  if key in memo:
+    memo_stats["hits"] += 1
+    memo.move_to_end(key)
+    return memo[key]
+  memo_stats["misses"] += 1
+  value = memo[key] = compute(type1, type2)
+  if len(memo) > memo_size:
+    memo.popitem(last=False)
+  return value
+
 var_count = 0
 def new_type_var() -> TypeVariable:
   global var_count
@@ -58,22 +250,31 @@ def new_type_var() -> TypeVariable:
   return TypeVariable(f"t{var_count}")
 
 def intersect(type1: MonoType, type2: MonoType) -> 'Optional[MonoType]':
+  if memo_enabled and type1.ground and type2.ground:
+    return memoized(intersect_memo, intersect_types, type1, type2)
+  return intersect_types(type1, type2)
+
+def intersect_types(type1: MonoType, type2: MonoType) -> 'Optional[MonoType]':
+  return trampoline(intersect_steps(type1, type2), intersect_steps)
+
+def intersect_steps(type1: MonoType, type2: MonoType) -> 'Steps[MonoType | None]':
   if isinstance(type1, TypeVariable):
     return type2
   if isinstance(type2, TypeVariable):
     return type1
   if isinstance(type2, UnionType):
-    return intersect(type1, type2.left) or intersect(type1, type2.right)
+    for member in type2.members:
+      if found := (yield type1, member):
+        return found
+    return None
   if isinstance(type1, UnionType):
-    return intersect(type2, type1)
+    return (yield type2, type1)
   if isinstance(type1, TableType) and isinstance(type2, TableType):
-    fields = type1.fields + type2.fields
     filtered = []
-    for k, v in fields:
-      for fk, fv in filtered:
-        if extends(k, fk):
-          break
-      else:
+    index = FieldIndex()
+    for k, v in type1.fields + type2.fields:
+      if index.find(k) is None:
+        index.add(k)
         filtered.append((k, v))
     return TableType(filtered)
   if isinstance(type1, TypeVariable) and isinstance(type2, TypeVariable):
@@ -85,60 +286,106 @@ def intersect(type1: MonoType, type2: MonoType) -> 'Optional[MonoType]':
       return None
     args = []
     for a, b in zip(type1.args, type2.args):
-      val = intersect(a, b)
+      val = yield a, b
       if not val: return None
       args.append(val)
-    return TypeConstructor(type1.name, args, type1.value, type1.checks + type2.checks)
+    return TypeConstructor(type1.name, args, type1.value)
   return None
 
 def subtract(type1: MonoType, type2: MonoType) -> MonoType:
   if isinstance(type1, UnionType):
-    if extends(type1.left, type2):
-      return subtract(type1.right, type2)
-    if extends(type1.right, type2):
-      return subtract(type1.left, type2)
-    return UnionType(subtract(type1.left, type2), subtract(type1.right, type2))
+    kind = primitive_kind(type2)
+    if kind and not kind & (type1.kinds | type1.literals):
+      return type1
+    kept = [m for m in type1.members if not extends(m, type2)]
+    if not kept:
+      return type1.members[-1]
+    return union_of(*kept)
   return type1
 
-def instantiate(type: PolyType, mappings: dict[str, TypeVariable] = {}) -> MonoType:
-  if isinstance(type, TypeVariable):
-    if type.name in mappings:
-      return mappings[type.name]
-    return type
-  elif isinstance(type, TypeConstructor):
-    return TypeConstructor(type.name, [instantiate(a, mappings) for a in type.args], type.value, type.checks)
+def type_children(type: PolyType) -> list[PolyType]:
+  if isinstance(type, TypeConstructor):
+    return type.args
   elif isinstance(type, TableType):
-    return TableType([(instantiate(k, mappings), instantiate(v, mappings)) for k, v in type.fields])
+    return [x for field in type.fields for x in field]
   elif isinstance(type, UnionType):
-    return UnionType(instantiate(type.left), instantiate(type.right))
+    return type.members
   elif isinstance(type, ForallType):
-    mappings[type.var] = new_type_var()
-    return instantiate(type.body, mappings)
-  assert False
+    return [type.body]
+  return []
 
-def free_vars_of_type(type: PolyType) -> set[str]:
-  if isinstance(type, TypeVariable):
-    return {type.name}
-  elif isinstance(type, TypeConstructor):
-    return {v for arg in type.args for v in free_vars_of_type(arg)}
-  elif isinstance(type, TableType):
-    return {x for k, v in type.fields for x in free_vars_of_type(k) | free_vars_of_type(v)}
-  elif isinstance(type, UnionType):
-    return free_vars_of_type(type.left) | free_vars_of_type(type.right)
-  elif isinstance(type, ForallType):
-    return free_vars_of_type(type.body) - {type.var}
+# Replaces the quantified variables of a scheme with fresh ones in a single
+# pass. Only children that contain variables are visited; ground ones are
+# put back in place as they are.
+def instantiate(type: PolyType) -> MonoType:
+  if not isinstance(type, ForallType):
+    skipped_rebuilds["instantiate"] += 1
+    return type
+  if type.body.ground:
+    skipped_rebuilds["instantiate"] += 1
+    return type.body
+  rebuilds["instantiate"] += 1
+  fresh = {var: new_type_var() for var in type.vars}
+  def children(type: PolyType) -> list[PolyType]:
+    return [c for c in type_children(type) if not c.ground]
+  def leave(type: PolyType, args: list[MonoType]) -> MonoType:
+    if isinstance(type, TypeVariable):
+      return fresh.get(type.name, type)
+    rest = iter(args)
+    parts = [c if c.ground else next(rest) for c in type_children(type)]
+    if isinstance(type, TypeConstructor):
+      return TypeConstructor(type.name, parts, type.value)
+    elif isinstance(type, TableType):
+      return TableType(list(zip(parts[0::2], parts[1::2])))
+    elif isinstance(type, UnionType):
+      return union_of(*parts)
+    assert False
+  return fold_type(type.body, lambda type: type, children, leave)
 
-def free_vars_of_ctx(ctx: Context) -> set[str]:
-  return {v for type in ctx.mapping.values() for v in free_vars_of_type(type)}
+def free_vars_of_type(type: PolyType) -> set[str]:
+  bound: set[str] = set()
+  if isinstance(type, ForallType):
+    bound.update(type.vars)
+    type = type.body
+  found: set[str] = set()
+  stack: list[PolyType] = [type]
+  while stack:
+    type = stack.pop()
+    if type.ground:
+      continue
+    if isinstance(type, TypeConstructor):
+      stack.extend(type.args)
+    elif isinstance(type, TypeVariable):
+      found.add(type.name)
+    elif isinstance(type, TableType):
+      for k, v in type.fields:
+        stack.append(k)
+        stack.append(v)
+    elif isinstance(type, UnionType):
+      stack.extend(type.members)
+    else:
+      found |= free_vars_of_type(type)
+  return found - bound if bound else found
 
+# Only variables no context at `ctx`'s level or above has bound can be
+# quantified; see `Bindings`.
 def generalize(type: MonoType, ctx: Context) -> PolyType:
-  fv = free_vars_of_type(type) - free_vars_of_ctx(ctx)
-  poly: PolyType = type
-  for v in fv:
-    poly = ForallType(v, poly)
-  return poly
+  fv = {v for v in free_vars_of_type(type) if (level := TypeVariable(v).level) is None or level > ctx.level}
+  if not fv:
+    return type
+  return ForallType(sorted(fv), type)
 
 def unify(type1: MonoType, type2: MonoType) -> Result[Substitution]:
+  if memo_enabled and type1.ground and type2.ground:
+    error = memoized(unify_memo, unify_error, type1, type2)
+    return Substitution({}) if error is None else error
+  return trampoline(unify_steps(type1, type2), unify_steps)
+
+def unify_error(type1: MonoType, type2: MonoType) -> 'Mismatch | None':
+  res = trampoline(unify_steps(type1, type2), unify_steps)
+  return res if isinstance(res, Mismatch) else None
+
+def unify_steps(type1: MonoType, type2: MonoType) -> Steps[Result[Substitution]]:
   if isinstance(type1, TypeVariable) and isinstance(type2, TypeVariable) and type1.name == type2.name:
     return Substitution({})
   if isinstance(type2, TypeVariable):
@@ -146,134 +393,135 @@ def unify(type1: MonoType, type2: MonoType) -> Result[Substitution]:
   if isinstance(type1, TypeVariable):
     return Substitution({type1.name: type2})
   if isinstance(type1, UnionType):
-    left_s = unify(type1.left, type2)
-    if isinstance(left_s, str): return left_s
-    right_s = unify(type1.right, type2)
-    if isinstance(right_s, str): return right_s
-    return left_s.apply_subst(right_s)
+    union_s: 'Substitution | None' = None
+    for member in type1.members:
+      res = yield member, type2
+      if isinstance(res, Mismatch): return res
+      union_s = res if union_s is None else union_s.apply_subst(res)
+    assert union_s is not None
+    return union_s
   if isinstance(type2, UnionType):
     s = Substitution({})
-    left_s = unify(type1, type2.left)
-    if isinstance(left_s, Substitution):
-      s = left_s.apply_subst(s)
-    right_s = unify(type1, type2.right)
-    if isinstance(right_s, Substitution):
-      s = right_s.apply_subst(s)
-    if isinstance(left_s, str) and isinstance(right_s, str): return left_s
+    error: 'Mismatch | None' = None
+    unified = False
+    for member in type2.members:
+      res = yield type1, member
+      if isinstance(res, Substitution):
+        s = res.apply_subst(s)
+        unified = True
+      elif error is None:
+        error = res
+    if not unified:
+      assert error is not None
+      return error
     return s
   if isinstance(type1, TableType) and isinstance(type2, TableType):
     s = Substitution({})
     for (k1, v1) in type1.fields:
-      v: 'MonoType | None' = None
-      for k2, v2 in type2.fields:
-        if extends(k1, k2):
-          v = v2
-          break
-      if v is None: return f"Field `{k1}` expected on type `{type2}`, but was not found"
-      v_res = unify(v, v1)
-      if isinstance(v_res, str): return v_res
+      i = type2.index.find(k1)
+      if i is None: return Mismatch("Field `{}` expected on type `{}`, but was not found", k1, type2)
+      v = type2.fields[i][1]
+      v_res = yield v, v1
+      if isinstance(v_res, Mismatch): return v_res
       s = v_res.apply_subst(s)
     return s
   if not isinstance(type1, TypeConstructor) or not isinstance(type2, TypeConstructor):
-    return f"Types dont unify: `{type1}` and `{type2}`"
+    return Mismatch("Types dont unify: `{}` and `{}`", type1, type2)
   if type1.name != type2.name:
-    return f"Types dont unify: Expected `{type2.name}`, got `{type1.name}`"
+    return Mismatch("Types dont unify: Expected `{}`, got `{}`", type2.name, type1.name)
   # if type1.name == "tuple" and type2.name == "tuple":
   #   s = Substitution({})
   #   for a, b in zip(type1.args, type2.args):
   #     res = unify(a, b)
-  #     if isinstance(res, str): return res
+  #     if isinstance(res, Mismatch): return res
   #     s = res.apply_subst(res)
   #   return s
   if len(type1.args) != len(type2.args):
-    return f"Types dont unify: Expected `{type1}`, but got `{type2}`" 
+    return Mismatch("Types dont unify: Expected `{}`, but got `{}`", type1, type2)
   if type1.value is not None and type2.value is not None:
     if type1.value != type2.value:
-      return f"Type `{type1}` does not extend type `{type2}`" 
+      return Mismatch("Type `{}` does not extend type `{}`", type1, type2)
   if type1.name == "function":
     s = Substitution({})
     assert isinstance(type1.args[0], TypeConstructor)
     assert isinstance(type2.args[0], TypeConstructor)
     for p1, p2 in zip(type1.args[0].args, type2.args[0].args):
-      res = unify(p2, p1)
-      if isinstance(res, str): return res
+      res = yield p2, p1
+      if isinstance(res, Mismatch): return res
       s = res.apply_subst(s)
-    if not isinstance(type1.args[1], (TypeConstructor, TypeVariable)) or type1.args[1].name != "tuple" and not isinstance(type1.args[1], TypeVariable):
-      type1.args[1] = TypeConstructor("tuple", [type1.args[1]], None, [])
-    if not isinstance(type2.args[1], (TypeConstructor, TypeVariable)) or type2.args[1].name != "tuple" and not isinstance(type1.args[1], TypeVariable):
-      type2.args[1] = TypeConstructor("tuple", [type2.args[1]], None, [])
-    res = unify(type1.args[1], type2.args[1])
-    if isinstance(res, str): return res
+    ret1, ret2 = type1.args[1], type2.args[1]
+    if not isinstance(ret1, (TypeConstructor, TypeVariable)) or ret1.name != "tuple" and not isinstance(ret1, TypeVariable):
+      ret1 = TypeConstructor("tuple", [ret1], None)
+    if not isinstance(ret2, (TypeConstructor, TypeVariable)) or ret2.name != "tuple" and not isinstance(ret1, TypeVariable):
+      ret2 = TypeConstructor("tuple", [ret2], None)
+    res = yield ret1, ret2
+    if isinstance(res, Mismatch): return res
     return res.apply_subst(s)
   if type2.value is not None and type1.value is None:
     if type2.value is True:
       assert False
-    return f"Type `{type1}` does not extend type `{type2}`"
+    return Mismatch("Type `{}` does not extend type `{}`", type1, type2)
   s = Substitution({})
   for a, b in zip(type1.args, type2.args):
-    res = unify(a, b)
-    if isinstance(res, str): return res
+    res = yield a, b
+    if isinstance(res, Mismatch): return res
     s = res.apply_subst(res)
   return s
 
 def broaden(type: MonoType) -> MonoType:
-  if isinstance(type, TypeConstructor):
-    return TypeConstructor(type.name, [broaden(a) for a in type.args], None, type.checks)
-  if isinstance(type, UnionType):
-    return UnionType(broaden(type.left), broaden(type.right))
-  return type
+  if type.literal_free or isinstance(type, TableType):
+    skipped_rebuilds["broaden"] += 1
+    return type
+  rebuilds["broaden"] += 1
+  def children(type: PolyType) -> list[PolyType]:
+    if isinstance(type, (TypeConstructor, UnionType)):
+      return type_children(type)
+    return []
+  def leave(type: PolyType, args: list[MonoType]) -> MonoType:
+    if isinstance(type, TypeConstructor):
+      return TypeConstructor(type.name, args, None)
+    if isinstance(type, UnionType):
+      return union_of(*args)
+    return type
+  return fold_type(type, lambda type: type, children, leave)
 
 def flatten_tuple(type: MonoType) -> MonoType:
-  if isinstance(type, TypeConstructor) and type.name == "tuple":
-    return flatten_tuple(type.args[0])
+  while isinstance(type, TypeConstructor) and type.name == "tuple":
+    type = type.args[0]
   return type
 
 def smart_union(type1: MonoType, type2: MonoType) -> MonoType:
+  return trampoline(smart_union_steps(type1, type2), smart_union_steps)
+
+def smart_union_steps(type1: MonoType, type2: MonoType) -> 'Steps[MonoType]':
   if isinstance(type1, TypeVariable) and isinstance(type2, TypeVariable) and type1.name == type2.name:
     return type1
   if isinstance(type1, TypeConstructor) and isinstance(type2, TypeConstructor):
     if type1.name == type2.name:
-      if type1.value is not None and type2.value is not None:
-        if type1.value == type2.value:
-          return TypeConstructor(type1.name, [smart_union(a, b) for a, b in zip(type1.args, type2.args)], type1.value, type1.checks + type2.checks)
-        else:
-          return UnionType(type1, type2)
-      return TypeConstructor(type1.name, [smart_union(a, b) for a, b in zip(type1.args, type2.args)], type1.value, type1.checks + type2.checks)
-    return UnionType(type1, type2)
+      if type1.value is not None and type2.value is not None and type1.value != type2.value:
+        return union_of(type1, type2)
+      args = []
+      for a, b in zip(type1.args, type2.args):
+        args.append((yield a, b))
+      return TypeConstructor(type1.name, args, type1.value)
+    return union_of(type1, type2)
   if isinstance(type1, TableType) and isinstance(type2, TableType):
     fields: list[tuple[MonoType, MonoType]] = []
-    for k1, v1 in type1.fields:
-      val = None
-      for k2, v2 in type2.fields:
-        if extends(k1, k2):
-          val = v2
-      for fk, fv in fields:
-        if extends(k1, fk):
-          break
-      else:
-        if not val:
-          fields.append((k1, smart_union(v1, NilType)))
-        else:
-          fields.append((k1, smart_union(v1, val)))
-    for k1, v1 in type2.fields:
-      val = None
-      for k2, v2 in type1.fields:
-        if extends(k1, k2):
-          val = v2
-      for fk, fv in fields:
-        if extends(k1, fk):
-          break
-      else:
-        if not val:
-          fields.append((k1, smart_union(v1, NilType)))
-        else:
-          fields.append((k1, smart_union(v1, val)))
+    index = FieldIndex()
+    for table, other in ((type1, type2), (type2, type1)):
+      for k1, v1 in table.fields:
+        if index.find(k1) is not None:
+          continue
+        matches = other.index.matches(k1)
+        val = other.fields[matches[-1]][1] if matches else NilType
+        index.add(k1)
+        fields.append((k1, (yield v1, val)))
     return TableType(fields)
-  return UnionType(type1, type2)
+  return union_of(type1, type2)
 
 def extends(type1, type2):
   if isinstance(type1, TypeVariable):
     return isinstance(type2, TypeVariable) and type1.name == type2.name
   if isinstance(type2, TypeVariable):
     return isinstance(type1, TypeVariable) and type2.name == type1.name
-  return not isinstance(unify(type1, type2), str)
+  return not isinstance(unify(type1, type2), Mismatch)
@@ -1,6 +1,7 @@
+import weakref
 from dataclasses import dataclass
-from typing import Literal, TypeAlias, Any, cast
-from models import Expr
+from typing import TypeAlias, Any, Iterable, Optional, cast
+from models import Expr, SourceMap
 
 MonoType: TypeAlias = """
   TypeVariable
@@ -14,148 +15,409 @@ PolyType: TypeAlias = """
   | ForallType
 """
 
-variable_names_rendered = {}
+# Types are immutable and hash-consed: building a type that already exists
+# returns the existing object. Equality is therefore identity, and `hash` is
+# computed once from the children's hashes. `ground` (no type variables) and
+# `literal_free` (no literal values) are likewise computed once, so that
+# substituting into or broadening a type that cannot change is O(1).
+interned: 'weakref.WeakValueDictionary[tuple[Any, ...], Interned]' = weakref.WeakValueDictionary()
 
-@dataclass
-class TypeVariable:
-  name: str
+class Interned:
+  __slots__ = ("hash", "ground", "literal_free", "__weakref__")
+  hash: int
+  ground: bool
+  literal_free: bool
+  def __setattr__(self, name: str, value: Any) -> None:
+    raise AttributeError(f"{type(self).__name__} is immutable")
+  def __hash__(self) -> int:
+    return self.hash
+  def __reduce__(self) -> tuple[Any, ...]:
+    return type(self), tuple(getattr(self, name) for name in self.__slots__)
   def __repr__(self) -> str:
-    global variable_names_rendered
-    if self.name in variable_names_rendered:
-      return "'" + variable_names_rendered[self.name]
-    letters = "abcdefghijklmnopqrstuvwyxz"
-    if (i := len(variable_names_rendered)) < len(letters):
-      variable_names_rendered[self.name] = letters[i]
-      return "'" + letters[i]
-    return "'" + self.name
+    import type_render
+    return type_render.renderer.render(self)
 
-@dataclass
-class TypeConstructor:
+def intern_type(cls: type, key: tuple[Any, ...], hash_value: int, children: 'Iterable[Interned]', **fields: Any) -> Any:
+  found = interned.get(key)
+  if found is not None:
+    return found
+  obj = object.__new__(cls)
+  for name, value in fields.items():
+    object.__setattr__(obj, name, value)
+  children = tuple(children)
+  object.__setattr__(obj, "hash", hash_value)
+  object.__setattr__(obj, "ground", cls is not TypeVariable and all(c.ground for c in children))
+  object.__setattr__(obj, "literal_free", fields.get("value") is None and all(c.literal_free for c in children))
+  interned[key] = obj
+  return obj
+
+# `level` is the level of the shallowest Context that has bound a type
+# mentioning the variable, or None if none has; see `Bindings`.
+class TypeVariable(Interned):
+  __slots__ = ("name", "level")
+  name: str
+  level: int | None
+  def __new__(cls, name: str) -> 'TypeVariable':
+    return intern_type(cls, (cls, name), hash((cls.__name__, name)), (), name=name, level=None)
+  def __reduce__(self) -> tuple[Any, ...]:
+    return TypeVariable, (self.name,)
+
+class TypeConstructor(Interned):
+  __slots__ = ("name", "args", "value")
   name: str
-  args: list[MonoType]
+  args: tuple[MonoType, ...]
   value: Any
-  checks: list[tuple[Expr, MonoType]]
-  def __repr__(self) -> str:
-    if self.name == "string" and self.value is not None:
-      return "\"" + str(self.value) + "\""
-    if self.name == "number" and self.value is not None:
-      if self.value % 1 == 0:
-        return str(int(self.value))
-      return str(self.value)
-    if self.name == "boolean" and self.value is not None:
-      return self.value and "true" or "false"
-    if self.name == "function":
-      params = ", ".join([str(a) for a in cast(TypeConstructor, self.args[0]).args] + (["..." + str(self.args[2])] if self.value else []))
-      rets = ", ".join(f"{r}" for r in self.args[1].args) if isinstance(self.args[1], TypeConstructor) and self.args[1].name == "tuple" else repr(self.args[1])
-      if len(cast(TypeConstructor, self.args[0]).args) != 1:
-        params = f"({params})"
-      return f"{params} -> {rets}"
-    if self.name == "tuple":
-      if len(self.args) == 1:
-        return str(self.args[0])
-      return "(" + ", ".join(str(a) for a in self.args) + ")"
-    if self.args:
-      args = ", ".join(str(a) for a in self.args)
-      return f"{self.name}<{args}>"
-    return self.name
-
-NumberType = TypeConstructor("number", [], None, [])
-StringType = TypeConstructor("string", [], None, [])
-BooleanType = TypeConstructor("boolean", [], None, [])
-NilType = TypeConstructor("nil", [], None, [])
-
-def array_repr(table: 'TableType') -> str | Literal[False]:
-  from type_helpers import unify, broaden
-  types = list(map(lambda f: f[1], table.fields))
-  filtered: list[MonoType] = []
-  for type in types:
-    for filt in filtered:
-      if not isinstance(unify(type, filt), str):
-        break
+  def __new__(cls, name: str, args: 'Iterable[MonoType]', value: Any) -> 'TypeConstructor':
+    args = tuple(args)
+    key = (cls, name, type(value), value, len(args), *map(id, args))
+    hash_value = hash((cls.__name__, name, value, *(a.hash for a in args)))
+    return intern_type(cls, key, hash_value, args, name=name, args=args, value=value)
+
+NumberType = TypeConstructor("number", [], None)
+StringType = TypeConstructor("string", [], None)
+BooleanType = TypeConstructor("boolean", [], None)
+NilType = TypeConstructor("nil", [], None)
+
+# Bits of `UnionType.kinds`, one per primitive type name.
+KIND_BITS = {"nil": 1, "boolean": 2, "number": 4, "string": 8}
+
+def primitive_kind(type: MonoType) -> int:
+  if isinstance(type, TypeConstructor) and not type.args:
+    return KIND_BITS.get(type.name, 0)
+  return 0
+
+def literal_key(type: MonoType) -> tuple[str, Any] | None:
+  if isinstance(type, TypeConstructor) and type.value is not None and primitive_kind(type):
+    return type.name, type.value
+  return None
+
+# Finds the fields a key extends without unifying it against every field
+# key. Literal keys are hashed by value (so `1` and `1.0` still match);
+# broad keys like `string` or type variables are few and are scanned.
+class FieldIndex:
+  keys: list[MonoType]
+  literals: dict[tuple[str, Any], list[int]]
+  broad: list[int]
+  def __init__(self, keys: 'Iterable[MonoType]' = ()) -> None:
+    self.keys = []
+    self.literals = {}
+    self.broad = []
+    for key in keys:
+      self.add(key)
+  def add(self, key: MonoType) -> None:
+    if (literal := literal_key(key)) is not None:
+      self.literals.setdefault(literal, []).append(len(self.keys))
     else:
-      filtered.append(broaden(type))
-  strs = [repr(f) for f in filtered]
-  if len(strs) > 1:
-    return False
-  if len(strs) == 1:
-    return f"{strs[0]}[]"
-  return f"[]"
+      self.broad.append(len(self.keys))
+    self.keys.append(key)
+  def matches(self, key: MonoType) -> list[int]:
+    from type_helpers import extends
+    if isinstance(key, UnionType):
+      return [i for i, k in enumerate(self.keys) if extends(key, k)]
+    found = [i for i in self.broad if extends(key, self.keys[i])]
+    if (literal := literal_key(key)) is not None and literal in self.literals:
+      found = sorted(found + self.literals[literal])
+    return found
+  # The index of keys that are the positions 1..n of an array, built in
+  # one pass; distinct number literals need none of the checks in `add`.
+  @staticmethod
+  def positions(keys: list[MonoType]) -> 'FieldIndex':
+    index = FieldIndex()
+    index.keys = keys
+    index.literals = {("number", cast(TypeConstructor, key).value): [i] for i, key in enumerate(keys)}
+    return index
+  def find(self, key: MonoType) -> int | None:
+    from type_helpers import extends
+    if isinstance(key, UnionType):
+      return next((i for i, k in enumerate(self.keys) if extends(key, k)), None)
+    literal = literal_key(key)
+    first = self.literals[literal][0] if literal is not None and literal in self.literals else None
+    for i in self.broad:
+      if first is not None and i > first:
+        break
+      if extends(key, self.keys[i]):
+        return i
+    return first
 
-def is_array(table: 'TableType') -> bool:
-  for k, v in table.fields:
-    if not isinstance(k, TypeConstructor) or k.name != "number":
-      return False
-  return True
+# The number literal types of the positions 1, 2, ... of an array, made once
+# and shared by every array literal.
+positions: list[MonoType] = []
 
-@dataclass
-class TableType:
-  fields: list[tuple[MonoType, MonoType]]
-  def __repr__(self) -> str:
-    if is_array(self):
-      if (r := array_repr(self)) is not False:
-        return r
-    s = "{"
-    for i, (k, v) in enumerate(self.fields):
-      if i > 0:
-        s += ", "
-      if isinstance(k, TypeConstructor) and k.name == "string" and k.value is not None:
-        s += f"{k.value}: {v}"
-      else:
-        s += f"[{k}]: {v}"
-    s += "}"
-    return s
+def position_keys(count: int) -> list[MonoType]:
+  while len(positions) < count:
+    positions.append(TypeConstructor("number", [], float(len(positions) + 1)))
+  return positions[:count]
+
+class TableType(Interned):
+  __slots__ = ("fields", "field_index")
+  fields: tuple[tuple[MonoType, MonoType], ...]
+  field_index: FieldIndex | None
+  def __new__(cls, fields: 'Iterable[tuple[MonoType, MonoType]]') -> 'TableType':
+    fields = tuple((k, v) for k, v in fields)
+    key = (cls, *(id(x) for f in fields for x in f))
+    hash_value = hash((cls.__name__, *(x.hash for f in fields for x in f)))
+    return intern_type(cls, key, hash_value, (x for f in fields for x in f), fields=fields, field_index=None)
+  def __reduce__(self) -> tuple[Any, ...]:
+    return TableType, (self.fields,)
+  # The table an array literal builds, keyed by its positions.
+  @staticmethod
+  def array(fields: 'Iterable[tuple[MonoType, MonoType]]') -> 'TableType':
+    table = TableType(fields)
+    if table.field_index is None:
+      object.__setattr__(table, "field_index", FieldIndex.positions([k for k, _ in table.fields]))
+    return table
+  @property
+  def index(self) -> FieldIndex:
+    if self.field_index is None:
+      object.__setattr__(self, "field_index", FieldIndex(k for k, _ in self.fields))
+    assert self.field_index is not None
+    return self.field_index
 
 typeof = type
 
-@dataclass
-class UnionType:
-  left: MonoType
-  right: MonoType
-  def collect(self) -> list[MonoType]:
-    left = [self.left]
-    if isinstance(self.left, UnionType):
-      left = self.left.collect()
-    right = [self.right]
-    if isinstance(self.right, UnionType):
-      right = self.right.collect()
-    return left + right
-  def __repr__(self) -> str:
-    if isinstance(self.left, TypeConstructor) and self.left.name == "nil":
-      right = f"{self.right}"
-      return f"({right})?" if " " in right and not right.startswith(("{", "\"")) else f"{right}?"
-    if isinstance(self.right, TypeConstructor) and self.right.name == "nil":
-      left = f"{self.left}"
-      return f"({left})?" if " " in left and not left.startswith(("{", "\"")) else f"{left}?"
-    
-    #return f"({self.left}) | ({self.right})"
-    from type_helpers import unify
-    types = self.collect()
-    filtered: list[MonoType] = []
-    for type in types:
-      for filt in filtered:
-        if isinstance(filt, TypeVariable) and isinstance(type, TypeVariable) and filt.name == type.name:
-          break
-        if isinstance(filt, TypeVariable):
-          continue
-        if isinstance(type, TypeVariable):
-          continue
-        if not isinstance((s := unify(type, filt)), str):
-          break
-      else:
-        filtered.append(type)
-    return " | ".join(f"({f})" if ((s := f"{f}") and " " in s and not s.startswith(("{", "\""))) else f"{f}" for f in filtered)
+# Canonical member order: broad primitives, then literals, then other types
+# by structure, then type variables.
+def union_order(type: MonoType) -> tuple[Any, ...]:
+  if kind := primitive_kind(type):
+    if type.value is None:
+      return (0, kind)
+    return (1, kind, type.value)
+  if isinstance(type, TypeVariable):
+    return (3, 0, type.name)
+  return (2, structure_key(type))
 
-@dataclass
-class ForallType:
-  var: str
-  body: PolyType
-  def __repr__(self) -> str:
-    return f"forall {self.var}. {self.body}"
+structure_keys: 'weakref.WeakKeyDictionary[Interned, tuple[Any, ...]]' = weakref.WeakKeyDictionary()
+
+# Orders types by kind and then by their parts. Unlike `hash`, which depends
+# on the string hash seed, it is the same in every run, so unions also
+# render the same. Keys are kept for as long as their type is alive.
+def structure_key(type: 'MonoType | ForallType') -> tuple[Any, ...]:
+  stack: list[tuple[Any, bool]] = [(type, False)]
+  while stack:
+    node, expanded = stack.pop()
+    if node in structure_keys:
+      continue
+    if isinstance(node, TypeConstructor):
+      head: tuple[Any, ...] = ("constructor", node.name, repr(node.value))
+      children: Iterable[Any] = node.args
+    elif isinstance(node, TableType):
+      head = ("table",)
+      children = [x for field in node.fields for x in field]
+    elif isinstance(node, UnionType):
+      head, children = ("union",), node.members
+    elif isinstance(node, ForallType):
+      head, children = ("forall", *node.vars), (node.body,)
+    else:
+      structure_keys[node] = ("variable", node.name)
+      continue
+    if expanded:
+      structure_keys[node] = (*head, *(structure_keys[c] for c in children))
+    else:
+      stack.append((node, True))
+      stack.extend((c, False) for c in children)
+  return structure_keys[type]
+
+# Unions and table literals holding more than `literal_limit` distinct
+# literals of one primitive kind widen them to that primitive, as `broaden`
+# would. None keeps every literal.
+literal_limit: int | None = None
+
+def wide_kinds(types: 'Iterable[MonoType]') -> set[str]:
+  if literal_limit is None:
+    return set()
+  seen: dict[str, set[Any]] = {}
+  for type in types:
+    if (literal := literal_key(type)) is not None:
+      seen.setdefault(literal[0], set()).add(literal[1])
+  return {name for name, values in seen.items() if len(values) > literal_limit}
+
+def widen(type: MonoType, kinds: set[str]) -> MonoType:
+  if kinds and literal_key(type) is not None and cast(TypeConstructor, type).name in kinds:
+    return TypeConstructor(cast(TypeConstructor, type).name, [], None)
+  return type
+
+def union_of(*types: MonoType) -> MonoType:
+  members: dict[MonoType, None] = {}
+  for type in types:
+    if isinstance(type, UnionType):
+      members.update(dict.fromkeys(type.members))
+    else:
+      members[type] = None
+  if literal_limit is not None and len(members) > literal_limit and (kinds := wide_kinds(members)):
+    members = dict.fromkeys(widen(type, kinds) for type in members)
+  if len(members) == 1:
+    return next(iter(members))
+  return UnionType(sorted(members, key=union_order))
+
+# A flattened union whose members are distinct and in canonical order; build
+# it with `union_of`. `kinds` holds the primitive kinds that appear as broad
+# members, and `literals` those that appear as literal ones.
+class UnionType(Interned):
+  __slots__ = ("members", "kinds", "literals")
+  members: tuple[MonoType, ...]
+  kinds: int
+  literals: int
+  def __new__(cls, members: 'Iterable[MonoType]') -> 'UnionType':
+    members = tuple(members)
+    kinds = literals = 0
+    for member in members:
+      if kind := primitive_kind(member):
+        if cast(TypeConstructor, member).value is None:
+          kinds |= kind
+        else:
+          literals |= kind
+    key = (cls, *map(id, members))
+    hash_value = hash((cls.__name__, *(m.hash for m in members)))
+    return intern_type(cls, key, hash_value, members, members=members, kinds=kinds, literals=literals)
+  def __reduce__(self) -> tuple[Any, ...]:
+    return UnionType, (self.members,)
+
+# A type scheme: `body` with every variable named in `vars` quantified.
+class ForallType(Interned):
+  __slots__ = ("vars", "body")
+  vars: tuple[str, ...]
+  body: MonoType
+  def __new__(cls, vars: 'Iterable[str]', body: MonoType) -> 'ForallType':
+    vars = tuple(vars)
+    return intern_type(cls, (cls, vars, id(body)), hash((cls.__name__, vars, body.hash)), (body,), vars=vars, body=body)
+
+def lower_levels(type: PolyType, level: int, bound: tuple[str, ...] = ()) -> None:
+  stack: list[PolyType] = [type]
+  while stack:
+    type = stack.pop()
+    if type.ground:
+      continue
+    if isinstance(type, TypeVariable):
+      if type.name not in bound and (type.level is None or type.level > level):
+        object.__setattr__(type, "level", level)
+    elif isinstance(type, TypeConstructor):
+      stack.extend(type.args)
+    elif isinstance(type, TableType):
+      for k, v in type.fields:
+        stack.append(k)
+        stack.append(v)
+    elif isinstance(type, UnionType):
+      stack.extend(type.members)
+    elif isinstance(type, ForallType):
+      lower_levels(type.body, level, bound + type.vars)
+
+MISSING: Any = object()
+
+# The bindings of a Context, chained to those of the scope it was opened in.
+# Opening a scope is O(1): it starts empty, and a name bound further out is
+# looked up through `parent` once and then kept in `found` (absent names
+# too). Inference only writes the current scope, or in `rebind` every scope
+# from the current one outwards, so nothing a live scope has found can go
+# stale. Storing a type lowers the level of its free variables to the
+# scope's, so a variable deeper than a context cannot appear in it and
+# `generalize` never has to scan the bindings. `facts` holds what the value
+# of a local declared in this scope establishes when it is true (as in
+# `local isnil = x == nil`), until the name is bound again.
+class Bindings:
+  __slots__ = ("own", "parent", "found", "level", "facts")
+  own: dict[str, PolyType]
+  parent: Optional['Bindings']
+  found: dict[str, PolyType]
+  level: int
+  facts: 'dict[str, tuple[Fact, ...]]'
+  def __init__(self, own: dict[str, PolyType], parent: Optional['Bindings'] = None) -> None:
+    self.own = own
+    self.parent = parent
+    self.found = {}
+    self.level = 0
+    self.facts = {}
+  def branch(self) -> 'Bindings':
+    return Bindings({}, self)
+  def lookup(self, name: str) -> PolyType:
+    if name in self.own:
+      return self.own[name]
+    if name in self.found:
+      return self.found[name]
+    value = MISSING
+    scope = self.parent
+    while scope is not None:
+      if name in scope.own:
+        value = scope.own[name]
+        break
+      if name in scope.found:
+        value = scope.found[name]
+        break
+      scope = scope.parent
+    self.found[name] = value
+    return value
+  def __getitem__(self, name: str) -> PolyType:
+    value = self.lookup(name)
+    if value is MISSING:
+      raise KeyError(name)
+    return value
+  def __contains__(self, name: str) -> bool:
+    return self.lookup(name) is not MISSING
+  def get(self, name: str, default: 'PolyType | None' = None) -> 'PolyType | None':
+    value = self.lookup(name)
+    return default if value is MISSING else value
+  def __setitem__(self, name: str, type: PolyType) -> None:
+    lower_levels(type, self.level)
+    self.own[name] = type
+    if self.facts:
+      self.facts.pop(name, None)
+  def facts_of(self, name: str) -> 'tuple[Fact, ...]':
+    scope: Optional[Bindings] = self
+    while scope is not None:
+      if name in scope.own:
+        return scope.facts.get(name, ())
+      scope = scope.parent
+    return ()
+
+# Names added in a scope, seen by it and every scope opened inside it.
+class ScopedSet:
+  __slots__ = ("own", "parent")
+  own: set[str]
+  parent: Optional['ScopedSet']
+  def __init__(self, parent: Optional['ScopedSet'] = None) -> None:
+    self.own = set()
+    self.parent = parent
+  def add(self, name: str) -> None:
+    self.own.add(name)
+  def __contains__(self, name: str) -> bool:
+    scope: Optional[ScopedSet] = self
+    while scope is not None:
+      if name in scope.own:
+        return True
+      scope = scope.parent
+    return False
+
+# Something a condition establishes when it holds: the expression may be
+# narrowed to the type.
+Fact: TypeAlias = tuple[Expr, MonoType]
 
+# A scope. `parent` is the scope it was opened in and `locals` the names
+# declared in it, so a binding can be updated in every scope that shares it.
+# `recursive_fns` holds the names being declared, which may only be used
+# recursively. While a condition or the values of a `local` are inferred,
+# `facts` maps their comparisons (by node id) to the facts they establish. `level` is the depth of the
+# scope.
 @dataclass
 class Context:
-  mapping: dict[str, PolyType]
-  recursive_fns: list[str]
-  def __init__(self, mapping: dict[str, PolyType]) -> None:
+  mapping: Bindings
+  level: int
+  recursive_fns: ScopedSet
+  parent: Optional['Context']
+  locals: set[str]
+  facts: Optional[dict[int, tuple[Fact, ...]]]
+  # Where the checked code comes from, for rendering the offsets in it.
+  source: Optional[SourceMap]
+  def __init__(self, mapping: 'dict[str, PolyType] | Bindings', parent: Optional['Context'] = None, source: Optional[SourceMap] = None) -> None:
+    self.level = parent.level + 1 if parent is not None else 0
+    if not isinstance(mapping, Bindings):
+      mapping = Bindings(dict(mapping))
+      for type in mapping.own.values():
+        lower_levels(type, self.level)
+    mapping.level = self.level
     self.mapping = mapping
-    self.recursive_fns = []
+    self.recursive_fns = ScopedSet(parent.recursive_fns if parent is not None else None)
+    self.parent = parent
+    self.locals = set()
+    self.facts = None
+    self.source = parent.source if parent is not None else source
+  def child(self) -> 'Context':
+    return Context(self.mapping.branch(), self)
@@ -0,0 +1,227 @@
+import weakref
+from typing import Any, Iterator, Optional, TextIO, cast
+from type_models import *
+from type_helpers import Mismatch, unify, broaden
+
+letters = "abcdefghijklmnopqrstuvwyxz"
+ELIDED = "..."
+
+def is_string_key(type: MonoType) -> bool:
+  return isinstance(type, TypeConstructor) and type.name == "string" and type.value is not None
+
+def is_array(table: TableType) -> bool:
+  return all(isinstance(k, TypeConstructor) and k.name == "number" for k, _ in table.fields)
+
+# The element type an array-like table renders with (`T[]`), None for an
+# empty one, or False if its values do not share one type.
+def array_element(table: TableType) -> 'MonoType | None | bool':
+  if not table.fields:
+    return None
+  first = table.fields[0][1]
+  element = broaden(first)
+  for _, value in table.fields[1:]:
+    if value is not first and value is not element and isinstance(unify(value, element), Mismatch):
+      return False
+  return element
+
+def needs_parens(text: str) -> bool:
+  return " " in text and not text.startswith(("{", "\""))
+
+# Renders types for one checking run. Type variables are named in the order
+# they are first rendered, every rendered subtree is memoised, and output is
+# bounded by the limits: compound types deeper than `max_depth`, members
+# past `max_width` and text past `max_length` are elided as "...".
+class Renderer:
+  names: dict[str, str]
+  memo: 'weakref.WeakKeyDictionary[Any, dict[int | None, str]]'
+  def __init__(self, max_depth: int | None = None, max_width: int | None = None, max_length: int | None = None) -> None:
+    self.max_depth = max_depth
+    self.max_width = max_width
+    self.max_length = max_length
+    self.names = {}
+    self.memo = weakref.WeakKeyDictionary()
+
+  def limit(self, items: 'tuple[Any, ...] | list[Any]') -> tuple[list[Any], bool]:
+    if self.max_width is None or len(items) <= self.max_width:
+      return list(items), False
+    return list(items[:self.max_width]), True
+
+  def truncate(self, text: str) -> str:
+    if self.max_length is None or len(text) <= self.max_length:
+      return text
+    return text[:self.max_length] + ELIDED
+
+  def variable(self, name: str) -> str:
+    if name not in self.names:
+      if len(self.names) >= len(letters):
+        return "'" + name
+      self.names[name] = letters[len(self.names)]
+    return "'" + self.names[name]
+
+  def union_members(self, union: UnionType) -> list[MonoType]:
+    shown: list[MonoType] = []
+    composite: list[MonoType] = []
+    for type in union.members:
+      kind = primitive_kind(type)
+      if kind == KIND_BITS["nil"]:
+        continue
+      if kind:
+        if cast(TypeConstructor, type).value is None or not kind & union.kinds:
+          shown.append(type)
+        continue
+      if not isinstance(type, TypeVariable):
+        if any(not isinstance(unify(type, c), Mismatch) for c in composite):
+          continue
+        composite.append(type)
+      shown.append(type)
+    return shown
+
+  # The subtrees `type` is rendered from, plus whatever `format` needs to
+  # lay them out again.
+  def layout(self, type: PolyType) -> tuple[list[PolyType], Any]:
+    if isinstance(type, TypeConstructor):
+      if type.name == "function":
+        params, params_elided = self.limit(cast(TypeConstructor, type.args[0]).args)
+        vararg = [type.args[2]] if type.value else []
+        ret = type.args[1]
+        rets, rets_elided = self.limit(ret.args) if isinstance(ret, TypeConstructor) and ret.name == "tuple" else ([ret], False)
+        shape = (len(params), params_elided, len(vararg), rets_elided, len(cast(TypeConstructor, type.args[0]).args))
+        return params + vararg + rets, shape
+      args, elided = self.limit(type.args)
+      return args, elided
+    if isinstance(type, TableType):
+      if is_array(type) and (element := array_element(type)) is not False:
+        return ([] if element is None else [cast(MonoType, element)]), "array"
+      fields, elided = self.limit(type.fields)
+      children: list[PolyType] = []
+      for k, v in fields:
+        if not is_string_key(k):
+          children.append(k)
+        children.append(v)
+      return children, (fields, elided)
+    if isinstance(type, UnionType):
+      members, elided = self.limit(self.union_members(type))
+      return members, elided
+    if isinstance(type, ForallType):
+      return [type.body], None
+    return [], None
+
+  # Types without children are cheaper to format than to look up.
+  def leaf(self, type: PolyType) -> str | None:
+    if isinstance(type, TypeVariable):
+      return self.variable(type.name)
+    if not isinstance(type, TypeConstructor) or type.args or type.name == "tuple":
+      return None
+    if type.value is None:
+      return type.name
+    if type.name == "string":
+      return "\"" + str(type.value) + "\""
+    if type.name == "number":
+      return str(int(type.value)) if type.value % 1 == 0 else str(type.value)
+    if type.name == "boolean":
+      return type.value and "true" or "false"
+    return type.name
+
+  def format(self, type: PolyType, shape: Any, args: list[str]) -> Iterator[str]:
+    if (text := self.leaf(type)) is not None:
+      yield text
+    elif isinstance(type, TypeConstructor):
+      if type.name == "function":
+        count, params_elided, varargs, rets_elided, arity = shape
+        params = args[:count] + ([ELIDED] if params_elided else []) + ["..." + a for a in args[count:count + varargs]]
+        rets = args[count + varargs:] + ([ELIDED] if rets_elided else [])
+        yield f"({', '.join(params)})" if arity != 1 else ", ".join(params)
+        yield " -> "
+        yield ", ".join(rets)
+      elif type.name == "tuple":
+        if len(type.args) == 1:
+          yield args[0]
+        else:
+          yield "(" + ", ".join(args + ([ELIDED] if shape else [])) + ")"
+      elif type.args:
+        yield f"{type.name}<" + ", ".join(args + ([ELIDED] if shape else [])) + ">"
+    elif isinstance(type, TableType):
+      if shape == "array":
+        yield f"{args[0]}[]" if args else "[]"
+        return
+      fields, elided = shape
+      yield "{"
+      rest = iter(args)
+      for i, (k, _) in enumerate(fields):
+        if i > 0:
+          yield ", "
+        key = f"{k.value}" if is_string_key(k) else f"[{next(rest)}]"
+        yield f"{key}: {next(rest)}"
+      if elided:
+        yield ", " + ELIDED if fields else ELIDED
+      yield "}"
+    elif isinstance(type, UnionType):
+      text = " | ".join([f"({a})" if needs_parens(a) else a for a in args] + ([ELIDED] if shape else []))
+      if not type.kinds & KIND_BITS["nil"]:
+        yield text
+      elif len(args) > 1 or shape or needs_parens(text):
+        yield f"({text})?"
+      else:
+        yield f"{text}?"
+    elif isinstance(type, ForallType):
+      yield f"forall {' '.join(type.vars)}. {args[0]}"
+
+  # A one-element tuple renders as its element, so it does not count
+  # towards `max_depth`.
+  def nesting(self, type: PolyType) -> int:
+    return 0 if isinstance(type, TypeConstructor) and type.name == "tuple" and len(type.args) == 1 else 1
+
+  def render(self, type: PolyType, depth: int = 0) -> str:
+    stack: list[tuple[PolyType, int, Optional[tuple[int, Any]]]] = [(type, depth, None)]
+    results: list[str] = []
+    while stack:
+      node, level, expanded = stack.pop()
+      remaining = None if self.max_depth is None else self.max_depth - level
+      if expanded is not None:
+        count, shape = expanded
+        args = results[len(results) - count:]
+        del results[len(results) - count:]
+        text = self.truncate("".join(self.format(node, shape, args)))
+        self.memo.setdefault(node, {})[remaining] = text
+        results.append(text)
+        continue
+      if (text := self.leaf(node)) is not None:
+        results.append(text)
+        continue
+      cached = self.memo.get(node)
+      if cached is not None and remaining in cached:
+        results.append(cached[remaining])
+        continue
+      if remaining is not None and remaining < 0:
+        results.append(ELIDED)
+        continue
+      children, shape = self.layout(node)
+      stack.append((node, level, (len(children), shape)))
+      below = level + self.nesting(node)
+      stack.extend((child, below, None) for child in reversed(children))
+    return results[0]
+
+  # Streams `type` to `out` without joining its outermost level; the fields
+  # of a table are rendered one at a time as they are written, and nothing
+  # past `max_length` is produced.
+  def write(self, type: PolyType, out: TextIO) -> None:
+    if self.max_depth is not None and self.max_depth < 0:
+      out.write(ELIDED)
+      return
+    children, shape = self.layout(type)
+    args: Any = (self.render(child, self.nesting(type)) for child in children)
+    if not isinstance(type, TableType) or shape == "array":
+      args = list(args)
+    written = 0
+    for piece in self.format(type, shape, args):
+      if self.max_length is not None and written + len(piece) > self.max_length:
+        out.write(piece[:self.max_length - written] + ELIDED)
+        return
+      out.write(piece)
+      written += len(piece)
+
+renderer = Renderer()
+
+def reset_renderer(max_depth: int | None = None, max_width: int | None = None, max_length: int | None = None) -> None:
+  global renderer
+  renderer = Renderer(max_depth, max_width, max_length)